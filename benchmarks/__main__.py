@@ -0,0 +1,55 @@
+# Runs the benchmarks and compares their results with the baseline. Results are
+# only stored as the new baseline with --save, so a baseline is recorded once,
+# for instance on the main branch, and later runs report how they differ.
+# Timings only compare on the machine that recorded them, so no baseline is
+# committed and each machine records its own.
+
+import argparse
+import os
+import sys
+
+from benchmarks import endtoend, extraction, matching
+from benchmarks.harness import compare, formatReport, loadBaseline, saveBaseline
+
+defaultBaseline = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+def parseArguments(arguments):
+  parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmarks of the mock web server")
+  parser.add_argument("names", nargs="*", help="only run benchmarks whose name contains one of these")
+  parser.add_argument("--baseline", default=defaultBaseline, help="file holding the baseline results")
+  parser.add_argument("--save", action="store_true", help="store the results as the new baseline")
+  parser.add_argument("--threshold", type=float, default=0.1, help="relative change reported as a regression or an improvement")
+  parser.add_argument("--fail-on-regression", action="store_true", help="exit with 1 when a benchmark regressed")
+  parser.add_argument("--skip-end-to-end", action="store_true", help="only run the micro-benchmarks")
+  parser.add_argument("--connections", type=int, default=16, help="concurrent connections of the end-to-end benchmark")
+  parser.add_argument("--seconds", type=float, default=3.0, help="duration of the end-to-end benchmark of each path")
+  return parser.parse_args(arguments)
+
+def main(arguments) -> int:
+  options = parseArguments(arguments)
+  benchmarks = matching.getBenchmarks() + extraction.getBenchmarks()
+  if not options.skip_end_to_end:
+    benchmarks += endtoend.getBenchmarks(options.connections, options.seconds)
+  if len(options.names) > 0:
+    benchmarks = [benchmark for benchmark in benchmarks if any(name in benchmark.name for name in options.names)]
+  results = {}
+  failures = {}
+  for benchmark in benchmarks:
+    print("Running {}".format(benchmark.name), file=sys.stderr, flush=True)
+    # A failing benchmark is reported rather than stopping the others
+    try:
+      results.update(benchmark.run())
+    except Exception as error:
+      failures[benchmark.name] = "{}: {}".format(type(error).__name__, error)
+  if not os.path.exists(options.baseline) and not options.save:
+    print("No baseline at {}, so every result is new. Record one with --save first.".format(options.baseline), file=sys.stderr)
+  comparisons = compare(results, loadBaseline(options.baseline), options.threshold)
+  print(formatReport(comparisons, failures), end="")
+  if options.save:
+    saveBaseline(options.baseline, results)
+    print("Saved {} results to {}".format(len(results), options.baseline))
+  if options.fail_on_regression and any(comparison.status == "regressed" for comparison in comparisons):
+    return 1
+  return 0
+
+sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,113 @@
+# Benchmarks of the whole server over loopback. The server runs in a process of
+# its own and is driven by threads keeping a connection alive each, which
+# report the throughput and the latency percentiles of each path.
+
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List
+
+from benchmarks.harness import Benchmark, Measurement
+
+paths = (("static", "/static"), ("default", "/users/42"))
+
+def findFreePort() -> int:
+  with socket.socket() as sock:
+    sock.bind(("127.0.0.1", 0))
+    return sock.getsockname()[1]
+
+def startServer(port : int, timeout : float = 10.0) -> subprocess.Popen:
+  root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  process = subprocess.Popen([sys.executable, "-m", "benchmarks.server", str(port)], cwd=root)
+  deadline = time.monotonic() + timeout
+  while time.monotonic() < deadline:
+    if process.poll() != None:
+      raise RuntimeError("The server exited with {}".format(process.returncode))
+    try:
+      socket.create_connection(("127.0.0.1", port), 0.1).close()
+      return process
+    except OSError:
+      time.sleep(0.05)
+  process.kill()
+  raise RuntimeError("The server did not start listening within {} seconds".format(timeout))
+
+def stopServer(process : subprocess.Popen):
+  process.terminate()
+  try:
+    process.wait(5)
+  except subprocess.TimeoutExpired:
+    process.kill()
+    process.wait()
+
+def percentile(values : List[float], fraction : float) -> float:
+  index = min(int(len(values) * fraction), len(values) - 1)
+  return values[index]
+
+def drive(port : int, path : str, connections : int, seconds : float, warmup : float) -> Dict[str, Measurement]:
+  start = threading.Barrier(connections + 1)
+  measureFrom = [0.0]
+  stopAt = [0.0]
+  latencies = [[] for _ in range(connections)]
+  errors = [0] * connections
+
+  def client(index : int):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    start.wait()
+    clientLatencies = latencies[index]
+    while True:
+      started = time.perf_counter()
+      if started >= stopAt[0]:
+        break
+      try:
+        connection.request("GET", path)
+        response = connection.getresponse()
+        response.read()
+        if response.status != 200:
+          errors[index] += 1
+      except (OSError, http.client.HTTPException):
+        errors[index] += 1
+        connection.close()
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        continue
+      if started >= measureFrom[0]:
+        clientLatencies.append(time.perf_counter() - started)
+    connection.close()
+
+  threads = [threading.Thread(target=client, args=(index,)) for index in range(connections)]
+  for thread in threads:
+    thread.start()
+  now = time.perf_counter()
+  measureFrom[0] = now + warmup
+  stopAt[0] = now + warmup + seconds
+  start.wait()
+  for thread in threads:
+    thread.join()
+  if sum(errors) > 0:
+    raise RuntimeError("{} requests to {} failed".format(sum(errors), path))
+  merged = sorted(latency for clientLatencies in latencies for latency in clientLatencies)
+  if len(merged) == 0:
+    raise RuntimeError("No request to {} completed".format(path))
+  return {
+    "throughput": Measurement(len(merged) / seconds, "req/s", higherIsBetter=True),
+    "p50": Measurement(percentile(merged, 0.5), "s"),
+    "p99": Measurement(percentile(merged, 0.99), "s")
+  }
+
+def benchmarkEndToEnd(connections : int, seconds : float, warmup : float) -> Dict[str, Measurement]:
+  port = findFreePort()
+  process = startServer(port)
+  try:
+    results = {}
+    for name, path in paths:
+      for key, measurement in drive(port, path, connections, seconds, warmup).items():
+        results["{}.{}".format(name, key)] = measurement
+    return results
+  finally:
+    stopServer(process)
+
+def getBenchmarks(connections : int = 16, seconds : float = 3.0, warmup : float = 0.5) -> List[Benchmark]:
+  return [Benchmark("endToEnd.c{}".format(connections), lambda: benchmarkEndToEnd(connections, seconds, warmup))]
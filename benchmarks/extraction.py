@@ -0,0 +1,50 @@
+# Benchmarks of the path and query extractors with patterns of various shapes,
+# each against a request it matches and one it does not
+
+from typing import Dict, List
+
+from mockwebserver.extraction.extractor import Extractor, PathExtractor, QueryExtractor
+
+from benchmarks.harness import Benchmark, Measurement, requestFactory, timeOperation
+
+pathShapes = (
+  ("literal", "/api/users/", b"/api/users", b"/api/groups"),
+  ("field", "/api/users/{id}", b"/api/users/42", b"/api/groups/42"),
+  ("typed", "/api/users/{id:d}", b"/api/users/42", b"/api/users/abc"),
+  ("fields", "/api/{a}/b/{b}/c/{c}/d/{d}", b"/api/1/b/2/c/3/d/4", b"/api/1/b/2/c/3/e/4"),
+  ("long", "/api/" + "/".join("segment{}".format(index) for index in range(20)) + "/{id}", \
+    b"/api/" + b"/".join(b"segment%d" % index for index in range(20)) + b"/42", b"/api/segment0/42")
+)
+
+queryShapes = (
+  ("literal", (True, ("page", "1")), b"?page=1", b"?page=2"),
+  ("field", (True, ("page", "{page}")), b"?page=1", b"?size=1"),
+  ("fields", (True, ("page", "{page:d}"), ("size", "{size:d}"), ("sort", "{sort}")), \
+    b"?page=1&size=20&sort=name", b"?page=1&size=20"),
+  ("keyPattern", (True, ("filter[{name}]", "{value}")), b"?filter[name]=abc", b"?page=1"),
+  ("exact", (False, ("page", "{page}"), ("size", "{size}")), b"?page=1&size=20", b"?page=1&size=20&sort=name"),
+  ("manyParameters", (True, ("page", "{page}")), \
+    b"?" + b"&".join(b"extra%d=%d" % (index, index) for index in range(30)) + b"&page=1", \
+    b"?" + b"&".join(b"extra%d=%d" % (index, index) for index in range(30)))
+)
+
+def benchmarkExtractor(extractor : Extractor, matching : bytes, missing : bytes) -> Dict[str, Measurement]:
+  results = {}
+  for case, uri in (("match", matching), ("miss", missing)):
+    results[case] = timeOperation(extractor.extractData, requestFactory(b"GET", uri))
+  return results
+
+def getBenchmarks() -> List[Benchmark]:
+  benchmarks = []
+  for name, pattern, matching, missing in pathShapes:
+    benchmarks.append(Benchmark(
+      "PathExtractor.{}".format(name),
+      lambda pattern=pattern, matching=matching, missing=missing: benchmarkExtractor(PathExtractor(pattern), matching, missing)
+    ))
+  for name, arguments, matching, missing in queryShapes:
+    benchmarks.append(Benchmark(
+      "QueryExtractor.{}".format(name),
+      lambda arguments=arguments, matching=matching, missing=missing: \
+        benchmarkExtractor(QueryExtractor(*arguments), b"/search" + matching, b"/search" + missing)
+    ))
+  return benchmarks
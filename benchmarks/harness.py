@@ -0,0 +1,159 @@
+# Contains the timing and the baseline handling shared by the benchmarks. Each
+# benchmark returns named measurements, which are compared with the ones stored
+# in a baseline file to report how much each of them changed.
+
+import copy
+import gc
+import json
+import os
+import platform
+import statistics
+import time
+from typing import Callable, Dict, List, Optional, Any, Iterable
+from urllib.parse import parse_qs
+
+from twisted.web.server import Request as Tw_Request
+from twisted.web.test.requesthelper import DummyChannel as Tw_DummyChannel
+
+class Measurement:
+  def __init__(self, value : float, unit : str, higherIsBetter : bool = False):
+    self.value = value
+    self.unit = unit
+    self.higherIsBetter = higherIsBetter
+
+  def toDict(self) -> Dict[str, Any]:
+    return {"value": self.value, "unit": self.unit, "higherIsBetter": self.higherIsBetter}
+
+  @classmethod
+  def fromDict(cls, values : Dict[str, Any]) -> "Measurement":
+    return cls(values["value"], values["unit"], values.get("higherIsBetter", False))
+
+class Benchmark:
+  def __init__(self, name : str, function : Callable[[], Dict[str, Measurement]]):
+    if name == None or function == None:
+      raise ValueError()
+    self.name = name
+    self.function = function
+
+  def run(self) -> Dict[str, Measurement]:
+    return {"{}.{}".format(self.name, key): measurement for key, measurement in self.function().items()}
+
+def createRequest(method : bytes, uri : bytes, headers : Optional[Dict[bytes, bytes]] = None) -> Tw_Request:
+  # A request as the server hands it over once the request line was received
+  request = Tw_Request(Tw_DummyChannel())
+  path, _, query = uri.partition(b"?")
+  request.method = method
+  request.uri = uri
+  request.path = path
+  request.args = parse_qs(query, keep_blank_values=True)
+  for name, value in (headers or {}).items():
+    request.requestHeaders.setRawHeaders(name, [value])
+  return request
+
+def requestFactory(method : bytes, uri : bytes, headers : Optional[Dict[bytes, bytes]] = None) -> Callable[[], Tw_Request]:
+  # Copies of a request are much cheaper to create than requests, and start
+  # without the cache of what was derived from the request
+  template = createRequest(method, uri, headers)
+  return lambda: copy.copy(template)
+
+def timeOperation(operation : Callable[[Any], Any], \
+                  createInput : Callable[[], Any], \
+                  minSeconds : float = 0.2, \
+                  repeat : int = 5) -> Measurement:
+  # Inputs are created before timing starts, since requests cache what is
+  # derived from them and every operation needs a fresh one. The number of
+  # operations is doubled until a run takes at least minSeconds, then the
+  # median time per operation of the runs is reported.
+  number = 1
+  while True:
+    elapsed = _timeRun(operation, [createInput() for _ in range(number)])
+    if elapsed >= minSeconds or number >= 1 << 20:
+      break
+    # Aims a little past minSeconds, growing by 2 to 16 times per run
+    factor = 16 if elapsed <= 0 else min(max(int(minSeconds / elapsed * 1.2), 2), 16)
+    number *= factor
+  runs = [elapsed] + [_timeRun(operation, [createInput() for _ in range(number)]) for _ in range(repeat - 1)]
+  return Measurement(statistics.median(runs) / number, "s/op")
+
+def _timeRun(operation : Callable[[Any], Any], inputs : List[Any]) -> float:
+  # The collector is paused like timeit does, as the inputs held alive would
+  # otherwise make collections, which have nothing to do with the operation,
+  # a large part of the time measured
+  enabled = gc.isenabled()
+  gc.disable()
+  try:
+    started = time.perf_counter()
+    for value in inputs:
+      operation(value)
+    return time.perf_counter() - started
+  finally:
+    if enabled:
+      gc.enable()
+
+def loadBaseline(path : str) -> Dict[str, Measurement]:
+  if not os.path.exists(path):
+    return {}
+  with open(path) as file:
+    document = json.load(file)
+  return {name: Measurement.fromDict(values) for name, values in document["results"].items()}
+
+def saveBaseline(path : str, results : Dict[str, Measurement], merge : bool = True):
+  # Results of benchmarks that were not run this time are kept by default
+  measurements = loadBaseline(path) if merge else {}
+  measurements.update(results)
+  document = {
+    "python": platform.python_version(),
+    "machine": platform.machine(),
+    "savedAt": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    "results": {name: measurements[name].toDict() for name in sorted(measurements)}
+  }
+  with open(path, "w") as file:
+    json.dump(document, file, indent=2)
+    file.write("\n")
+
+class Comparison:
+  def __init__(self, name : str, current : Measurement, baseline : Optional[Measurement], threshold : float):
+    self.name = name
+    self.current = current
+    self.baseline = baseline
+    # The relative change, positive when the measurement got better
+    self.change = None
+    if baseline != None and baseline.value != 0:
+      change = (current.value - baseline.value) / baseline.value
+      self.change = change if current.higherIsBetter else -change
+    if self.change == None:
+      self.status = "new"
+    elif self.change <= -threshold:
+      self.status = "regressed"
+    elif self.change >= threshold:
+      self.status = "improved"
+    else:
+      self.status = "unchanged"
+
+def compare(results : Dict[str, Measurement], \
+            baseline : Dict[str, Measurement], \
+            threshold : float = 0.1) -> List[Comparison]:
+  return [Comparison(name, results[name], baseline.get(name), threshold) for name in results]
+
+def formatValue(measurement : Measurement) -> str:
+  if measurement.unit == "s/op" or measurement.unit == "s":
+    value = measurement.value
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+      if value >= scale:
+        return "{:.3f} {}".format(value / scale, unit)
+    return "{:.1f} ns".format(value / 1e-9)
+  return "{:.1f} {}".format(measurement.value, measurement.unit)
+
+def formatReport(comparisons : Iterable[Comparison], failures : Dict[str, str]) -> str:
+  lines = []
+  width = max([len(comparison.name) for comparison in comparisons] + [len(name) for name in failures] + [9])
+  lines.append("{:<{}}  {:>14}  {:>14}  {:>8}  {}".format("benchmark", width, "current", "baseline", "change", "status"))
+  for comparison in comparisons:
+    baseline = formatValue(comparison.baseline) if comparison.baseline != None else "-"
+    change = "{:+.1%}".format(comparison.change) if comparison.change != None else "-"
+    lines.append("{:<{}}  {:>14}  {:>14}  {:>8}  {}".format(
+      comparison.name, width, formatValue(comparison.current), baseline, change, comparison.status
+    ))
+  for name, error in failures.items():
+    lines.append("{:<{}}  failed: {}".format(name, width, error))
+  return "\n".join(lines) + "\n"
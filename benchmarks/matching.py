@@ -0,0 +1,62 @@
+# Benchmarks of finding the stub for a request. Routed stubs start with a
+# literal path segment, so the routing index narrows them down to a handful of
+# candidates, while unrouted stubs start with a field and are all evaluated.
+# With best-match resolution, the most specific stub is found first wherever it
+# was added.
+
+from typing import Dict, List
+
+from mockwebserver.core.stub import StubManager
+from mockwebserver.extraction.extractor import PathExtractor
+from mockwebserver.matching.matcher import MethodMatcher, PathMatcher
+from mockwebserver.stub import DefaultStub, Response
+
+from benchmarks.harness import Benchmark, Measurement, requestFactory, timeOperation
+
+sizes = (("10", 10), ("1k", 1000), ("100k", 100000))
+
+def _render(request, data):
+  return Response(b"")
+
+def createStubs(count : int, routed : bool) -> List[DefaultStub]:
+  stubs = []
+  for index in range(count):
+    pattern = "/api/resource{}/{{id}}".format(index) if routed else "/{{tenant}}/resource{}/{{id}}".format(index)
+    stubs.append(DefaultStub("stub{}".format(index), _render, MethodMatcher("GET"), PathMatcher(pattern), PathExtractor(pattern)))
+  return stubs
+
+def benchmarkFindStubForRequest(size : int, routed : bool) -> Dict[str, Measurement]:
+  stubManager = StubManager()
+  stubManager.addStubs(createStubs(size, routed))
+  prefix = b"/api" if routed else b"/tenant"
+  last = prefix + b"/resource%d/42" % (size - 1)
+  results = {}
+  for case, uri in (("first", prefix + b"/resource0/42"), ("last", last), ("miss", b"/missing/resource/42")):
+    # Unrouted lookups evaluate every stub, so they get fewer repeats
+    results[case] = timeOperation(
+      stubManager.findStubForRequest, requestFactory(b"GET", uri),
+      minSeconds=0.2 if routed or size < 100000 else 1.0, repeat=5 if routed or size < 1000 else 3
+    )
+  return results
+
+def benchmarkFindBestStubForRequest(size : int) -> Dict[str, Measurement]:
+  # The stub added last is preferred, which first-match resolution only finds
+  # after evaluating every other stub
+  stubManager = StubManager(bestMatch=True)
+  stubs = createStubs(size, False)
+  stubs[-1].priority = 1
+  stubManager.addStubs(stubs)
+  return {"prioritized": timeOperation(
+    stubManager.findStubForRequest, requestFactory(b"GET", b"/tenant/resource%d/42" % (size - 1))
+  )}
+
+def getBenchmarks() -> List[Benchmark]:
+  benchmarks = []
+  for name, size in sizes:
+    for routed in (True, False):
+      benchmarks.append(Benchmark(
+        "findStubForRequest.{}.{}".format("routed" if routed else "unrouted", name),
+        lambda size=size, routed=routed: benchmarkFindStubForRequest(size, routed)
+      ))
+    benchmarks.append(Benchmark("findStubForRequest.bestMatch.{}".format(name), lambda size=size: benchmarkFindBestStubForRequest(size)))
+  return benchmarks
@@ -0,0 +1,26 @@
+# Runs the server benchmarked end to end, in a process of its own so that the
+# client driving it does not compete with it for the interpreter lock
+
+import sys
+
+from mockwebserver.extraction.extractor import PathExtractor
+from mockwebserver.matching.matcher import MethodMatcher, PathMatcher
+from mockwebserver.server import MockWebServer
+from mockwebserver.stub import DefaultStub, StaticStub, Response
+
+userExtractor = PathExtractor("/users/{id}")
+
+def renderUser(request, data):
+  userId = data[userExtractor.getId()].named["id"]
+  return Response(b"{\"id\": \"%s\"}" % userId.encode("utf-8"), headers={b"content-type": b"application/json"})
+
+def createServer(port : int) -> MockWebServer:
+  server = MockWebServer(port)
+  server.getStubManager().addStubs([
+    StaticStub("static", MethodMatcher("GET"), PathMatcher("/static"), body=b"{\"static\": true}"),
+    DefaultStub("user", renderUser, MethodMatcher("GET"), PathMatcher("/users/{id}"), userExtractor)
+  ])
+  return server
+
+if __name__ == "__main__":
+  createServer(int(sys.argv[1])).run()
@@ -0,0 +1,224 @@
+# Contains the router placed in front of the request delegator, which answers
+# the paths reserved by the server itself, such as the metrics, and hands every
+# other request over to the stubs, and the admin API, which manages the stubs
+# and the journal of a running server over HTTP
+
+import json
+from http.client import OK, BAD_REQUEST, NOT_FOUND, METHOD_NOT_ALLOWED, INTERNAL_SERVER_ERROR
+from typing import Optional, List, Dict, Any, Tuple
+
+from twisted.logger import Logger as Tw_Logger
+from twisted.web.resource import Resource as Tw_Resource
+from twisted.web.server import Request as Tw_Request, NOT_DONE_YET as Tw_NOT_DONE_YET
+
+from mockwebserver.core.execution import ExecutionPolicy, Executor
+from mockwebserver.core.journal import RequestJournal
+from mockwebserver.core.stub import StubManager, JsonStubLoader
+
+class ReservedPathRouter (Tw_Resource):
+  isLeaf = True
+
+  def __init__(self, fallback : Tw_Resource):
+    super().__init__()
+    if fallback == None:
+      raise ValueError()
+    self.fallback = fallback
+    self._routes = {}
+    self._prefixRoutes = []
+
+  def addRoute(self, path : str, resource : Tw_Resource):
+    if path == None or resource == None:
+      raise ValueError()
+    if not path.startswith("/"):
+      raise ValueError("Reserved paths must start with /")
+    self._routes[path.encode("utf-8")] = resource
+
+  def addPrefixRoute(self, prefix : str, resource : Tw_Resource):
+    # Reserves the prefix and every path below it, after the exact routes
+    if prefix == None or resource == None:
+      raise ValueError()
+    if not prefix.startswith("/") or prefix.endswith("/"):
+      raise ValueError("Reserved prefixes must start with / and not end with it")
+    self._prefixRoutes.append((prefix.encode("utf-8"), prefix.encode("utf-8") + b"/", resource))
+
+  def getRoutes(self) -> Dict[str, Tw_Resource]:
+    return {path.decode("utf-8"): resource for path, resource in self._routes.items()}
+
+  def getPrefixRoutes(self) -> Dict[str, Tw_Resource]:
+    return {prefix.decode("utf-8"): resource for prefix, _, resource in self._prefixRoutes}
+
+  def render(self, request : Tw_Request):
+    # A single dictionary lookup, so stubs pay next to nothing for the routes
+    resource = self._routes.get(request.path) if len(self._routes) > 0 else None
+    if resource == None and len(self._prefixRoutes) > 0:
+      for prefix, directory, prefixResource in self._prefixRoutes:
+        if request.path == prefix or request.path.startswith(directory):
+          resource = prefixResource
+          break
+    if resource == None:
+      return self.fallback.render(request)
+    return resource.render(request)
+
+class AdminResource (Tw_Resource):
+  # Answers the paths below its prefix:
+  #   GET /stubs lists the stubs, POST /stubs applies a batch of changes and
+  #   DELETE /stubs removes every stub
+  #   POST /reset removes every stub and clears the journal
+  #   GET /journal finds entries, GET /journal/count counts them, and
+  #   DELETE /journal clears it
+  # A batch is {"add": [...], "replace": [...], "remove": ["id", ...]}, with
+  # stubs in the format of the JSON stub loader. Every definition is compiled
+  # before anything is changed, then the whole batch is applied as a single
+  # snapshot, on the executor's thread pool as batches may hold many stubs.
+  isLeaf = True
+  _log = Tw_Logger()
+
+  def __init__(self, \
+               prefix : str, \
+               stubManager : StubManager, \
+               journal : Optional[RequestJournal] = None, \
+               executor : Optional[Executor] = None):
+    super().__init__()
+    if prefix == None or stubManager == None:
+      raise ValueError()
+    self.prefix = prefix
+    self.stubManager = stubManager
+    self.journal = journal
+    self._executor = executor if executor != None else Executor()
+    self._prefixBytes = prefix.encode("utf-8")
+    self._handlers = {
+      b"/stubs": {b"GET": self._getStubs, b"POST": self._postStubs, b"DELETE": self._deleteStubs},
+      b"/reset": {b"POST": self._postReset},
+      b"/journal": {b"GET": self._getJournal, b"DELETE": self._deleteJournal},
+      b"/journal/count": {b"GET": self._getJournalCount}
+    }
+
+  def render(self, request : Tw_Request):
+    path = request.path[len(self._prefixBytes):].rstrip(b"/")
+    handlers = self._handlers.get(path)
+    if handlers == None:
+      return self._respond(request, NOT_FOUND, {"error": "Unknown admin path {}".format(path.decode("utf-8", "replace"))})
+    handler = handlers.get(request.method)
+    if handler == None:
+      request.setHeader(b"allow", b", ".join(handlers))
+      return self._respond(request, METHOD_NOT_ALLOWED, {"error": "Expected one of {}".format(b", ".join(handlers).decode("ascii"))})
+    try:
+      return handler(request)
+    except ValueError as error:
+      return self._respond(request, BAD_REQUEST, {"error": str(error)})
+
+  @staticmethod
+  def _respond(request : Tw_Request, code : int, value : Any) -> bytes:
+    body = json.dumps(value, separators=(",", ":")).encode("utf-8")
+    request.setResponseCode(code)
+    request.setHeader(b"content-type", b"application/json")
+    request.setHeader(b"content-length", b"%d" % len(body))
+    return body
+
+  @staticmethod
+  def _readDocument(request : Tw_Request) -> Any:
+    content = request.content
+    if content == None:
+      raise ValueError("Expected a JSON body")
+    content.seek(0)
+    try:
+      return json.loads(content.read())
+    except ValueError as error:
+      raise ValueError("Invalid JSON body: {}".format(error)) from error
+
+  @staticmethod
+  def _getArgument(request : Tw_Request, name : bytes) -> Optional[str]:
+    values = request.args.get(name)
+    return values[-1].decode("utf-8") if values else None
+
+  def _getStubs(self, request : Tw_Request) -> bytes:
+    stubs = [{"id": stub.id, "priority": getattr(stub, "priority", 0)} for stub in self.stubManager.getStubs()]
+    return self._respond(request, OK, {"stubs": stubs})
+
+  def _postStubs(self, request : Tw_Request):
+    document = self._readDocument(request)
+    if not isinstance(document, dict) or len(set(document) - {"add", "replace", "remove"}) > 0:
+      raise ValueError("Expected an object with add, replace and remove lists")
+    for key in ("add", "replace", "remove"):
+      if not isinstance(document.get(key, []), list):
+        raise ValueError("Expected {} to be a list".format(key))
+    deferred = self._executor.execute(
+      ExecutionPolicy.THREAD_POOL, self.applyBatch, document.get("add", []), document.get("replace", []), document.get("remove", [])
+    )
+    deferred.addCallbacks(lambda result: self._finish(request, OK, result), lambda failure: self._fail(request, failure))
+    return Tw_NOT_DONE_YET
+
+  def applyBatch(self, \
+                 add : List[Dict[str, Any]], \
+                 replace : List[Dict[str, Any]], \
+                 remove : List[str]) -> Dict[str, Any]:
+    loader = JsonStubLoader([])
+    addStubs = loader.compile(add, "add")
+    replaceStubs = loader.compile(replace, "replace")
+    if not all(isinstance(stubId, str) for stubId in remove):
+      raise ValueError("Expected remove to list stub IDs")
+    added, replaced, removed = self.stubManager.updateStubs(addStubs, replaceStubs, remove)
+    return {
+      "added": [{"success": success, "error": error} for success, error in added],
+      "replaced": [{"success": success, "error": error} for success, error in replaced],
+      "removed": [stub.id if stub != None else None for stub in removed]
+    }
+
+  def _finish(self, request : Tw_Request, code : int, value : Any):
+    if request.finished or getattr(request, "_disconnected", False):
+      return
+    request.write(self._respond(request, code, value))
+    request.finish()
+
+  def _fail(self, request : Tw_Request, failure):
+    if failure.check(ValueError):
+      self._finish(request, BAD_REQUEST, {"error": str(failure.value)})
+      return
+    self._log.failure("Failed to apply a batch of stub changes", failure)
+    self._finish(request, INTERNAL_SERVER_ERROR, {"error": "Failed to apply the batch"})
+
+  def _deleteStubs(self, request : Tw_Request) -> bytes:
+    return self._respond(request, OK, {"removed": len(self.stubManager.removeAllStubs())})
+
+  def _postReset(self, request : Tw_Request) -> bytes:
+    removed = len(self.stubManager.removeAllStubs())
+    if self.journal != None:
+      self.journal.clear()
+    return self._respond(request, OK, {"removed": removed})
+
+  def _findArguments(self, request : Tw_Request) -> Tuple[bool, Optional[str], Optional[str]]:
+    unmatched = self._getArgument(request, b"unmatched") in ("1", "true")
+    stubId = self._getArgument(request, b"stubId")
+    path = self._getArgument(request, b"path")
+    if unmatched and (stubId != None or path != None):
+      raise ValueError("Unmatched requests cannot be filtered by stubId or path")
+    return unmatched, stubId, path
+
+  def _getJournal(self, request : Tw_Request) -> bytes:
+    if self.journal == None:
+      return self._respond(request, NOT_FOUND, {"error": "The journal is disabled"})
+    unmatched, stubId, path = self._findArguments(request)
+    method = self._getArgument(request, b"method")
+    limit = self._getArgument(request, b"limit")
+    limit = int(limit) if limit != None else None
+    if limit != None and limit < 1:
+      raise ValueError("Expected limit >= 1")
+    if unmatched:
+      entries = [entry for entry in self.journal.findUnmatched() if method == None or entry.method == method.upper()]
+      entries = entries[:limit] if limit != None else entries
+    else:
+      entries = self.journal.find(stubId, path, method.upper() if method != None else None, limit)
+    return self._respond(request, OK, {"entries": [entry.toDict() for entry in entries]})
+
+  def _getJournalCount(self, request : Tw_Request) -> bytes:
+    if self.journal == None:
+      return self._respond(request, NOT_FOUND, {"error": "The journal is disabled"})
+    unmatched, stubId, path = self._findArguments(request)
+    count = self.journal.countUnmatched() if unmatched else self.journal.count(stubId, path)
+    return self._respond(request, OK, {"count": count})
+
+  def _deleteJournal(self, request : Tw_Request) -> bytes:
+    if self.journal == None:
+      return self._respond(request, NOT_FOUND, {"error": "The journal is disabled"})
+    self.journal.clear()
+    return self._respond(request, OK, {})
@@ -0,0 +1,66 @@
+# Contains the admission controller which bounds the number of requests being
+# processed and waiting to be processed. It is only used from the reactor
+# thread, so it needs no locking.
+
+from collections import deque
+from enum import Enum
+from typing import Optional, Callable, Dict
+
+class Admission (Enum):
+  ADMITTED = "ADMITTED"
+  QUEUED = "QUEUED"
+  REJECTED = "REJECTED"
+
+class AdmissionController:
+  def __init__(self, maxInFlight : Optional[int] = None, maxQueued : int = 0):
+    if maxInFlight != None and maxInFlight < 1:
+      raise ValueError()
+    if maxQueued < 0:
+      raise ValueError()
+    self.maxInFlight = maxInFlight
+    self.maxQueued = maxQueued
+    self.inFlight = 0
+    self.admitted = 0
+    self.rejected = 0
+    self._queue = deque()
+    self._draining = False
+
+  def getQueueDepth(self) -> int:
+    return len(self._queue)
+
+  def getGauges(self) -> Dict[str, int]:
+    return {"in_flight": self.inFlight, "queue_depth": len(self._queue)}
+
+  def getCounters(self) -> Dict[str, int]:
+    return {"admitted": self.admitted, "rejected": self.rejected}
+
+  def admit(self, start : Callable[[], bool]) -> Admission:
+    # start is called once the request may be processed, and returns False when
+    # the request no longer needs processing
+    if self.maxInFlight == None or self.inFlight < self.maxInFlight:
+      self.inFlight += 1
+      self.admitted += 1
+      return Admission.ADMITTED
+    if len(self._queue) < self.maxQueued:
+      self._queue.append(start)
+      return Admission.QUEUED
+    self.rejected += 1
+    return Admission.REJECTED
+
+  def release(self):
+    if self.inFlight > 0:
+      self.inFlight -= 1
+    # Requests started from the queue may finish straight away and release
+    # again, so only the outermost call drains the queue
+    if self._draining:
+      return
+    self._draining = True
+    try:
+      while len(self._queue) > 0 and (self.maxInFlight == None or self.inFlight < self.maxInFlight):
+        start = self._queue.popleft()
+        self.inFlight += 1
+        self.admitted += 1
+        if not start():
+          self.inFlight -= 1
+    finally:
+      self._draining = False
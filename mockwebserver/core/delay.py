@@ -0,0 +1,64 @@
+# Contains the response delays of stubs. A delay is sampled once per response
+# and waited for on the reactor with callLater, so no thread is held meanwhile.
+
+import random
+from typing import Any, Optional, Union, Dict
+
+class Delay:
+  def sample(self) -> float:
+    raise NotImplementedError()
+
+  @staticmethod
+  def fromDefinition(definition : Union[int, float, Dict[str, Any]]) -> "Delay":
+    # Numbers are fixed delays, objects name the kind of delay as their key
+    if isinstance(definition, (int, float)):
+      return FixedDelay(definition)
+    if "fixed" in definition:
+      return FixedDelay(definition["fixed"])
+    if "uniform" in definition:
+      low, high = definition["uniform"]
+      return UniformDelay(low, high)
+    if "distribution" in definition:
+      return DistributionDelay(
+        definition["distribution"], *definition.get("parameters", ()), maximum=definition.get("maximum")
+      )
+    raise ValueError("Unknown delay {!r}".format(definition))
+
+class FixedDelay (Delay):
+  def __init__(self, seconds : float):
+    if seconds < 0:
+      raise ValueError()
+    self.seconds = seconds
+
+  def sample(self) -> float:
+    return self.seconds
+
+class UniformDelay (Delay):
+  def __init__(self, low : float, high : float, seed : Optional[int] = None):
+    if low < 0 or high < low:
+      raise ValueError()
+    self.low = low
+    self.high = high
+    self._random = random.Random(seed)
+
+  def sample(self) -> float:
+    return self._random.uniform(self.low, self.high)
+
+class DistributionDelay (Delay):
+  # Samples one of the distributions of random.Random by name, for example
+  # lognormvariate, gammavariate or expovariate, clamped to [0, maximum]
+  def __init__(self, distribution : str, *parameters : float, maximum : Optional[float] = None, seed : Optional[int] = None):
+    if not distribution.endswith("variate") or not hasattr(random.Random, distribution):
+      raise ValueError("Unknown distribution {}".format(distribution))
+    if maximum != None and maximum < 0:
+      raise ValueError()
+    self.distribution = distribution
+    self.parameters = parameters
+    self.maximum = maximum
+    self._random = random.Random(seed)
+    # Fails early on parameters the distribution does not take
+    self.sample()
+
+  def sample(self) -> float:
+    seconds = max(getattr(self._random, self.distribution)(*self.parameters), 0.0)
+    return min(seconds, self.maximum) if self.maximum != None else seconds
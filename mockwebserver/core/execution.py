@@ -0,0 +1,93 @@
+# Contains the execution policies deciding where request work runs, and the
+# executor that dispatches work to the reactor thread, a thread pool or a
+# process pool
+
+from concurrent.futures import ProcessPoolExecutor, Future, CancelledError
+from enum import Enum
+from multiprocessing import get_context
+from typing import Optional, Callable, Any
+
+from twisted.internet.defer import Deferred as Tw_Deferred, maybeDeferred as Tw_maybeDeferred
+from twisted.internet.threads import deferToThread as Tw_deferToThread, deferToThreadPool as Tw_deferToThreadPool
+from twisted.python.failure import Failure as Tw_Failure
+from twisted.python.threadpool import ThreadPool as Tw_ThreadPool
+from twisted.web.server import Request as Tw_Request
+
+class ExecutionPolicy (Enum):
+  INLINE = "INLINE"
+  THREAD_POOL = "THREAD_POOL"
+  PROCESS_POOL = "PROCESS_POOL"
+
+class RequestSnapshot:
+  # A picklable copy of the parts of a request a render callable may read,
+  # handed to render callables running in another process
+  def __init__(self, request : Tw_Request):
+    self.method = request.method
+    self.uri = request.uri
+    self.path = request.path
+    self.args = dict(request.args)
+    self.headers = {}
+    for name, values in request.requestHeaders.getAllRawHeaders():
+      self.headers[name.lower()] = list(values)
+    self.content = b""
+    if request.content != None:
+      position = request.content.tell()
+      request.content.seek(0)
+      self.content = request.content.read()
+      request.content.seek(position)
+
+  def getHeader(self, name : bytes) -> Optional[bytes]:
+    values = self.headers.get(name.lower())
+    return values[-1] if values else None
+
+class Executor:
+  def __init__(self, threadPool : Optional[Tw_ThreadPool] = None, processes : Optional[int] = None):
+    self._threadPool = threadPool
+    self._processes = processes
+    self._processPool = None
+    self._futures = set()
+
+  def execute(self, policy : ExecutionPolicy, function : Callable, *args : Any) -> Tw_Deferred:
+    if policy == ExecutionPolicy.INLINE:
+      return Tw_maybeDeferred(function, *args)
+    elif policy == ExecutionPolicy.THREAD_POOL:
+      if self._threadPool == None:
+        return Tw_deferToThread(function, *args)
+      from twisted.internet import reactor as Tw_reactor
+      return Tw_deferToThreadPool(Tw_reactor, self._threadPool, function, *args)
+    elif policy == ExecutionPolicy.PROCESS_POOL:
+      return self._deferToProcessPool(function, *args)
+    raise ValueError()
+
+  def _deferToProcessPool(self, function : Callable, *args : Any) -> Tw_Deferred:
+    from twisted.internet import reactor as Tw_reactor
+    if self._processPool == None:
+      # Spawned workers do not inherit the reactor or the running threads
+      self._processPool = ProcessPoolExecutor(self._processes, mp_context=get_context("spawn"))
+    deferred = Tw_Deferred()
+    future = self._processPool.submit(function, *args)
+    self._futures.add(future)
+    future.add_done_callback(self._futures.discard)
+    future.add_done_callback(lambda future: Tw_reactor.callFromThread(self._fireDeferred, deferred, future))
+    return deferred
+
+  @staticmethod
+  def _fireDeferred(deferred : Tw_Deferred, future : Future):
+    # Work still pending is cancelled when the pool shuts down
+    if future.cancelled():
+      deferred.errback(Tw_Failure(CancelledError()))
+      return
+    exception = future.exception()
+    if exception != None:
+      deferred.errback(exception)
+    else:
+      deferred.callback(future.result())
+
+  def shutdown(self):
+    if self._processPool != None:
+      # Cancelled here, as the pool only cancels pending work itself while it
+      # is still referenced
+      for future in list(self._futures):
+        future.cancel()
+      self._processPool.shutdown(wait=False, cancel_futures=True)
+      self._processPool = None
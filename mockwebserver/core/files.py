@@ -0,0 +1,64 @@
+# Contains the memory-mapped fixture files served by file stubs, and the
+# parsing of byte ranges requested with the Range header
+
+import mmap
+import os
+from typing import Optional, Iterator, Tuple
+
+class UnsatisfiableRange (ValueError):
+  pass
+
+def parseByteRange(header : Optional[bytes], size : int) -> Optional[Tuple[int, int]]:
+  # Returns the start and the exclusive end of the single range requested, or
+  # None for the whole file. Malformed headers and multiple ranges are ignored,
+  # as the whole file is a valid answer to them.
+  if not isinstance(header, bytes):
+    return None
+  unit, _, spec = header.strip().partition(b"=")
+  if unit.strip().lower() != b"bytes" or b"," in spec:
+    return None
+  first, separator, last = spec.strip().partition(b"-")
+  if separator != b"-" or not (first.isdigit() or first == b"") or not (last.isdigit() or last == b""):
+    return None
+  if first == b"":
+    if last == b"":
+      return None
+    # A suffix range asks for the last bytes of the file
+    suffix = int(last)
+    if suffix == 0:
+      raise UnsatisfiableRange()
+    return max(size - suffix, 0), size
+  start = int(first)
+  end = size if last == b"" else min(int(last) + 1, size)
+  if end <= start:
+    if last != b"" and int(last) < start:
+      return None
+    raise UnsatisfiableRange()
+  return start, end
+
+class MappedFile:
+  # The file is mapped once and read through a memoryview, so every request
+  # shares the same pages instead of reading its own copy of the file
+  def __init__(self, path : str):
+    if path == None:
+      raise ValueError()
+    self.path = path
+    with open(path, "rb") as file:
+      self.size = os.fstat(file.fileno()).st_size
+      # Empty files cannot be mapped
+      self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if self.size > 0 else None
+    self.view = memoryview(self._map) if self._map != None else memoryview(b"")
+
+  def read(self, start : int, end : int) -> bytes:
+    return self.view[start:end].tobytes()
+
+  def chunks(self, start : int, end : int, chunkSize : int) -> Iterator[bytes]:
+    # Transports only take bytes, so each chunk is copied out of the mapping
+    # just before it is written, and never more than one at a time
+    for offset in range(start, end, chunkSize):
+      yield self.view[offset:min(offset + chunkSize, end)].tobytes()
+
+  def close(self):
+    self.view.release()
+    if self._map != None:
+      self._map.close()
@@ -0,0 +1,216 @@
+# Contains the journal of the requests received by the server. Only a compact
+# record of each request is kept, in a ring buffer of fixed capacity, so old
+# entries are overwritten instead of the journal growing without bounds.
+
+import base64
+import hashlib
+import time
+from collections import deque
+from threading import Lock
+from typing import Optional, List, Tuple, Iterable, Dict, Deque, Any
+
+from twisted.web.server import Request as Tw_Request
+
+from mockwebserver.extraction.cache import asText
+
+class JournalEntry:
+  __slots__ = ("sequence", "method", "path", "query", "headers", "bodyDigest", "bodyPrefix", "bodySize", "stubId", "timestamp")
+
+  def __init__(self, \
+               sequence : int, \
+               method : Optional[str], \
+               path : Optional[str], \
+               query : Optional[str], \
+               headers : Tuple[Tuple[str, str], ...], \
+               bodyDigest : Optional[str], \
+               bodyPrefix : bytes, \
+               bodySize : int, \
+               stubId : Optional[str], \
+               timestamp : float):
+    self.sequence = sequence
+    self.method = method
+    self.path = path
+    self.query = query
+    self.headers = headers
+    self.bodyDigest = bodyDigest
+    self.bodyPrefix = bodyPrefix
+    self.bodySize = bodySize
+    self.stubId = stubId
+    self.timestamp = timestamp
+
+  def toDict(self) -> Dict[str, Any]:
+    return {
+      "sequence": self.sequence,
+      "timestamp": self.timestamp,
+      "method": self.method,
+      "path": self.path,
+      "query": self.query,
+      "headers": dict(self.headers),
+      "bodyDigest": self.bodyDigest,
+      "bodyPrefix": base64.b64encode(self.bodyPrefix).decode("ascii"),
+      "bodySize": self.bodySize,
+      "stubId": self.stubId
+    }
+
+  def getHeader(self, name : str) -> Optional[str]:
+    name = name.lower()
+    for headerName, value in self.headers:
+      if headerName == name:
+        return value
+    return None
+
+class RequestJournal:
+  _readSize = 1 << 16
+
+  def __init__(self, \
+               capacity : int = 10000, \
+               headers : Iterable[str] = ("content-type", "accept", "user-agent"), \
+               bodyPrefixBytes : int = 256, \
+               digestBody : bool = True, \
+               digestFullBody : bool = False, \
+               sink : Optional[Any] = None):
+    if capacity < 1 or bodyPrefixBytes < 0:
+      raise ValueError()
+    self.capacity = capacity
+    # Every entry recorded is also submitted to the sink, which persists it
+    self.sink = sink
+    self.headers = tuple(name.lower() for name in headers)
+    self._headerNames = tuple(name.encode("latin-1") for name in self.headers)
+    self.bodyPrefixBytes = bodyPrefixBytes
+    # Requests are recorded on the reactor thread, so by default the digest
+    # only covers the stored prefix rather than reading whole uploads there
+    self.digestBody = digestBody
+    self.digestFullBody = digestFullBody
+    self._entries = [None] * capacity
+    self._nextSequence = 0
+    # Sequences are added in increasing order, so the entry being overwritten
+    # is always the oldest one of its indexes
+    self._byStub = {}
+    self._byPath = {}
+    self._lock = Lock()
+
+  def __len__(self) -> int:
+    return min(self._nextSequence, self.capacity)
+
+  def record(self, request : Tw_Request, stubId : Optional[str]) -> JournalEntry:
+    if request == None:
+      raise ValueError()
+    uri = request.uri if isinstance(request.uri, bytes) else b""
+    _, _, query = uri.partition(b"?")
+    headers = []
+    for name, headerName in zip(self.headers, self._headerNames):
+      value = request.getHeader(headerName)
+      if isinstance(value, (bytes, str)):
+        headers.append((name, asText(value)))
+    bodyDigest, bodyPrefix, bodySize = self._readBody(request.content)
+    with self._lock:
+      entry = JournalEntry(
+        self._nextSequence, asText(request.method), asText(request.path), asText(query) if query else None,
+        tuple(headers), bodyDigest, bodyPrefix, bodySize, stubId, time.time()
+      )
+      self._add(entry)
+    # Outside of the lock, since sinks may block until they have room
+    if self.sink != None:
+      self.sink.submit(entry)
+    return entry
+
+  def _readBody(self, content) -> Tuple[Optional[str], bytes, int]:
+    if content == None or not hasattr(content, "read"):
+      return None, b"", 0
+    position = content.tell()
+    content.seek(0)
+    try:
+      prefix = content.read(self.bodyPrefixBytes)
+      if not self.digestFullBody:
+        digest = hashlib.sha256(prefix).hexdigest() if self.digestBody else None
+        return digest, prefix, content.seek(0, 2)
+      digest = hashlib.sha256(prefix)
+      size = len(prefix)
+      for block in iter(lambda: content.read(self._readSize), b""):
+        digest.update(block)
+        size += len(block)
+      return digest.hexdigest(), prefix, size
+    finally:
+      content.seek(position)
+
+  def _add(self, entry : JournalEntry):
+    slot = entry.sequence % self.capacity
+    evicted = self._entries[slot]
+    if evicted != None:
+      self._unindex(self._byStub, evicted.stubId)
+      self._unindex(self._byPath, evicted.path)
+    self._entries[slot] = entry
+    self._byStub.setdefault(entry.stubId, deque()).append(entry.sequence)
+    self._byPath.setdefault(entry.path, deque()).append(entry.sequence)
+    self._nextSequence += 1
+
+  @staticmethod
+  def _unindex(index : Dict[Optional[str], Deque[int]], key : Optional[str]):
+    sequences = index[key]
+    sequences.popleft()
+    if len(sequences) == 0:
+      del index[key]
+
+  def count(self, stubId : Optional[str] = None, path : Optional[str] = None) -> int:
+    # Counting by stub or by path alone is a lookup in its index
+    with self._lock:
+      if path == None:
+        return len(self) if stubId == None else len(self._byStub.get(stubId, ()))
+      if stubId == None:
+        return len(self._byPath.get(path, ()))
+    return len(self.find(stubId, path))
+
+  def countUnmatched(self) -> int:
+    with self._lock:
+      return len(self._byStub.get(None, ()))
+
+  def find(self, \
+           stubId : Optional[str] = None, \
+           path : Optional[str] = None, \
+           method : Optional[str] = None, \
+           limit : Optional[int] = None) -> List[JournalEntry]:
+    # Entries are returned oldest first. Only the smaller of the indexes that
+    # apply is scanned, and the whole journal when none does.
+    with self._lock:
+      sequences = None
+      if stubId != None:
+        sequences = self._byStub.get(stubId, ())
+      if path != None:
+        pathSequences = self._byPath.get(path, ())
+        if sequences == None or len(pathSequences) < len(sequences):
+          sequences = pathSequences
+      if sequences == None:
+        sequences = range(max(self._nextSequence - self.capacity, 0), self._nextSequence)
+      return self._collect(sequences, stubId, path, method, limit)
+
+  def findUnmatched(self, limit : Optional[int] = None) -> List[JournalEntry]:
+    with self._lock:
+      return self._collect(self._byStub.get(None, ()), None, None, None, limit)
+
+  def _collect(self, \
+               sequences : Iterable[int], \
+               stubId : Optional[str], \
+               path : Optional[str], \
+               method : Optional[str], \
+               limit : Optional[int]) -> List[JournalEntry]:
+    entries = []
+    for sequence in sequences:
+      entry = self._entries[sequence % self.capacity]
+      if (stubId != None and entry.stubId != stubId) or (path != None and entry.path != path):
+        continue
+      if method != None and entry.method != method:
+        continue
+      entries.append(entry)
+      if limit != None and len(entries) >= limit:
+        break
+    return entries
+
+  def getEntries(self) -> List[JournalEntry]:
+    return self.find()
+
+  def clear(self):
+    with self._lock:
+      self._entries = [None] * self.capacity
+      self._nextSequence = 0
+      self._byStub = {}
+      self._byPath = {}
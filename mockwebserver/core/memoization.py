@@ -0,0 +1,76 @@
+# Contains the cache of rendered responses used by deterministic stubs, whose
+# render output only depends on the data extracted from the request
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional, Dict, Any, Hashable
+
+class RenderCache:
+  # Rough per-entry bookkeeping cost, so many tiny responses still count
+  entryOverhead = 64
+
+  def __init__(self, maxBytes : int = 1 << 20):
+    if maxBytes < 1:
+      raise ValueError()
+    self.maxBytes = maxBytes
+    self.size = 0
+    self.hits = 0
+    self.misses = 0
+    self._entries = OrderedDict()
+    self._lock = Lock()
+
+  @staticmethod
+  def keyFor(data : Optional[Dict[str, Any]]) -> Optional[Hashable]:
+    if data == None:
+      return ()
+    key = []
+    for extractorId, extract in data.items():
+      if extract == None:
+        key.append((extractorId, None))
+      else:
+        key.append((extractorId, tuple(extract.fixed), tuple(sorted(extract.named.items()))))
+    key = tuple(key)
+    try:
+      hash(key)
+    except TypeError:
+      return None
+    return key
+
+  @classmethod
+  def sizeOf(cls, response : Any) -> int:
+    size = cls.entryOverhead + len(response.body)
+    for name, value in response.headers.items():
+      size += len(name) + (sum(len(item) for item in value) if isinstance(value, list) else len(value))
+    return size
+
+  def get(self, key : Hashable) -> Optional[Any]:
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry == None:
+        self.misses += 1
+        return None
+      self._entries.move_to_end(key)
+      self.hits += 1
+      return entry[0]
+
+  def put(self, key : Hashable, response : Any):
+    size = self.sizeOf(response)
+    if size > self.maxBytes:
+      return
+    with self._lock:
+      previous = self._entries.pop(key, None)
+      if previous != None:
+        self.size -= previous[1]
+      self._entries[key] = (response, size)
+      self.size += size
+      while self.size > self.maxBytes:
+        _, (_, evictedSize) = self._entries.popitem(last=False)
+        self.size -= evictedSize
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self.size = 0
+
+  def getStats(self) -> Dict[str, int]:
+    return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "bytes": self.size}
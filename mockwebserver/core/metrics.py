@@ -0,0 +1,184 @@
+# Contains the metrics of the server and their rendering in the Prometheus text
+# format. Every thread updates shards of its own, so recording takes no lock,
+# and the shards are only summed up when the metrics are collected.
+
+import threading
+from bisect import bisect_left
+from http.client import OK
+from typing import Optional, Callable, Dict, Iterable, List, Tuple, Any
+
+from twisted.web.resource import Resource as Tw_Resource
+from twisted.web.server import Request as Tw_Request
+
+class _PerThread:
+  def __init__(self, factory : Callable[[], Any]):
+    self._factory = factory
+    self._local = threading.local()
+    self._shards = []
+    self._lock = threading.Lock()
+
+  def get(self) -> Any:
+    shard = getattr(self._local, "shard", None)
+    if shard is None:
+      shard = self._local.shard = self._factory()
+      # Only taken once per thread. Shards outlive their threads, so nothing
+      # counted is lost when a thread ends.
+      with self._lock:
+        self._shards.append(shard)
+    return shard
+
+  def getShards(self) -> List[Any]:
+    with self._lock:
+      return list(self._shards)
+
+class KeyedCounter:
+  def __init__(self):
+    self._shards = _PerThread(dict)
+
+  def increment(self, key : Any, amount : int = 1):
+    shard = self._shards.get()
+    shard[key] = shard.get(key, 0) + amount
+
+  def collect(self) -> Dict[Any, int]:
+    totals = {}
+    for shard in self._shards.getShards():
+      # Copied first, as the owning thread may add keys meanwhile
+      for key, value in list(shard.items()):
+        totals[key] = totals.get(key, 0) + value
+    return totals
+
+class Histogram:
+  def __init__(self, bounds : Iterable[float]):
+    self.bounds = tuple(sorted(bounds))
+    if len(self.bounds) == 0:
+      raise ValueError()
+    # One count per bucket, one for values above every bound, then the sum
+    size = len(self.bounds) + 2
+    self._shards = _PerThread(lambda: [0] * (size - 1) + [0.0])
+
+  def observe(self, value : float):
+    shard = self._shards.get()
+    shard[bisect_left(self.bounds, value)] += 1
+    shard[-1] += value
+
+  def collect(self) -> Tuple[List[int], float, int]:
+    # Returns the cumulative count of each bucket, the sum and the count
+    counts = [0] * (len(self.bounds) + 1)
+    total = 0.0
+    for shard in self._shards.getShards():
+      for index in range(len(counts)):
+        counts[index] += shard[index]
+      total += shard[-1]
+    cumulative = []
+    running = 0
+    for count in counts:
+      running += count
+      cumulative.append(running)
+    return cumulative, total, running
+
+def escapeLabel(value : str) -> str:
+  return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def formatNumber(value : float) -> str:
+  if value == float("inf"):
+    return "+Inf"
+  return repr(float(value)) if isinstance(value, float) else str(value)
+
+class ServerMetrics:
+  phases = ("lookup", "extraction", "render", "total")
+  defaultBounds = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+  def __init__(self, bounds : Iterable[float] = defaultBounds, prefix : str = "mockwebserver"):
+    self.prefix = prefix
+    self.requests = KeyedCounter()
+    self.histograms = {phase: Histogram(bounds) for phase in self.phases}
+    self._gaugeSources = []
+    self._counterSources = []
+    self._renderCacheSource = None
+
+  def countRequest(self, stubId : Optional[str]):
+    # Unmatched requests are counted under None
+    self.requests.increment(stubId)
+
+  def observe(self, phase : str, seconds : float):
+    self.histograms[phase].observe(seconds)
+
+  def addGauges(self, name : str, source : Callable[[], Dict[str, float]]):
+    # The source is called on every collection, and each of its values is
+    # exposed as the gauge <prefix>_<name>_<key>
+    self._gaugeSources.append((name, source))
+
+  def addCounters(self, name : str, source : Callable[[], Dict[str, int]]):
+    # Like gauges, but for values which only ever increase, each exposed as the
+    # counter <prefix>_<name>_<key>_total
+    self._counterSources.append((name, source))
+
+  def setRenderCacheSource(self, source : Callable[[], Dict[str, Dict[str, int]]]):
+    # The source is called on every collection and returns the render cache
+    # stats of each stub keeping one, by stub ID
+    self._renderCacheSource = source
+
+  def render(self) -> bytes:
+    lines = []
+    requests = self.requests.collect()
+    name = "{}_requests_total".format(self.prefix)
+    lines.append("# HELP {} Requests answered by each stub.".format(name))
+    lines.append("# TYPE {} counter".format(name))
+    for stubId in sorted(key for key in requests if key != None):
+      lines.append("{}{{stub=\"{}\"}} {}".format(name, escapeLabel(str(stubId)), requests[stubId]))
+    name = "{}_unmatched_requests_total".format(self.prefix)
+    lines.append("# HELP {} Requests no stub matched.".format(name))
+    lines.append("# TYPE {} counter".format(name))
+    lines.append("{} {}".format(name, requests.get(None, 0)))
+    name = "{}_phase_seconds".format(self.prefix)
+    lines.append("# HELP {} Time spent in each phase of processing a request.".format(name))
+    lines.append("# TYPE {} histogram".format(name))
+    for phase in self.phases:
+      histogram = self.histograms[phase]
+      counts, total, count = histogram.collect()
+      for bound, cumulative in zip(histogram.bounds + (float("inf"),), counts):
+        lines.append("{}_bucket{{phase=\"{}\",le=\"{}\"}} {}".format(name, phase, formatNumber(bound), cumulative))
+      lines.append("{}_sum{{phase=\"{}\"}} {}".format(name, phase, formatNumber(total)))
+      lines.append("{}_count{{phase=\"{}\"}} {}".format(name, phase, count))
+    if self._renderCacheSource != None:
+      lines.extend(self._renderCacheLines(self._renderCacheSource()))
+    for sourceName, source in self._counterSources:
+      for key, value in sorted(source().items()):
+        name = "{}_{}_{}_total".format(self.prefix, sourceName, key)
+        lines.append("# TYPE {} counter".format(name))
+        lines.append("{} {}".format(name, formatNumber(value)))
+    for sourceName, source in self._gaugeSources:
+      for key, value in sorted(source().items()):
+        name = "{}_{}_{}".format(self.prefix, sourceName, key)
+        lines.append("# TYPE {} gauge".format(name))
+        lines.append("{} {}".format(name, formatNumber(value)))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+  def _renderCacheLines(self, stats : Dict[str, Dict[str, int]]) -> List[str]:
+    lines = []
+    for key, kind, description in (
+      ("hits", "counter", "Renders answered from the render cache of each stub."),
+      ("misses", "counter", "Renders the render cache of each stub could not answer."),
+      ("entries", "gauge", "Responses held by the render cache of each stub."),
+      ("bytes", "gauge", "Approximate size of the render cache of each stub.")
+    ):
+      name = "{}_render_cache_{}{}".format(self.prefix, key, "_total" if kind == "counter" else "")
+      lines.append("# HELP {} {}".format(name, description))
+      lines.append("# TYPE {} {}".format(name, kind))
+      for stubId in sorted(stats):
+        lines.append("{}{{stub=\"{}\"}} {}".format(name, escapeLabel(str(stubId)), stats[stubId][key]))
+    return lines
+
+class MetricsResource (Tw_Resource):
+  isLeaf = True
+
+  def __init__(self, metrics : ServerMetrics):
+    super().__init__()
+    if metrics == None:
+      raise ValueError()
+    self.metrics = metrics
+
+  def render_GET(self, request : Tw_Request) -> bytes:
+    request.setResponseCode(OK)
+    request.setHeader(b"content-type", b"text/plain; version=0.0.4; charset=utf-8")
+    return self.metrics.render()
@@ -0,0 +1,162 @@
+# Contains the sink appending journal entries to a JSONL file. Entries are
+# handed over to a writer thread through a bounded queue, so the request path
+# only pays for the hand-over, while serializing, writing, rotating and
+# compressing all happen on the writer thread.
+
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+from enum import Enum
+from typing import Optional, Dict, List
+
+from twisted.logger import Logger as Tw_Logger
+
+from mockwebserver.core.journal import JournalEntry
+
+class Overflow (Enum):
+  # What happens to entries submitted while the queue of the writer is full
+  DROP = "DROP"
+  BLOCK = "BLOCK"
+
+class JsonlJournalSink:
+  _log = Tw_Logger()
+  _stop = object()
+
+  def __init__(self, \
+               path : str, \
+               maxBytes : int = 64 << 20, \
+               backups : int = 5, \
+               compress : bool = False, \
+               maxPending : int = 10000, \
+               overflow : Overflow = Overflow.DROP, \
+               batchSize : int = 512):
+    if path == None:
+      raise ValueError()
+    if maxBytes < 1 or backups < 0 or maxPending < 1 or batchSize < 1:
+      raise ValueError()
+    self.path = path
+    self.maxBytes = maxBytes
+    self.backups = backups
+    self.compress = compress
+    self.overflow = overflow
+    self.batchSize = batchSize
+    self.written = 0
+    self.dropped = 0
+    self.failed = 0
+    self.batches = 0
+    self.rotations = 0
+    self._queue = queue.Queue(maxPending)
+    self._thread = None
+    self._file = None
+
+  def start(self, path : Optional[str] = None):
+    # Worker processes start their own sink, each with a path of its own
+    if self._thread != None:
+      raise RuntimeError("The journal sink has already been started")
+    if path != None:
+      self.path = path
+    self._file = open(self.path, "ab")
+    self._thread = threading.Thread(target=self._run, name="JsonlJournalSink", daemon=True)
+    self._thread.start()
+
+  def submit(self, entry : JournalEntry) -> bool:
+    # With BLOCK, a caller on the reactor thread stalls the whole server until
+    # the writer catches up, which slows clients down to the speed of the disk
+    if self.overflow == Overflow.BLOCK:
+      self._queue.put(entry)
+      return True
+    try:
+      self._queue.put_nowait(entry)
+      return True
+    except queue.Full:
+      self.dropped += 1
+      return False
+
+  def close(self):
+    if self._thread == None:
+      return
+    self._queue.put(self._stop)
+    self._thread.join()
+    self._thread = None
+
+  def getStats(self) -> Dict[str, int]:
+    return {
+      "written": self.written,
+      "dropped": self.dropped,
+      "failed": self.failed,
+      "pending": self._queue.qsize(),
+      "batches": self.batches,
+      "rotations": self.rotations
+    }
+
+  def _run(self):
+    try:
+      stopping = False
+      while not stopping:
+        batch = []
+        item = self._queue.get()
+        while True:
+          if item is self._stop:
+            stopping = True
+            break
+          batch.append(item)
+          if len(batch) >= self.batchSize:
+            break
+          try:
+            item = self._queue.get_nowait()
+          except queue.Empty:
+            break
+        if len(batch) > 0:
+          self._write(batch)
+    finally:
+      if self._file != None:
+        self._file.close()
+        self._file = None
+
+  def _write(self, batch : List[JournalEntry]):
+    lines = [json.dumps(entry.toDict(), separators=(",", ":")).encode("utf-8") + b"\n" for entry in batch]
+    # The writer keeps running when the disk fails, since blocked submitters
+    # would otherwise wait forever
+    try:
+      if self._file == None:
+        # Rotating could not reopen the file, so it is tried again for each batch
+        self._file = open(self.path, "ab")
+      self._file.write(b"".join(lines))
+      self._file.flush()
+      if self._file.tell() >= self.maxBytes:
+        self._rotate()
+    except OSError:
+      self._log.failure("Failed to write {count} journal entries", count=len(batch))
+      self.failed += len(batch)
+      return
+    self.written += len(batch)
+    self.batches += 1
+
+  def _rotate(self):
+    self._file.close()
+    suffix = ".gz" if self.compress else ""
+    try:
+      if self.backups == 0:
+        os.remove(self.path)
+      else:
+        for index in range(self.backups - 1, 0, -1):
+          source = "{}.{}{}".format(self.path, index, suffix)
+          if os.path.exists(source):
+            os.replace(source, "{}.{}{}".format(self.path, index + 1, suffix))
+        if self.compress:
+          with open(self.path, "rb") as source, gzip.open(self.path + ".1.gz", "wb") as target:
+            shutil.copyfileobj(source, target)
+          os.remove(self.path)
+        else:
+          os.replace(self.path, self.path + ".1")
+    finally:
+      # Reopened even when rotating failed, so later batches can still be written
+      try:
+        self._file = open(self.path, "ab")
+      except OSError:
+        self._log.failure("Failed to reopen {path}", path=self.path)
+        self._file = None
+    self.rotations += 1
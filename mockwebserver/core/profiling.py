@@ -0,0 +1,389 @@
+# Contains the instrumentation hooks of the request pipeline and the profiling
+# windows built on them. Hooks are installed by replacing the instrumented
+# methods on their classes while at least one hook is registered, so the
+# pipeline runs its original methods, at no cost, the rest of the time.
+
+import cProfile
+import functools
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from http.client import OK, BAD_REQUEST, CONFLICT, INTERNAL_SERVER_ERROR
+from typing import Callable, Any, Optional, Tuple
+
+from twisted.logger import Logger as Tw_Logger
+from twisted.web.resource import Resource as Tw_Resource
+from twisted.web.server import Request as Tw_Request, NOT_DONE_YET as Tw_NOT_DONE_YET
+
+from mockwebserver.core.execution import ExecutionPolicy, Executor
+from mockwebserver.core.metrics import Histogram, ServerMetrics
+from mockwebserver.core.request import RequestProcessor
+from mockwebserver.core.stub import StubManager
+from mockwebserver.stub import DefaultStub
+
+# A hook is called with the name of the instrumented method and a callable
+# running the original call, and must return what that callable returns
+Hook = Callable[[str, Callable[[], Any]], Any]
+
+class Instrumentation:
+  targets = (
+    (RequestProcessor, "processRequest"),
+    (RequestProcessor, "stubRender"),
+    (RequestProcessor, "renderStub"),
+    (StubManager, "findStubForRequest"),
+    (StubManager, "findStubAndDataForRequest"),
+    (DefaultStub, "extractData"),
+    (DefaultStub, "matchAndExtractData")
+  )
+
+  def __init__(self):
+    self._hooks = ()
+    self._originals = {}
+    self._lock = threading.Lock()
+
+  def isEnabled(self) -> bool:
+    return len(self._originals) > 0
+
+  def addHook(self, hook : Hook):
+    if hook == None:
+      raise ValueError()
+    with self._lock:
+      self._hooks = self._hooks + (hook,)
+      if not self.isEnabled():
+        self._install()
+
+  def removeHook(self, hook : Hook):
+    with self._lock:
+      if not hook in self._hooks:
+        return
+      hooks = list(self._hooks)
+      hooks.remove(hook)
+      self._hooks = tuple(hooks)
+      if len(self._hooks) == 0:
+        self._uninstall()
+
+  def _install(self):
+    for cls, methodName in self.targets:
+      original = cls.__dict__[methodName]
+      self._originals[(cls, methodName)] = original
+      setattr(cls, methodName, self._wrap("{}.{}".format(cls.__name__, methodName), original))
+
+  def _uninstall(self):
+    for (cls, methodName), original in self._originals.items():
+      setattr(cls, methodName, original)
+    self._originals = {}
+
+  def _wrap(self, name : str, function : Callable) -> Callable:
+    @functools.wraps(function)
+    def instrumented(*args, **kwargs):
+      call = functools.partial(function, *args, **kwargs)
+      for hook in self._hooks:
+        call = functools.partial(hook, name, call)
+      return call()
+    return instrumented
+
+# Shared by the whole process, since the hooks replace methods on the classes
+instrumentation = Instrumentation()
+
+class TimingHook:
+  # Records how long each instrumented method takes. Methods returning a
+  # Deferred are only timed until they return it.
+  def __init__(self, bounds : Tuple[float, ...] = ServerMetrics.defaultBounds):
+    self.histograms = {}
+    self._bounds = bounds
+    self._lock = threading.Lock()
+
+  def __call__(self, name : str, call : Callable[[], Any]) -> Any:
+    started = time.perf_counter()
+    try:
+      return call()
+    finally:
+      self._getHistogram(name).observe(time.perf_counter() - started)
+
+  def _getHistogram(self, name : str) -> Histogram:
+    histogram = self.histograms.get(name)
+    if histogram == None:
+      with self._lock:
+        histogram = self.histograms.setdefault(name, Histogram(self._bounds))
+    return histogram
+
+# From Python 3.12 cProfile runs on sys.monitoring, where a single profiler
+# follows every thread and enabling a second one fails
+sharedProfiler = hasattr(sys, "monitoring")
+
+class CProfileWindow:
+  # Profiles the pipeline with cProfile around the outermost instrumented call
+  # of each thread. Where a profiler only follows the thread that enabled it,
+  # each thread gets one of its own and their stats are merged at the end.
+  # Where a single profiler follows every thread, it is enabled while any
+  # thread is in such a call. Calls run unprofiled when another profiling tool
+  # is active, so the hook never fails the call it wraps.
+  def __init__(self, instrumentation : Instrumentation = instrumentation, shared : bool = sharedProfiler):
+    self.shared = shared
+    self.unprofiledCalls = 0
+    self._instrumentation = instrumentation
+    self._local = threading.local()
+    self._profilers = []
+    self._profiler = cProfile.Profile() if shared else None
+    self._profiledCalls = 0
+    self._calls = 0
+    self._enabled = False
+    self._lock = threading.Lock()
+    self._active = False
+
+  @staticmethod
+  def isAvailable() -> bool:
+    # Whether no other profiling tool holds the profiler of this thread, or
+    # of every thread for a shared profiler
+    if not sharedProfiler:
+      return sys.getprofile() == None
+    probe = cProfile.Profile()
+    try:
+      probe.enable()
+    except ValueError:
+      return False
+    probe.disable()
+    return True
+
+  def start(self):
+    self._active = True
+    self._instrumentation.addHook(self._hook)
+
+  def stop(self):
+    # Stops profiling without waiting for the calls in progress, so it is safe
+    # on the reactor thread
+    self._active = False
+    self._instrumentation.removeHook(self._hook)
+    if self.shared:
+      with self._lock:
+        if self._enabled:
+          self._profiler.disable()
+          self._enabled = False
+
+  def collect(self) -> Optional[pstats.Stats]:
+    # Waits for the calls still being profiled on other threads, so it is
+    # meant to run off the reactor thread, once stopped
+    if self.shared:
+      return pstats.Stats(self._profiler) if self._profiledCalls > 0 else None
+    with self._lock:
+      profilers = list(self._profilers)
+    stats = None
+    for profiler, profilerLock in profilers:
+      with profilerLock:
+        if stats == None:
+          stats = pstats.Stats(profiler)
+        else:
+          stats.add(profiler)
+    return stats
+
+  def _hook(self, name : str, call : Callable[[], Any]) -> Any:
+    if not self._active or getattr(self._local, "depth", 0) > 0:
+      return call()
+    self._local.depth = 1
+    try:
+      if self.shared:
+        return self._runShared(call)
+      return self._runOwn(call)
+    finally:
+      self._local.depth = 0
+
+  def _runShared(self, call : Callable[[], Any]) -> Any:
+    with self._lock:
+      profiled = self._active
+      if profiled and not self._enabled:
+        profiled = self._enable(self._profiler)
+        self._enabled = profiled
+      if profiled:
+        self._calls += 1
+        self._profiledCalls += 1
+      else:
+        self.unprofiledCalls += 1
+    try:
+      return call()
+    finally:
+      if profiled:
+        with self._lock:
+          self._calls -= 1
+          if self._calls == 0 and self._enabled:
+            self._profiler.disable()
+            self._enabled = False
+
+  def _runOwn(self, call : Callable[[], Any]) -> Any:
+    profiler = getattr(self._local, "profiler", None)
+    if profiler == None:
+      profiler = self._local.profiler = (cProfile.Profile(), threading.Lock())
+    with profiler[1]:
+      profiled = sys.getprofile() == None and self._enable(profiler[0])
+      if not profiled:
+        with self._lock:
+          self.unprofiledCalls += 1
+      elif not getattr(self._local, "registered", False):
+        self._local.registered = True
+        with self._lock:
+          self._profilers.append(profiler)
+      try:
+        return call()
+      finally:
+        if profiled:
+          profiler[0].disable()
+
+  @staticmethod
+  def _enable(profiler : cProfile.Profile) -> bool:
+    try:
+      profiler.enable()
+    except ValueError:
+      # Another profiling tool is active
+      return False
+    return True
+
+  @staticmethod
+  def report(stats : Optional[pstats.Stats], limit : int = 40) -> str:
+    if stats == None:
+      return "No instrumented calls were profiled\n"
+    output = io.StringIO()
+    stats.stream = output
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+    return output.getvalue()
+
+class SamplingProfileWindow:
+  # Samples the stacks of every thread at a fixed interval from a thread of
+  # its own, which costs the pipeline nothing but the interpreter lock
+  def __init__(self, interval : float = 0.005):
+    if interval <= 0:
+      raise ValueError()
+    self.interval = interval
+    self.samples = 0
+    self.stacks = Counter()
+    self._stopping = threading.Event()
+    self._thread = None
+
+  def start(self):
+    self._thread = threading.Thread(target=self._run, name="SamplingProfiler", daemon=True)
+    self._thread.start()
+
+  def stop(self) -> Counter:
+    self._stopping.set()
+    self._thread.join()
+    return self.stacks
+
+  def _run(self):
+    ownId = threading.get_ident()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    while not self._stopping.wait(self.interval):
+      for threadId, frame in sys._current_frames().items():
+        if threadId == ownId:
+          continue
+        if not threadId in names:
+          names = {thread.ident: thread.name for thread in threading.enumerate()}
+        self.stacks[self._collapse(names.get(threadId, str(threadId)), frame)] += 1
+      self.samples += 1
+
+  @staticmethod
+  def _collapse(threadName : str, frame) -> str:
+    functions = []
+    while frame != None:
+      code = frame.f_code
+      functions.append("{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+      frame = frame.f_back
+    functions.append(threadName)
+    return ";".join(reversed(functions))
+
+  @staticmethod
+  def report(stacks : Counter) -> str:
+    # One collapsed stack per line followed by its sample count, as read by
+    # flame graph tools
+    return "".join("{} {}\n".format(stack, count) for stack, count in stacks.most_common())
+
+class ProfileResource (Tw_Resource):
+  # Profiles the server for ?seconds=N with ?mode=cprofile or ?mode=sampling,
+  # then answers with the report. A cprofile request samples instead while
+  # another profiling tool is active. Raw stats are also written to the
+  # directory when one is given. Stats are collected and reported on the
+  # executor's thread pool, as collecting waits for calls still in progress.
+  isLeaf = True
+  _log = Tw_Logger()
+  maxSeconds = 300.0
+
+  def __init__(self, \
+               directory : Optional[str] = None, \
+               instrumentation : Instrumentation = instrumentation, \
+               executor : Optional[Executor] = None):
+    super().__init__()
+    self.directory = directory
+    self._instrumentation = instrumentation
+    self._executor = executor if executor != None else Executor()
+    self._window = None
+
+  def render_GET(self, request : Tw_Request):
+    return self.render_POST(request)
+
+  def render_POST(self, request : Tw_Request):
+    if self._window != None:
+      request.setResponseCode(CONFLICT)
+      return b"A profile is already being recorded\n"
+    try:
+      mode = request.args.get(b"mode", [b"cprofile"])[-1].decode("ascii")
+      seconds = float(request.args.get(b"seconds", [b"10"])[-1])
+      limit = int(request.args.get(b"limit", [b"40"])[-1])
+      if not mode in ("cprofile", "sampling") or not 0 < seconds <= self.maxSeconds or limit < 1:
+        raise ValueError()
+    except (ValueError, UnicodeDecodeError):
+      request.setResponseCode(BAD_REQUEST)
+      return b"Expected mode=cprofile|sampling, 0 < seconds <= 300 and limit >= 1\n"
+    if mode == "cprofile" and not CProfileWindow.isAvailable():
+      self._log.info("Another profiling tool is active, sampling instead")
+      mode = "sampling"
+    window = CProfileWindow(self._instrumentation) if mode == "cprofile" else SamplingProfileWindow()
+    window.start()
+    self._window = window
+    from twisted.internet import reactor as Tw_reactor
+    Tw_reactor.callLater(seconds, self._finish, request, mode, limit)
+    return Tw_NOT_DONE_YET
+
+  def _finish(self, request : Tw_Request, mode : str, limit : int):
+    window, self._window = self._window, None
+    result = window.stop()
+    deferred = self._executor.execute(ExecutionPolicy.THREAD_POOL, self._report, window, mode, result, limit)
+    deferred.addCallbacks(lambda report: self._respond(request, OK, report), lambda failure: self._fail(request, failure))
+
+  def _report(self, window : Any, mode : str, result : Any, limit : int) -> str:
+    if mode == "cprofile":
+      result = window.collect()
+      report = CProfileWindow.report(result, limit)
+    else:
+      report = SamplingProfileWindow.report(result)
+    if self.directory != None:
+      self._dump(mode, result, report)
+    return report
+
+  def _fail(self, request : Tw_Request, failure):
+    self._log.failure("Failed to report the profile", failure)
+    self._respond(request, INTERNAL_SERVER_ERROR, "Failed to report the profile\n")
+
+  @staticmethod
+  def _respond(request : Tw_Request, code : int, report : str):
+    if request.finished or getattr(request, "_disconnected", False):
+      return
+    request.setResponseCode(code)
+    request.setHeader(b"content-type", b"text/plain; charset=utf-8")
+    body = report.encode("utf-8")
+    request.setHeader(b"content-length", b"%d" % len(body))
+    request.write(body)
+    request.finish()
+
+  def _dump(self, mode : str, result : Any, report : str):
+    name = "profile-{}-{}".format(time.strftime("%Y%m%d-%H%M%S"), os.getpid())
+    try:
+      os.makedirs(self.directory, exist_ok=True)
+      if mode == "cprofile":
+        if result != None:
+          result.dump_stats(os.path.join(self.directory, name + ".pstats"))
+      else:
+        with open(os.path.join(self.directory, name + ".folded"), "w") as file:
+          file.write(report)
+    except OSError:
+      self._log.failure("Failed to write the profile to {directory}", directory=self.directory)
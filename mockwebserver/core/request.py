@@ -1,41 +1,241 @@
-from http.client import INTERNAL_SERVER_ERROR
-from typing import Tuple, Dict, Any
+from collections.abc import Iterator
+from http.client import INTERNAL_SERVER_ERROR, NOT_FOUND, SERVICE_UNAVAILABLE, TOO_MANY_REQUESTS
+from time import perf_counter
+from typing import Tuple, Dict, Any, Optional, Hashable
 
-from twisted.internet.threads import deferToThread as Tw_deferToThread
-from twisted.internet.defer import Deferred as Tw_Deferred
+from twisted.internet.defer import Deferred as Tw_Deferred, ensureDeferred as Tw_ensureDeferred
+from twisted.internet.interfaces import IReactorTime as Tw_IReactorTime
+from twisted.internet.task import deferLater as Tw_deferLater
+from twisted.logger import Logger as Tw_Logger
+from twisted.python.failure import Failure as Tw_Failure
 from twisted.web.resource import Resource as Tw_Resource
 from twisted.web.server import Request as Tw_Request, NOT_DONE_YET as Tw_NOT_DONE_YET
 
+from mockwebserver.core.admission import Admission, AdmissionController
+from mockwebserver.core.execution import ExecutionPolicy, Executor, RequestSnapshot
+from mockwebserver.core.journal import RequestJournal
+from mockwebserver.core.metrics import ServerMetrics
 from mockwebserver.core.stub import StubManager
-from mockwebserver.stub import Stub
+from mockwebserver.core.streaming import isStream, nextAsyncChunk, endOfStream, IteratorProducer, DeferredChunkProducer
+from mockwebserver.stub import Stub, StaticStub, Response
+from mockwebserver.extraction.cache import getRequestCache, closeRequestCache
 from mockwebserver.extraction.data import DTO
 
+# Headers describing a single response or its connection rather than the
+# rendered content, which cached responses must not replay to other clients
+_unrememberedHeaders = frozenset((
+  b"connection", b"keep-alive", b"proxy-authenticate", b"proxy-authorization", b"te", b"trailer",
+  b"transfer-encoding", b"upgrade", b"content-length", b"date", b"server"
+))
+
 class RequestProcessor:
-  def __init__(self, stubManager : StubManager):
+  def __init__(self, \
+               stubManager : StubManager, \
+               executor : Optional[Executor] = None, \
+               policy : ExecutionPolicy = ExecutionPolicy.THREAD_POOL, \
+               metrics : Optional[ServerMetrics] = None):
     self._stubManager = stubManager
+    self._executor = executor if executor != None else Executor()
+    self.policy = policy
+    self.metrics = metrics
+
+  def getMatchingPolicy(self) -> ExecutionPolicy:
+    # Requests cannot be pickled, so matching never leaves this process
+    return ExecutionPolicy.INLINE if self.policy == ExecutionPolicy.INLINE else ExecutionPolicy.THREAD_POOL
 
-  def processRequest(self, request : Tw_Request) -> DTO:
+  def getRenderPolicy(self, stub : Stub) -> ExecutionPolicy:
+    return stub.executionPolicy if stub.executionPolicy != None else self.policy
+
+  def processRequest(self, request : Tw_Request, policy : Optional[ExecutionPolicy] = None) -> DTO:
     if request == None:
       raise ValueError()
-    stub = self._stubManager.findStubForRequest(request)
-    data = None
-    if isinstance(stub, Stub):
-      data = stub.extractData(request)
-    return DTO(request, stub, data)
+    if self.metrics == None:
+      stub, data = self._stubManager.findStubAndDataForRequest(request)
+    else:
+      cache = getRequestCache(request)
+      started = perf_counter()
+      extractedBefore = cache.extractSeconds
+      stub, data = self._stubManager.findStubAndDataForRequest(request)
+      # Extractors run by matchers count as extraction rather than lookup
+      elapsed = perf_counter() - started
+      extracted = cache.extractSeconds - extractedBefore
+      self.metrics.observe("extraction", extracted)
+      self.metrics.observe("lookup", max(elapsed - extracted, 0.0))
+    dto = DTO(request, stub, data)
+    # Render straight away when the stub renders where the matching ran
+    if isinstance(stub, Stub) and policy != None and self.getRenderPolicy(stub) == policy:
+      dto.result = self.renderStub(dto)
+      dto.rendered = True
+    return dto
+
+  def renderStub(self, dto : DTO) -> Any:
+    if self.metrics == None:
+      return self._renderStub(dto)
+    started = perf_counter()
+    result = self._renderStub(dto)
+    self.metrics.observe("render", perf_counter() - started)
+    return result
+
+  def _renderStub(self, dto : DTO) -> Any:
+    key, response = self.findRenderedResponse(dto)
+    if response != None:
+      return response
+    return self.rememberRender(dto.stub.render(dto.request, dto.data), dto, key)
+
+  def findRenderedResponse(self, dto : DTO) -> Tuple[Optional[Hashable], Optional[Response]]:
+    renderCache = dto.stub.renderCache
+    if renderCache == None:
+      return None, None
+    key = renderCache.keyFor(dto.data)
+    if key == None:
+      return None, None
+    return key, renderCache.get(key)
+
+  def rememberRender(self, result : Any, dto : DTO, key : Optional[Hashable]) -> Any:
+    if key == None:
+      return result
+    response = self._asResponse(result, dto.request)
+    # Streams can only be consumed once
+    if response == None or isStream(response.body):
+      return result
+    dto.stub.renderCache.put(key, response)
+    return response
+
+  @staticmethod
+  def _asResponse(result : Any, request : Tw_Request) -> Optional[Response]:
+    if isinstance(result, Response):
+      return result
+    if isinstance(result, bytes):
+      # Keep what the render callable set on the request along with the body
+      headers = {}
+      for name, values in request.responseHeaders.getAllRawHeaders():
+        if not name.lower() in _unrememberedHeaders:
+          headers[name] = list(values)
+      return Response(result, request.code, headers)
+    return None
 
   def stubRender(self, dto : DTO):
-    return dto.stub.render(dto.request, dto.data)
+    if dto.rendered or not isinstance(dto.stub, Stub):
+      return dto
+    policy = self.getRenderPolicy(dto.stub)
+    if policy == ExecutionPolicy.PROCESS_POOL:
+      key, response = self.findRenderedResponse(dto)
+      if response != None:
+        return self._storeResult(response, dto)
+      renderCallable = getattr(dto.stub, "renderCallable", dto.stub.render)
+      started = perf_counter()
+      deferred = self._executor.execute(policy, renderCallable, RequestSnapshot(dto.request), dto.data)
+      deferred.addCallback(self.rememberRender, dto, key)
+      if self.metrics != None:
+        deferred.addCallback(self._observeRender, started)
+    else:
+      deferred = self._executor.execute(policy, self.renderStub, dto)
+    return deferred.addCallback(self._storeResult, dto)
+
+  def _observeRender(self, result : Any, started : float) -> Any:
+    self.metrics.observe("render", perf_counter() - started)
+    return result
+
+  @staticmethod
+  def _storeResult(result : Any, dto : DTO) -> DTO:
+    dto.result = result
+    dto.rendered = True
+    return dto
+
+class AdmissionSlot:
+  # The admission of a request, given back once, by whichever comes first of
+  # the request being rendered and the request finishing
+  def __init__(self, admission : AdmissionController):
+    self._admission = admission
+    self.held = True
+
+  def release(self, result : Any = None):
+    if self.held:
+      self.held = False
+      self._admission.release()
 
 class RequestDelegator (Tw_Resource):
   isLeaf = True
+  _log = Tw_Logger()
 
-  def __init__(self, stubManager : StubManager):
-    self._requestProcessor = RequestProcessor(stubManager)
+  def __init__(self, \
+               stubManager : StubManager, \
+               executor : Optional[Executor] = None, \
+               policy : ExecutionPolicy = ExecutionPolicy.THREAD_POOL, \
+               admission : Optional[AdmissionController] = None, \
+               rejectionCode : int = SERVICE_UNAVAILABLE, \
+               journal : Optional[RequestJournal] = None, \
+               metrics : Optional[ServerMetrics] = None, \
+               clock : Optional[Tw_IReactorTime] = None):
+    if rejectionCode not in (SERVICE_UNAVAILABLE, TOO_MANY_REQUESTS):
+      raise ValueError()
+    self._clock = clock
+    self._stubManager = stubManager
+    self._executor = executor if executor != None else Executor()
+    self._requestProcessor = RequestProcessor(stubManager, self._executor, policy, metrics)
+    self.admission = admission if admission != None else AdmissionController()
+    self.rejectionCode = rejectionCode
+    self.journal = journal
+    self.metrics = metrics
 
   def render(self, request : Tw_Request):
     if request == None:
       raise ValueError()
-    deferred = Tw_deferToThread(self._requestProcessor.processRequest, request)
+    # Static responses cost less to send than to queue or reject
+    staticStub = self._stubManager.findStaticStubForRequest(request)
+    if isinstance(staticStub, StaticStub) and self._respondStatic(staticStub, request):
+      self._record(request, staticStub)
+      return Tw_NOT_DONE_YET
+    admission = self.admission.admit(lambda: self._startQueued(request))
+    if admission == Admission.REJECTED:
+      request.setResponseCode(self.rejectionCode)
+      return b"Too many requests are being processed"
+    if admission == Admission.QUEUED:
+      return Tw_NOT_DONE_YET
+    return self._process(request)
+
+  def _respondStatic(self, stub : StaticStub, request : Tw_Request) -> bool:
+    # HEAD requests, older clients and throttled responses need the response
+    # Twisted builds
+    if request.clientproto != b"HTTP/1.1" or request.method == b"HEAD" or stub.bandwidth != None:
+      return False
+    seconds = stub.delay.sample() if stub.delay != None else 0
+    if seconds > 0:
+      self._getClock().callLater(seconds, self._writeStatic, stub, request)
+    else:
+      self._writeStatic(stub, request)
+    return True
+
+  def _writeStatic(self, stub : StaticStub, request : Tw_Request):
+    if not self._isOpen(request):
+      return
+    if request.responseHeaders.hasHeader(b"connection"):
+      encoded = stub.head + b"connection: close\r\n\r\n" + stub.response.body
+    else:
+      encoded = stub.encoded
+    # Bypasses Request.write, so the state it keeps is updated here
+    request.code = stub.response.code
+    request.startedWriting = 1
+    request.sentLength = len(stub.response.body)
+    request.channel.write(encoded)
+    request.finish()
+    self._observeTotal(None, request)
+
+  def _startQueued(self, request : Tw_Request) -> bool:
+    if not self._isOpen(request):
+      return False
+    literal = self._process(request)
+    if literal != Tw_NOT_DONE_YET:
+      request.write(literal)
+      request.finish()
+    return True
+
+  def _process(self, request : Tw_Request):
+    # Registered first so that requests finished inline still release
+    slot = AdmissionSlot(self.admission)
+    request.notifyFinish().addBoth(slot.release).addBoth(closeRequestCache, request)
+    policy = self._requestProcessor.getMatchingPolicy()
+    deferred = self._executor.execute(policy, self._requestProcessor.processRequest, request, policy)
     if not isinstance(deferred, Tw_Deferred):
       request.setResponseCode(INTERNAL_SERVER_ERROR)
       return b"Failed to defer request to a thread"
@@ -43,6 +243,102 @@ class RequestDelegator (Tw_Resource):
     if not isinstance(deferred, Tw_Deferred):
       request.setResponseCode(INTERNAL_SERVER_ERROR)
       return b"Failed to add callback to deferred object"
-    # May need to add errback
+    # Delays and throttled streams wait on the reactor rather than holding a
+    # thread, so the slot is released once rendered rather than once sent
+    deferred.addCallback(self._recordMatch).addBoth(self._release, slot).addCallback(self._delay)
+    deferred.addCallback(self._respond, request).addCallback(self._observeTotal, request)
+    deferred.addErrback(self._fail, request)
     return Tw_NOT_DONE_YET
-      
\ No newline at end of file
+
+  def _delay(self, dto : DTO):
+    if not isinstance(dto.stub, Stub) or dto.stub.delay == None:
+      return dto
+    seconds = dto.stub.delay.sample()
+    if seconds <= 0:
+      return dto
+    return Tw_deferLater(self._getClock(), seconds, lambda: dto)
+
+  def _getClock(self) -> Tw_IReactorTime:
+    if self._clock == None:
+      from twisted.internet import reactor as Tw_reactor
+      self._clock = Tw_reactor
+    return self._clock
+
+  @staticmethod
+  def _release(result : Any, slot : AdmissionSlot) -> Any:
+    slot.release()
+    return result
+
+  @staticmethod
+  def _isOpen(request : Tw_Request) -> bool:
+    return not request.finished and not getattr(request, "_disconnected", False)
+
+  def _record(self, request : Tw_Request, stub : Optional[Stub]):
+    stubId = stub.id if isinstance(stub, Stub) else None
+    if self.journal != None:
+      self.journal.record(request, stubId)
+    if self.metrics != None:
+      self.metrics.countRequest(stubId)
+
+  def _observeTotal(self, result : Any, request : Tw_Request):
+    # Streamed responses are observed once their last chunk was written
+    if self.metrics != None:
+      self.metrics.observe("total", perf_counter() - getRequestCache(request).receivedAt)
+
+  def _recordMatch(self, dto : DTO) -> DTO:
+    # Recorded before any delay, so entries carry the time the request arrived
+    self._record(dto.request, dto.stub)
+    return dto
+
+  def _respond(self, dto : DTO, request : Tw_Request):
+    if not self._isOpen(request):
+      return
+    if not isinstance(dto.stub, Stub):
+      request.setResponseCode(NOT_FOUND)
+      request.finish()
+      return
+    result = dto.result
+    if result == None:
+      # The render callable writes and finishes the request itself
+      return
+    if isinstance(result, Response):
+      request.setResponseCode(result.code)
+      for name, value in result.headers.items():
+        if isinstance(value, list):
+          request.responseHeaders.setRawHeaders(name, value)
+        else:
+          request.setHeader(name, value)
+      result = result.body
+    if isinstance(result, bytes) and dto.stub.bandwidth != None:
+      request.setHeader(b"content-length", b"%d" % len(result))
+      result = iter((result,))
+    if isStream(result):
+      return self._stream(dto, result, request)
+    if not isinstance(result, bytes):
+      raise TypeError("Stub {} rendered {} instead of bytes or a Response".format(dto.stub.id, type(result).__name__))
+    request.setHeader(b"content-length", b"%d" % len(result))
+    request.write(result)
+    request.finish()
+
+  def _stream(self, dto : DTO, stream : Any, request : Tw_Request) -> Tw_Deferred:
+    bandwidth = dto.stub.bandwidth
+    if not isinstance(stream, Iterator):
+      nextChunk = lambda: Tw_ensureDeferred(nextAsyncChunk(stream))
+    elif self._requestProcessor.getRenderPolicy(dto.stub) == ExecutionPolicy.INLINE:
+      if bandwidth == None:
+        return IteratorProducer(request, stream).start()
+      # Throttled streams are only advanced when their previous chunk is sent
+      nextChunk = lambda: self._executor.execute(ExecutionPolicy.INLINE, next, stream, endOfStream)
+    else:
+      # Iterators cannot be sent to other processes, so they are advanced in
+      # the thread pool when not rendered inline
+      nextChunk = lambda: self._executor.execute(ExecutionPolicy.THREAD_POOL, next, stream, endOfStream)
+    return DeferredChunkProducer(request, stream, nextChunk, bandwidth, self._clock).start()
+
+  def _fail(self, failure : Tw_Failure, request : Tw_Request):
+    self._log.failure("Failed to process request", failure)
+    # A failed stream has already dropped the connection, and finishing it now
+    # would send the chunk marking its body as complete
+    if self._isOpen(request) and not request.startedWriting:
+      request.setResponseCode(INTERNAL_SERVER_ERROR)
+      request.finish()
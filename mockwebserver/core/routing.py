@@ -0,0 +1,228 @@
+# Contains the routing index used by the stub manager to narrow down which stubs
+# have to be evaluated for a request. Stubs are keyed on the method of their
+# method matcher and on the literal leading segments of their path matcher.
+# Within a node, stubs with a matcher offering a routing guard are keyed on the
+# value the guard needs, such as a header value, and only looked up for it.
+# Given how the stub manager ranks its stubs, every list of stubs is kept in
+# rank order, so candidates are merged lazily instead of gathered and sorted.
+
+import heapq
+from typing import Optional, List, Tuple, Dict, Iterable, Iterator, Any, Hashable, Callable
+
+from twisted.web.server import Request as Tw_Request
+
+from mockwebserver.stub import Stub
+from mockwebserver.extraction.cache import getRequestCache, normalizePath
+from mockwebserver.matching.matcher import MethodMatcher, PathMatcher
+
+Guard = Tuple[Any, Any, Hashable]
+Route = Tuple[Optional[str], Tuple[str, ...], Optional[Guard]]
+Rank = Callable[[Stub], Any]
+
+def patternSegments(pattern : str) -> Tuple[str, ...]:
+  pattern = normalizePath(pattern)
+  # Everything before the first field is literal, but the segment holding the
+  # field is only partially known so it cannot be used as a key
+  fieldStart = pattern.find('{')
+  if fieldStart >= 0:
+    pattern = pattern[:fieldStart]
+  return tuple(pattern.split('/')[:-1])
+
+def stubSpecificity(stub : Stub) -> Tuple[int, int, int]:
+  # The explicit priority, the literal segments of the most literal path
+  # pattern, and the number of matchers, each more specific when higher
+  literalSegments = 0
+  matchers = getattr(stub, "matchers", ())
+  for matcher in matchers:
+    if isinstance(matcher, PathMatcher):
+      segments = normalizePath(matcher.pattern).split('/')[:-1]
+      literalSegments = max(literalSegments, sum(1 for segment in segments if len(segment) > 0 and not '{' in segment))
+  return getattr(stub, "priority", 0), literalSegments, len(matchers)
+
+class _RouteNode:
+  __slots__ = ("children", "stubs", "guarded")
+
+  def __init__(self, \
+               children : Optional[Dict[str, "_RouteNode"]] = None, \
+               stubs : Optional[List[Stub]] = None, \
+               guarded : Optional[Dict[Tuple[Any, Any], Dict[Hashable, List[Stub]]]] = None):
+    self.children = children if children != None else {}
+    self.stubs = stubs if stubs != None else []
+    # Keyed on the function and argument of the guard, then on its value
+    self.guarded = guarded if guarded != None else {}
+
+  def copy(self) -> "_RouteNode":
+    guarded = {key: {value: list(stubs) for value, stubs in byValue.items()} for key, byValue in self.guarded.items()}
+    return _RouteNode(dict(self.children), list(self.stubs), guarded)
+
+  def isEmpty(self) -> bool:
+    return len(self.stubs) == 0 and len(self.children) == 0 and len(self.guarded) == 0
+
+  def removeStubs(self, stubIds : Iterable[str]):
+    stubIds = set(stubIds)
+    self.stubs = [stub for stub in self.stubs if not stub.id in stubIds]
+    for key in list(self.guarded):
+      byValue = self.guarded[key]
+      for value in list(byValue):
+        byValue[value] = [stub for stub in byValue[value] if not stub.id in stubIds]
+        if len(byValue[value]) == 0:
+          del byValue[value]
+      if len(byValue) == 0:
+        del self.guarded[key]
+
+  def addStub(self, stub : Stub, guard : Optional[Guard]) -> List[Stub]:
+    # Returns the list the stub was appended to
+    if guard == None:
+      stubs = self.stubs
+    else:
+      function, argument, value = guard
+      stubs = self.guarded.setdefault((function, argument), {}).setdefault(value, [])
+    stubs.append(stub)
+    return stubs
+
+class RoutingIndex:
+  # Never modified once published: withChanges copies only the nodes along the
+  # changed routes and shares the rest with the original index
+  def __init__(self, roots : Optional[Dict[Optional[str], _RouteNode]] = None, routes : Optional[Dict[str, Route]] = None):
+    self._roots = roots if roots != None else {}
+    self._routes = routes if routes != None else {}
+
+  @staticmethod
+  def routeForStub(stub : Stub) -> Route:
+    method = None
+    segments = ()
+    guard = None
+    for matcher in getattr(stub, "matchers", ()):
+      if guard == None:
+        guard = getattr(matcher, "routingGuard", None)
+      if isinstance(matcher, MethodMatcher):
+        if method == None:
+          method = matcher.methodName
+      elif isinstance(matcher, PathMatcher):
+        matcherSegments = patternSegments(matcher.pattern)
+        if len(matcherSegments) > len(segments):
+          segments = matcherSegments
+    return method, segments, guard
+
+  def withChanges(self, \
+                  added : Iterable[Stub] = (), \
+                  removed : Iterable[Stub] = (), \
+                  rank : Optional[Rank] = None) -> "RoutingIndex":
+    # Removals are applied before additions so a stub can be swapped for one
+    # with the same ID. Each node is copied at most once per change set. Added
+    # stubs are appended, then the lists they were added to sorted once by rank.
+    roots = dict(self._roots)
+    routes = dict(self._routes)
+    copied = set()
+
+    def writable(node : Optional[_RouteNode]) -> _RouteNode:
+      if node != None and id(node) in copied:
+        return node
+      node = node.copy() if node != None else _RouteNode()
+      copied.add(id(node))
+      return node
+
+    removedIds = set()
+    removedRoutes = []
+    removedNodes = {}
+    for stub in removed:
+      route = routes.pop(stub.id, None)
+      if route == None:
+        continue
+      method, segments, _ = route
+      node = roots[method] = writable(roots[method])
+      for segment in segments:
+        child = node.children[segment] = writable(node.children[segment])
+        node = child
+      removedIds.add(stub.id)
+      removedRoutes.append(route)
+      removedNodes[id(node)] = node
+    for node in removedNodes.values():
+      node.removeStubs(removedIds)
+    for method, segments, _ in removedRoutes:
+      self._prune(roots, method, segments)
+    appendedLists = {}
+    for stub in added:
+      method, segments, guard = route = self.routeForStub(stub)
+      node = roots[method] = writable(roots.get(method))
+      for segment in segments:
+        child = node.children.get(segment)
+        if child == None:
+          # New nodes belong to this index alone
+          child = node.children[segment] = _RouteNode()
+          copied.add(id(child))
+        elif not id(child) in copied:
+          child = node.children[segment] = writable(child)
+        node = child
+      stubs = node.addStub(stub, guard)
+      # Keeps the list and where appending to it started
+      appendedLists.setdefault(id(stubs), (stubs, len(stubs) - 1))
+      routes[stub.id] = route
+    if rank != None:
+      for stubs, start in appendedLists.values():
+        # Appending in rank order is the common case, which needs no sorting
+        ranks = [rank(stub) for stub in stubs[max(start - 1, 0):]]
+        if any(ranks[index] > ranks[index + 1] for index in range(len(ranks) - 1)):
+          stubs.sort(key=rank)
+    return RoutingIndex(roots, routes)
+
+  @staticmethod
+  def _prune(roots : Dict[Optional[str], _RouteNode], method : Optional[str], segments : Tuple[str, ...]):
+    # Only called on nodes already copied for the index being built
+    node = roots.get(method)
+    if node == None:
+      return
+    visited = [node]
+    for segment in segments:
+      node = node.children.get(segment)
+      if node == None:
+        return
+      visited.append(node)
+    for depth in range(len(segments), 0, -1):
+      if not visited[depth].isEmpty():
+        break
+      del visited[depth - 1].children[segments[depth - 1]]
+    if roots[method].isEmpty():
+      del roots[method]
+
+  def iterCandidates(self, request : Tw_Request, rank : Rank) -> Iterator[Stub]:
+    # Only valid when every stub was added with the same rank, which keeps each
+    # list sorted, so the best candidates come first without looking at the rest
+    stubLists = self._findStubLists(request)
+    if len(stubLists) == 0:
+      return iter(())
+    if len(stubLists) == 1:
+      return iter(stubLists[0])
+    return heapq.merge(*stubLists, key=rank)
+
+  def _findStubLists(self, request : Tw_Request) -> List[List[Stub]]:
+    if request == None:
+      raise ValueError()
+    cache = getRequestCache(request)
+    method = cache.getMethod()
+    path = cache.getPath()
+    segments = path.split('/')[:-1] if path != None else ()
+    stubLists = []
+    for methodKey in ((method, None) if method != None else (None,)):
+      node = self._roots.get(methodKey)
+      if node == None:
+        continue
+      self._addStubLists(node, cache, stubLists)
+      for segment in segments:
+        node = node.children.get(segment)
+        if node == None:
+          break
+        self._addStubLists(node, cache, stubLists)
+    return stubLists
+
+  @staticmethod
+  def _addStubLists(node : _RouteNode, cache : Any, stubLists : List[List[Stub]]):
+    if len(node.stubs) > 0:
+      stubLists.append(node.stubs)
+    for (function, argument), byValue in node.guarded.items():
+      values = function(cache, argument)
+      # A value sent twice must not add its stubs twice
+      for value in (values if len(values) < 2 else set(values)):
+        stubs = byValue.get(value)
+        if stubs != None:
+          stubLists.append(stubs)
@@ -0,0 +1,222 @@
+# Contains the producers writing streamed response bodies. Render callables
+# may return an iterator or an async iterator of byte chunks instead of bytes,
+# which are then written one chunk at a time with chunked transfer encoding,
+# pausing whenever the transport cannot take more data. Producers can also
+# limit the bandwidth of a response.
+
+from collections.abc import Iterator, AsyncIterator
+from typing import Any, Callable, Optional, AsyncIterator as AsyncIteratorType
+
+from twisted.internet.defer import Deferred as Tw_Deferred
+from twisted.internet.interfaces import IPullProducer as Tw_IPullProducer, IPushProducer as Tw_IPushProducer, \
+                                       IReactorTime as Tw_IReactorTime
+from twisted.python.failure import Failure as Tw_Failure
+from twisted.web.server import Request as Tw_Request
+from zope.interface import implementer as Zi_implementer
+
+# Returned in place of a chunk once a stream is exhausted
+endOfStream = object()
+
+def isStream(value : Any) -> bool:
+  return isinstance(value, (Iterator, AsyncIterator))
+
+async def nextAsyncChunk(iterator : AsyncIteratorType[bytes]) -> Any:
+  # Async iterators must await Deferreds, since they run on the reactor
+  try:
+    return await iterator.__anext__()
+  except StopAsyncIteration:
+    return endOfStream
+
+class StreamProducer:
+  def __init__(self, request : Tw_Request, stream : Any):
+    self.request = request
+    self.stream = stream
+    self.chunks = 0
+    self._done = Tw_Deferred()
+    self._stopped = False
+
+  def start(self) -> Tw_Deferred:
+    # The Deferred fires once the response is finished or the client is gone
+    # and fails when the stream raises, after the connection was dropped
+    self.request.registerProducer(self, self.isStreaming())
+    self._produce()
+    return self._done
+
+  def isStreaming(self) -> bool:
+    raise NotImplementedError()
+
+  def _produce(self):
+    raise NotImplementedError()
+
+  def _writeChunk(self, chunk : Any) -> bool:
+    if self._stopped:
+      return False
+    if chunk is endOfStream:
+      self._stop()
+      self.request.unregisterProducer()
+      self.request.finish()
+      self._done.callback(None)
+      return False
+    if not isinstance(chunk, bytes):
+      raise TypeError("Streams must produce bytes, not {}".format(type(chunk).__name__))
+    self.chunks += 1
+    self.request.write(chunk)
+    return True
+
+  def _fail(self, failure : Tw_Failure):
+    if self._stopped:
+      return
+    self._stop()
+    self.request.unregisterProducer()
+    # The headers are already out, so only dropping the connection tells the
+    # client that the body is incomplete
+    self.request.loseConnection()
+    self._done.errback(failure)
+
+  def stopProducing(self):
+    if self._stopped:
+      return
+    self._stop()
+    self._done.callback(None)
+
+  def _stop(self):
+    self._stopped = True
+    self._closeStream()
+
+  def _closeStream(self):
+    close = getattr(self.stream, "close", None)
+    if close != None:
+      close()
+
+@Zi_implementer(Tw_IPullProducer)
+class IteratorProducer (StreamProducer):
+  # Pulls one chunk each time the connection asks for more, on the reactor
+  # thread, for iterators rendered inline
+
+  def isStreaming(self) -> bool:
+    return False
+
+  def _produce(self):
+    # Twisted pulls through resumeProducing once the producer is registered
+    pass
+
+  def resumeProducing(self):
+    if self._stopped:
+      return
+    try:
+      self._writeChunk(next(self.stream, endOfStream))
+    except Exception:
+      self._fail(Tw_Failure())
+
+@Zi_implementer(Tw_IPushProducer)
+class DeferredChunkProducer (StreamProducer):
+  # Keeps requesting chunks through nextChunk, which returns a Deferred, until
+  # the connection pauses it. With a bandwidth, chunks are split into slices
+  # written once per tick, and the next chunk is only requested once the
+  # previous one has been sent.
+  ticksPerSecond = 10
+
+  def __init__(self, \
+               request : Tw_Request, \
+               stream : Any, \
+               nextChunk : Callable[[], Tw_Deferred], \
+               bandwidth : Optional[int] = None, \
+               clock : Optional[Tw_IReactorTime] = None):
+    super().__init__(request, stream)
+    if bandwidth != None and bandwidth < 1:
+      raise ValueError()
+    self._nextChunk = nextChunk
+    self.bandwidth = bandwidth
+    self._clock = clock
+    self._paused = False
+    self._waiting = False
+    self._producing = False
+    self._pending = None
+    self._sleep = None
+
+  def isStreaming(self) -> bool:
+    return True
+
+  def pauseProducing(self):
+    self._paused = True
+
+  def resumeProducing(self):
+    self._paused = False
+    if self._sleep != None:
+      return
+    if self._pending != None:
+      self._writeSlice()
+    else:
+      self._produce()
+
+  def _produce(self):
+    # Chunks which are available straight away are written in this loop
+    # rather than from nested callbacks, so long streams do not recurse
+    if self._producing:
+      return
+    self._producing = True
+    try:
+      while not (self._stopped or self._paused or self._waiting or self._pending != None or self._sleep != None):
+        self._waiting = True
+        self._nextChunk().addCallbacks(self._receive, self._receiveFailure)
+    finally:
+      self._producing = False
+
+  def _receive(self, chunk : Any):
+    self._waiting = False
+    if self._stopped:
+      self._closeStream()
+      return
+    try:
+      if self.bandwidth != None and chunk is not endOfStream:
+        if not isinstance(chunk, bytes):
+          raise TypeError("Streams must produce bytes, not {}".format(type(chunk).__name__))
+        self._pending = memoryview(chunk)
+        self._writeSlice()
+        return
+      written = self._writeChunk(chunk)
+    except Exception:
+      self._fail(Tw_Failure())
+      return
+    if written:
+      self._produce()
+
+  def _writeSlice(self):
+    if self._stopped or self._paused:
+      return
+    size = max(1, -(-self.bandwidth // self.ticksPerSecond))
+    piece = self._pending[:size]
+    self._pending = self._pending[size:] if len(self._pending) > size else None
+    self._writeChunk(piece.tobytes())
+    self._sleep = self._getClock().callLater(len(piece) / self.bandwidth, self._wake)
+
+  def _wake(self):
+    self._sleep = None
+    if self._pending != None:
+      self._writeSlice()
+    else:
+      self._produce()
+
+  def _receiveFailure(self, failure : Tw_Failure):
+    self._waiting = False
+    self._fail(failure)
+
+  def _stop(self):
+    if self._sleep != None:
+      self._sleep.cancel()
+      self._sleep = None
+    self._pending = None
+    super()._stop()
+
+  def _closeStream(self):
+    # A generator cannot be closed while a thread is advancing it, so that
+    # waits for the pending chunk. Async generators are left to the garbage
+    # collector, since they may still be awaiting.
+    if not self._waiting and isinstance(self.stream, Iterator):
+      super()._closeStream()
+
+  def _getClock(self) -> Tw_IReactorTime:
+    if self._clock == None:
+      from twisted.internet import reactor as Tw_reactor
+      self._clock = Tw_reactor
+    return self._clock
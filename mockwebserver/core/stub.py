@@ -4,103 +4,453 @@
 #   manual/interactive loader class
 #   auto loader class
 
-from typing import Optional, List, Iterable, Tuple
+import gc
+import json
+import os
+from contextlib import contextmanager
+from http.client import OK
+from string import Template
+from threading import RLock
+from typing import Optional, List, Iterable, Iterator, Tuple, Dict, Any, Union
 
 from twisted.web.server import Request as Tw_Request
 
-from mockwebserver.stub import Stub
+from mockwebserver.stub import Stub, DefaultStub, StaticStub, Response
+from mockwebserver.core.delay import Delay
+from mockwebserver.core.routing import RoutingIndex, stubSpecificity
+from mockwebserver.extraction.extractor import Extractor, PathExtractor, QueryExtractor
+from mockwebserver.matching.body import BodyRegexMatcher, BodyContainsMatcher, BodyExcludesMatcher, JsonPathMatcher
+from mockwebserver.matching.header import HeaderMatcher, HeaderPatternMatcher, ContentTypeMatcher, AcceptMatcher, CookieMatcher
+from mockwebserver.matching.logic import AndMatcher, OrMatcher, NotMatcher
+from mockwebserver.matching.matcher import Matcher, MethodMatcher, PathMatcher, QueryMatcher
 
 BoolWithError = Tuple[bool, str]
 
+@contextmanager
+def _collectionPaused():
+  # Building a snapshot allocates many small objects, which otherwise triggers
+  # repeated full collections over every stub already loaded
+  wasEnabled = gc.isenabled()
+  gc.disable()
+  try:
+    yield
+  finally:
+    if wasEnabled:
+      gc.enable()
+
+def _asList(value : Any) -> List[Any]:
+  return value if isinstance(value, list) else [value]
+
+class StubSnapshot:
+  # An immutable view of the stubs. Readers take the current snapshot with a
+  # single reference read, writers publish a new one instead of changing it.
+  # Stubs are ranked by position, or by their specificity when given one,
+  # stored negated so that the most specific stubs rank first.
+  __slots__ = ("stubs", "positions", "routingIndex", "specificity")
+
+  def __init__(self, \
+               stubs : Tuple[Stub, ...], \
+               positions : Dict[str, int], \
+               routingIndex : RoutingIndex, \
+               specificity : Optional[Dict[str, Tuple[int, int, int]]] = None):
+    self.stubs = stubs
+    self.positions = positions
+    self.routingIndex = routingIndex
+    self.specificity = specificity
+
+  def rankOf(self, stub : Stub) -> Any:
+    if self.specificity == None:
+      return self.positions[stub.id]
+    return self.specificity[stub.id], self.positions[stub.id]
+
+  def iterCandidates(self, request : Tw_Request) -> Iterator[Stub]:
+    return self.routingIndex.iterCandidates(request, self.rankOf)
+
 class StubManager:
-  def __init__(self):
-    self._stubs = []
-    self._stub_ids = []
+  # Requests are answered by the first matching stub in the order stubs were
+  # added, or with bestMatch, by the most specific matching stub: the one with
+  # the highest priority, then the most literal path segments, then the most
+  # matchers, and the first added among equals
+  def __init__(self, bestMatch : bool = False):
+    self.bestMatch = bestMatch
+    self._writeLock = RLock()
+    self._snapshot = StubSnapshot((), {}, RoutingIndex(), {} if bestMatch else None)
+
+  def _publish(self, \
+               stubs : Tuple[Stub, ...], \
+               positions : Dict[str, int], \
+               added : Iterable[Stub] = (), \
+               removed : Iterable[Stub] = ()):
+    # Called with the write lock held. The specificity of a stub is computed
+    # once, when it is added, and ranks it in the routing index from then on.
+    snapshot = self._snapshot
+    specificity = None
+    if self.bestMatch:
+      specificity = dict(snapshot.specificity)
+      for stub in removed:
+        specificity.pop(stub.id, None)
+      for stub in added:
+        specificity[stub.id] = tuple(-value for value in stubSpecificity(stub))
+    published = StubSnapshot(stubs, positions, None, specificity)
+    published.routingIndex = snapshot.routingIndex.withChanges(added, removed, published.rankOf)
+    self._snapshot = published
+
+  def getSnapshot(self) -> StubSnapshot:
+    return self._snapshot
+
+  def getStubs(self) -> Tuple[Stub, ...]:
+    return self._snapshot.stubs
+
+  def getRenderCacheStats(self) -> Dict[str, Dict[str, int]]:
+    return {stub.id: stub.renderCache.getStats() for stub in self._snapshot.stubs if stub.renderCache != None}
 
   def getStub(self, index : int) -> Optional[Stub]:
-    if index < 0 or len(self._stubs) < index:
-      return False, "Argument index={} is outside of range [0, {})".format(index, len(self._stubs))
-    return self._stubs[index]
+    stubs = self._snapshot.stubs
+    if index < 0 or len(stubs) <= index:
+      return None
+    return stubs[index]
 
   def findStubIndex(self, stubId : str) -> int:
-    return self._stub_ids.index(stubId) if self.hasStub(stubId) else -1
+    return self._snapshot.positions.get(stubId, -1)
 
   def findStub(self, stubId : str) -> Optional[Stub]:
     index = self.findStubIndex(stubId)
     return self.getStub(index)
 
   def hasStub(self, stubId : str) -> bool:
-    return stubId in self._stub_ids
+    return stubId in self._snapshot.positions
 
   def addStub(self, stub : Stub) -> BoolWithError:
     if stub == None:
       raise ValueError()
-    if self.hasStub(stub.id):
-      return False, "Stub with ID {} has already been added".format(stub.id)
-    self._stubs.append(stub)
-    self._stub_ids.append(stub.id)
+    with self._writeLock:
+      snapshot = self._snapshot
+      if stub.id in snapshot.positions:
+        return False, "Stub with ID {} has already been added".format(stub.id)
+      positions = dict(snapshot.positions)
+      positions[stub.id] = len(snapshot.stubs)
+      self._publish(snapshot.stubs + (stub,), positions, (stub,))
     return True, ""
 
   def addStubs(self, stubs : Iterable[Stub]) -> List[BoolWithError]:
     if stubs == None:
       raise ValueError()
-    resultList = []
-    for stub in stubs:
-      result = self.addStub(stub) if isinstance(stub, Stub) else (False, "Item is not a stub")
-      resultList.append(result)
-    return resultList
+    added, _, _ = self.updateStubs(add=stubs)
+    return added
+
+  def replaceStubs(self, stubs : Iterable[Stub]) -> List[BoolWithError]:
+    if stubs == None:
+      raise ValueError()
+    _, replaced, _ = self.updateStubs(replace=stubs)
+    return replaced
+
+  def removeStubs(self, stubIds : Iterable[str]) -> List[Optional[Stub]]:
+    if stubIds == None:
+      raise ValueError()
+    _, _, removed = self.updateStubs(remove=stubIds)
+    return removed
+
+  def updateStubs(self, \
+                  add : Iterable[Stub] = (), \
+                  replace : Iterable[Stub] = (), \
+                  remove : Iterable[str] = ()) -> Tuple[List[BoolWithError], List[BoolWithError], List[Optional[Stub]]]:
+    # Applies a whole batch with a single new snapshot. Removals come first,
+    # then stubs are replaced in place by ID, then new stubs are appended.
+    with self._writeLock, _collectionPaused():
+      snapshot = self._snapshot
+      stubs = list(snapshot.stubs)
+      positions = snapshot.positions
+      removeResults = []
+      removedIndices = set()
+      for stubId in remove:
+        index = positions.get(stubId, -1)
+        if index < 0 or index in removedIndices:
+          removeResults.append(None)
+          continue
+        removedIndices.add(index)
+        removeResults.append(stubs[index])
+      replaceResults = []
+      replacedIndices = set()
+      for stub in replace:
+        if not isinstance(stub, Stub):
+          replaceResults.append((False, "Item is not a stub"))
+          continue
+        index = positions.get(stub.id, -1)
+        if index < 0 or index in removedIndices:
+          replaceResults.append((False, "Could not find old stub with ID {}".format(stub.id)))
+          continue
+        stubs[index] = stub
+        replacedIndices.add(index)
+        replaceResults.append((True, ""))
+      addResults = []
+      addedStubs = []
+      addedIds = set()
+      for stub in add:
+        if not isinstance(stub, Stub):
+          addResults.append((False, "Item is not a stub"))
+          continue
+        index = positions.get(stub.id, -1)
+        if (index >= 0 and not index in removedIndices) or stub.id in addedIds:
+          addResults.append((False, "Stub with ID {} has already been added".format(stub.id)))
+          continue
+        addedStubs.append(stub)
+        addedIds.add(stub.id)
+        addResults.append((True, ""))
+      if len(removedIndices) == 0 and len(replacedIndices) == 0 and len(addedStubs) == 0:
+        return addResults, replaceResults, removeResults
+      routingRemoved = [snapshot.stubs[index] for index in removedIndices | replacedIndices]
+      routingAdded = [stubs[index] for index in replacedIndices]
+      routingAdded.extend(addedStubs)
+      if len(removedIndices) > 0:
+        stubs = [stub for index, stub in enumerate(stubs) if not index in removedIndices]
+        stubs.extend(addedStubs)
+        positions = {stub.id: index for index, stub in enumerate(stubs)}
+      else:
+        positions = dict(positions)
+        for index, stub in enumerate(addedStubs, len(stubs)):
+          positions[stub.id] = index
+        stubs.extend(addedStubs)
+      self._publish(tuple(stubs), positions, routingAdded, routingRemoved)
+    return addResults, replaceResults, removeResults
 
   def insertStub(self, index : int, stub : Stub) -> BoolWithError:
-    if index < 0 or len(self._stubs) < index:
-      return False, "Argument index={} is outside of range [0, {})".format(index, len(self._stubs))
-    if self.hasStub(stub.id):
-      return False, "Stub with ID {} has already been added".format(stub.id)
-    if index < len(self._stubs):
-      self._stubs.insert(index, stub)
-      self._stub_ids.insert(index, stub.id)
-      return True, ""
-    else:
-      return self.addStub(stub)
+    if stub == None:
+      raise ValueError()
+    with self._writeLock:
+      snapshot = self._snapshot
+      if index < 0 or len(snapshot.stubs) < index:
+        return False, "Argument index={} is outside of range [0, {}]".format(index, len(snapshot.stubs))
+      if stub.id in snapshot.positions:
+        return False, "Stub with ID {} has already been added".format(stub.id)
+      stubs = snapshot.stubs[:index] + (stub,) + snapshot.stubs[index:]
+      positions = {stubId: position for stubId, position in snapshot.positions.items() if position < index}
+      for position in range(index, len(stubs)):
+        positions[stubs[position].id] = position
+      self._publish(stubs, positions, (stub,))
+    return True, ""
 
   def removeStubAt(self, index : int) -> Optional[Stub]:
-    if index < 0 or len(self._stubs) < index:
-      return None
-    stub = self._stubs.pop(index)
-    del self._stub_ids[index]
+    with self._writeLock:
+      snapshot = self._snapshot
+      if index < 0 or len(snapshot.stubs) <= index:
+        return None
+      stub = snapshot.stubs[index]
+      stubs = snapshot.stubs[:index] + snapshot.stubs[index + 1:]
+      positions = {stubId: position for stubId, position in snapshot.positions.items() if position < index}
+      for position in range(index, len(stubs)):
+        positions[stubs[position].id] = position
+      self._publish(stubs, positions, (), (stub,))
     return stub
 
   def removeStub(self, stubId : str) -> Optional[Stub]:
-    index = self.findStubIndex(stubId)
-    if index < 0:
-      return None
-    return self.removeStubAt(index)
+    with self._writeLock:
+      index = self.findStubIndex(stubId)
+      if index < 0:
+        return None
+      return self.removeStubAt(index)
 
   def removeAllStubs(self) -> List[Stub]:
-    stubs = self._stubs
-    self._stubs = []
-    self._stub_ids.clear()
-    return stubs
+    with self._writeLock:
+      stubs = self._snapshot.stubs
+      self._snapshot = StubSnapshot((), {}, RoutingIndex(), {} if self.bestMatch else None)
+    return list(stubs)
 
   def replaceStubAt(self, index : int, stub : Stub) -> Tuple[Optional[Stub], BoolWithError]:
-    if index < 0 or len(self._stubs) < index:
-      return None, (False, "Argument index={} is outside of range [0, {})".format(index, len(self._stubs)))
-    oldStubId = self_stubs[index].id
-    if oldStubId != stub.id and self.hasStub(stub.id):
-      return None, (False, "New Stub ID {} is already in use".format(stub.id))
-    oldStub = self.removeStub(oldStubId)
-    inserted, error = self.insertStub(index, stub)
-    return oldStub, (inserted, error)
+    if stub == None:
+      raise ValueError()
+    with self._writeLock:
+      snapshot = self._snapshot
+      if index < 0 or len(snapshot.stubs) <= index:
+        return None, (False, "Argument index={} is outside of range [0, {})".format(index, len(snapshot.stubs)))
+      oldStub = snapshot.stubs[index]
+      if oldStub.id != stub.id and stub.id in snapshot.positions:
+        return None, (False, "New Stub ID {} is already in use".format(stub.id))
+      stubs = snapshot.stubs[:index] + (stub,) + snapshot.stubs[index + 1:]
+      positions = dict(snapshot.positions)
+      del positions[oldStub.id]
+      positions[stub.id] = index
+      self._publish(stubs, positions, (stub,), (oldStub,))
+    return oldStub, (True, "")
 
   def replaceStub(self, oldStub : Stub, newStub : Stub) -> Tuple[Optional[Stub], BoolWithError]:
-    index = self.findStubIndex(oldStub.id)
-    if index < 0:
-      return None, (False, "Could not find old stub with ID {}".format(oldStub.id))
-    return self.replaceStubAt(index)
+    with self._writeLock:
+      index = self.findStubIndex(oldStub.id)
+      if index < 0:
+        return None, (False, "Could not find old stub with ID {}".format(oldStub.id))
+      return self.replaceStubAt(index, newStub)
 
   def findStubForRequest(self, request : Tw_Request) -> Optional[Stub]:
     if request == None:
       raise ValueError()
-    for stub in self._stubs:
+    for stub in self._snapshot.iterCandidates(request):
       if stub.matchesRequest(request):
         return stub
     return None
+
+  def findStaticStubForRequest(self, request : Tw_Request) -> Optional[StaticStub]:
+    if request == None:
+      raise ValueError()
+    # Stops at the first stub which is not static, since it may still match
+    # and would then take precedence over any static stub after it
+    for stub in self._snapshot.iterCandidates(request):
+      if not isinstance(stub, StaticStub):
+        return None
+      if stub.matchesRequest(request):
+        return stub
+    return None
+
+  def findStubAndDataForRequest(self, request : Tw_Request) -> Tuple[Optional[Stub], Optional[Dict[str, Any]]]:
+    if request == None:
+      raise ValueError()
+    for stub in self._snapshot.iterCandidates(request):
+      matches, data = stub.matchAndExtractData(request)
+      if matches:
+        return stub, data
+    return None, None
+
+class StubLoader:
+  def load(self) -> List[Stub]:
+    raise NotImplementedError()
+
+  def loadInto(self, stubManager : StubManager) -> List[BoolWithError]:
+    if stubManager == None:
+      raise ValueError()
+    return stubManager.addStubs(self.load())
+
+class DefinitionRender:
+  # Render callable of a declarative stub. Static bodies are encoded once into a
+  # shared Response, templated bodies are filled in with the extracted values.
+  def __init__(self, status : int, headers : Dict[bytes, bytes], body : bytes, template : Optional[Template]):
+    self.status = status
+    self.headers = headers
+    self.template = template
+    self.response = Response(body, status, headers) if template == None else None
+
+  def __call__(self, request : Tw_Request, data : Dict[str, Any]) -> Response:
+    if self.response != None:
+      return self.response
+    values = {}
+    for extract in data.values():
+      if extract != None:
+        values.update(extract.named)
+    return Response(self.template.safe_substitute(values).encode("utf-8"), self.status, self.headers)
+
+class JsonStubLoader (StubLoader):
+  def __init__(self, paths : Iterable[str]):
+    if paths == None:
+      raise ValueError()
+    self.paths = list(paths)
+
+  def load(self) -> List[Stub]:
+    stubs = []
+    for path in self._expandPaths():
+      stubs.extend(self.loadFile(path))
+    return stubs
+
+  def loadFile(self, path : str) -> List[Stub]:
+    with open(path, "rb") as file:
+      return self.compile(json.load(file), path)
+
+  def compile(self, document : Any, source : str = "<document>") -> List[Stub]:
+    definitions = document.get("stubs") if isinstance(document, dict) else document
+    if not isinstance(definitions, list):
+      raise ValueError("{}: expected a list of stub definitions".format(source))
+    stubs = []
+    for position, definition in enumerate(definitions):
+      try:
+        stubs.append(self.compileDefinition(definition))
+      except (KeyError, TypeError, ValueError) as error:
+        raise ValueError("{}: invalid stub definition {}: {!r}".format(source, position, error)) from error
+    return stubs
+
+  @staticmethod
+  def compileRequest(requestDefinition : Dict[str, Any]) -> List[Union[Matcher, Extractor]]:
+    objects = []
+    if "method" in requestDefinition:
+      objects.append(MethodMatcher(requestDefinition["method"].upper()))
+    # Matchers share the compiled patterns of the extractors
+    if "path" in requestDefinition:
+      pathExtractor = PathExtractor(requestDefinition["path"])
+      objects.append(PathMatcher.fromExtractor(pathExtractor))
+      objects.append(pathExtractor)
+    if "query" in requestDefinition:
+      query = requestDefinition["query"]
+      parameters = tuple(query.items()) if isinstance(query, dict) else tuple(tuple(pair) for pair in query)
+      matchSubset = requestDefinition.get("matchSubset", True)
+      queryExtractor = QueryExtractor(matchSubset, *parameters)
+      objects.append(QueryMatcher.fromExtractor(queryExtractor))
+      objects.append(queryExtractor)
+    for name, value in requestDefinition.get("headers", {}).items():
+      if isinstance(value, dict):
+        objects.append(HeaderPatternMatcher(name, value["pattern"]))
+      else:
+        objects.append(HeaderMatcher(name, value))
+    if "contentType" in requestDefinition:
+      objects.append(ContentTypeMatcher(requestDefinition["contentType"]))
+    if "accept" in requestDefinition:
+      objects.append(AcceptMatcher(requestDefinition["accept"]))
+    for name, value in requestDefinition.get("cookies", {}).items():
+      objects.append(CookieMatcher(name, value))
+    bodyDefinition = requestDefinition.get("body", {})
+    for pattern in _asList(bodyDefinition.get("regex", [])):
+      objects.append(BodyRegexMatcher(pattern))
+    for text in _asList(bodyDefinition.get("contains", [])):
+      objects.append(BodyContainsMatcher(text))
+    for text in _asList(bodyDefinition.get("excludes", [])):
+      objects.append(BodyExcludesMatcher(text))
+    for path, value in bodyDefinition.get("json", {}).items():
+      objects.append(JsonPathMatcher(path, value))
+    for path in _asList(bodyDefinition.get("jsonPaths", [])):
+      objects.append(JsonPathMatcher(path))
+    # Nested request sections only match, their fields are not extracted
+    if "allOf" in requestDefinition:
+      objects.append(AndMatcher(*JsonStubLoader._compileSections(requestDefinition["allOf"])))
+    if "anyOf" in requestDefinition:
+      objects.append(OrMatcher(*JsonStubLoader._compileSections(requestDefinition["anyOf"])))
+    if "not" in requestDefinition:
+      objects.append(NotMatcher(*JsonStubLoader._compileSections([requestDefinition["not"]])))
+    return objects
+
+  @staticmethod
+  def _compileSections(sections : List[Dict[str, Any]]) -> List[Matcher]:
+    matchers = []
+    for section in _asList(sections):
+      sectionMatchers = [obj for obj in JsonStubLoader.compileRequest(section) if isinstance(obj, Matcher)]
+      if len(sectionMatchers) == 0:
+        raise ValueError("Empty request section")
+      matchers.append(sectionMatchers[0] if len(sectionMatchers) == 1 else AndMatcher(*sectionMatchers))
+    return matchers
+
+  @staticmethod
+  def compileDefinition(definition : Dict[str, Any]) -> Stub:
+    objects = JsonStubLoader.compileRequest(definition.get("request", {}))
+    responseDefinition = definition.get("response", {})
+    headers = {}
+    for name, value in responseDefinition.get("headers", {}).items():
+      headers[name.encode("latin-1")] = value.encode("latin-1")
+    template = None
+    body = b""
+    if "template" in responseDefinition:
+      template = Template(responseDefinition["template"])
+    elif "json" in responseDefinition:
+      body = json.dumps(responseDefinition["json"], separators=(",", ":")).encode("utf-8")
+      headers.setdefault(b"Content-Type", b"application/json")
+    else:
+      body = responseDefinition.get("body", "").encode("utf-8")
+    render = DefinitionRender(responseDefinition.get("status", OK), headers, body, template)
+    delay = Delay.fromDefinition(responseDefinition["delay"]) if "delay" in responseDefinition else None
+    return DefaultStub(
+      definition["id"], render, *objects,
+      delay=delay, bandwidth=responseDefinition.get("bandwidth"), priority=definition.get("priority", 0)
+    )
+
+  def _expandPaths(self) -> List[str]:
+    paths = []
+    for path in self.paths:
+      if os.path.isdir(path):
+        paths.extend(sorted(
+          os.path.join(path, name) for name in os.listdir(path) if name.endswith(".json")
+        ))
+      else:
+        paths.append(path)
+    return paths
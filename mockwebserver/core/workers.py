@@ -0,0 +1,134 @@
+# Contains the supervisor which forks the worker processes of a multi-process
+# server. Each worker runs its own reactor and listens on the same port with
+# SO_REUSEPORT, leaving the kernel to spread connections between them.
+
+import os
+import select
+import signal
+import socket
+import sys
+import time
+import traceback
+from typing import Callable, Dict
+
+def listenReusePort(reactor, port : int, backlog : int, factory):
+  sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  try:
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(("", port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    # The reactor duplicates the descriptor, so our copy can be closed
+    return reactor.adoptStreamPort(sock.fileno(), socket.AF_INET, factory)
+  finally:
+    sock.close()
+
+class WorkerSupervisor:
+  _pollInterval = 0.1
+
+  def __init__(self, \
+               workers : int, \
+               serve : Callable[[Callable[[], None]], None], \
+               startupTimeout : float = 30.0, \
+               shutdownTimeout : float = 10.0):
+    if workers < 1:
+      raise ValueError()
+    if not hasattr(socket, "SO_REUSEPORT") or not hasattr(os, "fork"):
+      raise RuntimeError("Worker processes need fork and SO_REUSEPORT support")
+    self.workers = workers
+    self.startupTimeout = startupTimeout
+    self.shutdownTimeout = shutdownTimeout
+    self._serve = serve
+    self._pids = []
+    self._exitCodes = {}
+    self._stopDeadline = None
+
+  def run(self) -> Dict[int, int]:
+    # A reactor created before forking would share its poller with every worker
+    if "twisted.internet.reactor" in sys.modules:
+      raise RuntimeError("The Twisted reactor must not be imported before the workers are forked")
+    readyRead, readyWrite = os.pipe()
+    for _ in range(self.workers):
+      pid = os.fork()
+      if pid == 0:
+        os.close(readyRead)
+        self._runWorker(readyWrite)
+      self._pids.append(pid)
+    os.close(readyWrite)
+    previousHandlers = {
+      signum: signal.signal(signum, self._handleSignal) for signum in (signal.SIGINT, signal.SIGTERM)
+    }
+    try:
+      if not self._waitUntilReady(readyRead):
+        self.stop()
+      self._reapWorkers()
+    finally:
+      os.close(readyRead)
+      for signum, handler in previousHandlers.items():
+        signal.signal(signum, handler)
+    return self._exitCodes
+
+  def stop(self):
+    if self._stopDeadline != None:
+      return
+    self._stopDeadline = time.monotonic() + self.shutdownTimeout
+    self._signalWorkers(signal.SIGTERM)
+
+  def _runWorker(self, readyWrite : int):
+    exitCode = 0
+    try:
+      self._serve(lambda: os.write(readyWrite, b"."))
+    except BaseException:
+      traceback.print_exc()
+      exitCode = 1
+    finally:
+      sys.stdout.flush()
+      sys.stderr.flush()
+      os._exit(exitCode)
+
+  def _handleSignal(self, signum : int, frame):
+    self.stop()
+
+  def _signalWorkers(self, signum : int):
+    for pid in self._pids:
+      try:
+        os.kill(pid, signum)
+      except ProcessLookupError:
+        pass
+
+  def _reapWorker(self, block : bool) -> bool:
+    pid, status = os.waitpid(-1, 0 if block else os.WNOHANG)
+    if pid == 0:
+      return False
+    self._pids.remove(pid)
+    self._exitCodes[pid] = os.waitstatus_to_exitcode(status)
+    # A worker exiting on its own leaves the server short, so stop the rest
+    self.stop()
+    return True
+
+  def _waitUntilReady(self, readyRead : int) -> bool:
+    deadline = time.monotonic() + self.startupTimeout
+    ready = 0
+    while ready < self.workers:
+      if self._stopDeadline != None or time.monotonic() > deadline:
+        return False
+      readable, _, _ = select.select([readyRead], [], [], self._pollInterval)
+      if readable:
+        written = os.read(readyRead, self.workers)
+        # Every worker has exited once the pipe is closed
+        if len(written) == 0:
+          return False
+        ready += len(written)
+      elif len(self._pids) < self.workers or self._reapWorker(False):
+        return False
+    return True
+
+  def _reapWorkers(self):
+    while len(self._pids) > 0:
+      if self._reapWorker(False):
+        continue
+      if self._stopDeadline != None and time.monotonic() > self._stopDeadline:
+        self._signalWorkers(signal.SIGKILL)
+        self._stopDeadline = float("inf")
+      time.sleep(self._pollInterval)
@@ -0,0 +1,169 @@
+# Contains the per-request cache shared by matchers and extractors, so values
+# derived from a request are computed once per request rather than once per use
+
+import io
+import mmap
+import os
+from time import perf_counter
+from typing import Optional, Any, Dict, List, Hashable, Callable
+
+from twisted.web.http_headers import Headers as Tw_Headers
+from twisted.web.server import Request as Tw_Request
+
+_CACHE_ATTRIBUTE = "_mockWebServerCache"
+
+def asText(value : Any) -> Optional[str]:
+  if isinstance(value, bytes):
+    return value.decode("utf-8", "replace")
+  if isinstance(value, str):
+    return value
+  return None
+
+def normalizePath(path : str) -> str:
+  if len(path) > 0 and not path.endswith('/'):
+    path += '/'
+  return path
+
+def readBody(content : Any) -> Any:
+  # Returns the whole body as bytes, or as a read-only map of the file Twisted
+  # spooled a large body to, without moving the position of the stream
+  if isinstance(content, io.BytesIO):
+    return content.getvalue()
+  if content == None or not hasattr(content, "read"):
+    return b""
+  try:
+    fileno = content.fileno()
+  except (OSError, ValueError, io.UnsupportedOperation):
+    fileno = None
+  if isinstance(fileno, int):
+    try:
+      if os.fstat(fileno).st_size == 0:
+        return b""
+      return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+      pass
+  position = content.tell()
+  content.seek(0)
+  try:
+    body = content.read()
+  finally:
+    content.seek(position)
+  return body if isinstance(body, bytes) else b""
+
+class RequestCache:
+  _notSet = object()
+
+  def __init__(self, request : Tw_Request):
+    self._request = request
+    # The cache is created when the request is first looked at, which makes it
+    # the place to remember when processing started
+    self.receivedAt = perf_counter()
+    self.extractSeconds = 0.0
+    self._method = self._notSet
+    self._path = self._notSet
+    self._query = self._notSet
+    self._querySize = 0
+    self._headers = self._notSet
+    self._body = self._notSet
+    self._derived = {}
+    self._extracts = {}
+
+  def getMethod(self) -> Optional[str]:
+    if self._method is self._notSet:
+      self._method = asText(self._request.method)
+    return self._method
+
+  def getPath(self) -> Optional[str]:
+    if self._path is self._notSet:
+      path = asText(self._request.path)
+      self._path = normalizePath(path) if path != None else None
+    return self._path
+
+  def getQuery(self) -> Dict[str, List[str]]:
+    # The query parameters decoded to text, keeping the order of the values
+    # given for each key
+    if self._query is self._notSet:
+      query = {}
+      size = 0
+      args = self._request.args
+      if isinstance(args, dict):
+        for key, values in args.items():
+          key = asText(key)
+          if key == None:
+            continue
+          decoded = [value.decode("utf-8", "replace") if isinstance(value, bytes) else value for value in values if isinstance(value, (bytes, str))]
+          if key in query:
+            query[key].extend(decoded)
+          else:
+            query[key] = decoded
+          size += len(decoded)
+      self._query = query
+      self._querySize = size
+    return self._query
+
+  def getQuerySize(self) -> int:
+    # The number of values of all query parameters
+    self.getQuery()
+    return self._querySize
+
+  def getHeaders(self) -> Dict[bytes, List[bytes]]:
+    # The raw values of each header, keyed by the lowercase name
+    if self._headers is self._notSet:
+      headers = {}
+      requestHeaders = getattr(self._request, "requestHeaders", None)
+      if isinstance(requestHeaders, Tw_Headers):
+        for name, values in requestHeaders.getAllRawHeaders():
+          headers[name.lower()] = list(values)
+      self._headers = headers
+    return self._headers
+
+  def getBody(self) -> Any:
+    # Shared by every matcher looking at the body, which search it in place
+    # rather than decoding it
+    if self._body is self._notSet:
+      self._body = readBody(getattr(self._request, "content", None))
+    return self._body
+
+  def close(self):
+    # Unmaps a spooled body, which matchers still searching it keep mapped until
+    # the cache is collected
+    if isinstance(self._body, mmap.mmap):
+      try:
+        self._body.close()
+      except BufferError:
+        return
+      self._body = self._notSet
+
+  def getDerived(self, key : Hashable, compute : Callable[["RequestCache"], Any]) -> Any:
+    # Values derived from the request by whoever needs them, such as parsed
+    # headers, computed once under a key chosen by the caller
+    value = self._derived.get(key, self._notSet)
+    if value is self._notSet:
+      value = self._derived[key] = compute(self)
+    return value
+
+  def getExtract(self, extractor : Any) -> Any:
+    extractorId = extractor.getId()
+    extract = self._extracts.get(extractorId, self._notSet)
+    if extract is self._notSet:
+      started = perf_counter()
+      extract = self._extracts[extractorId] = extractor.extractData(self._request)
+      self.extractSeconds += perf_counter() - started
+    return extract
+
+def getRequestCache(request : Tw_Request) -> RequestCache:
+  if request == None:
+    raise ValueError()
+  cache = request.__dict__.get(_CACHE_ATTRIBUTE)
+  if cache == None:
+    cache = RequestCache(request)
+    setattr(request, _CACHE_ATTRIBUTE, cache)
+  return cache
+
+def closeRequestCache(result : Any, request : Tw_Request) -> Any:
+  # Added to the callbacks of notifyFinish, so the body is unmapped once the
+  # request is done with
+  cache = request.__dict__.get(_CACHE_ATTRIBUTE)
+  if cache != None:
+    cache.close()
+  return result
@@ -8,4 +8,6 @@ class DTO:
   def __init__(self, request : Tw_Request, stub : Stub, data : Dict[str, Any]):
     self.request = request
     self.stub = stub
-    self.data = data
\ No newline at end of file
+    self.data = data
+    self.result = None
+    self.rendered = False
\ No newline at end of file
@@ -4,10 +4,13 @@
 # the user will likely implement their own request data extraction code
 
 import re
-from typing import Optional, Sequence, Dict, Any, Tuple
+from typing import Optional, Sequence, Dict, Any, Tuple, List, Set, Iterator
 
 from twisted.web.server import Request as Tw_Request
-from parse import parse as Pa_parse, Result as Pa_Result
+from parse import compile as Pa_compile, Result as Pa_Result
+
+from mockwebserver.extraction.cache import getRequestCache, normalizePath
+
 class Extract:
   def __init__(self, fixed : Sequence[Any], named : Dict[str, Any]):
     self.fixed = fixed
@@ -23,64 +26,134 @@ class Extractor:
 class PathExtractor (Extractor):
   def __init__(self, pattern : str):
     self.pattern = pattern
+    self._id = "PATH '{}'".format(pattern)
+    self._parser = Pa_compile(normalizePath(pattern), case_sensitive=True)
 
   def getId(self) -> str:
-    return "PATH '{}'".format(self.pattern)
+    return self._id
   
   def extractData(self, request : Tw_Request) -> Optional[Extract]:
     if request == None:
       raise ValueError()
-    pattern = self.pattern
-    if len(pattern) > 0 and not pattern.endswith('/'):
-      pattern += '/'
-    path = request.path
-    if len(path) > 0 and not path.endswith('/'):
-      path += '/'
-    result = Pa_parse(pattern, path, case_sensitive=True)
+    path = getRequestCache(request).getPath()
+    if path == None:
+      return None
+    result = self._parser.parse(path)
     return Extract(list(result.fixed), result.named) if isinstance(result, Pa_Result) else None
 
 class QueryExtractor (Extractor):
-  _didNotPop = object()
-  
+  # Every parameter pattern consumes a parameter value of its own, so a key
+  # given twice in the query can satisfy two patterns, whatever the order of
+  # its values. Patterns without fields are compared as text, and literal keys
+  # are looked up rather than searched.
   def __init__(self, matchSubset : bool = True, *parameters : Tuple[str, Any]):
     self.matchSubset = matchSubset
     self.parameters = parameters
+    # Extracts are cached per request by ID, so exact matching needs its own ID
+    self._id = "QUERY {}".format(parameters) if matchSubset else "QUERY EXACT {}".format(parameters)
+    self._patterns = []
+    for key, value in parameters:
+      if key == None or value == None:
+        raise ValueError()
+      self._patterns.append(self._compile(str(key)) + self._compile(str(value)))
+    self._parameterKeys = [(str(key), str(value)) for key, value in parameters]
+    # The most specific patterns consume values first, so that patterns with
+    # fields are left the values no literal pattern asked for and rarely need
+    # to take a value from another pattern
+    self._order = sorted(range(len(self._patterns)), key=lambda index: (
+      self._patterns[index][1] != None, self._patterns[index][3] != None
+    ))
+
+  @staticmethod
+  def _compile(pattern : str) -> Tuple[Optional[str], Any]:
+    if not "{" in pattern and not "}" in pattern:
+      return pattern, None
+    return None, Pa_compile(pattern, case_sensitive=True)
 
   def getId(self) -> str:
-    return "QUERY {}".format(self.parameters)
+    return self._id
 
   def extractData(self, request: Tw_Request) -> Optional[Extract]:
     if request == None:
       raise ValueError()
-    params = []
-    for key in request.args:
-      for item in request.args[key]:
-        params.append((key, item))
-    if len(self.parameters) > len(params):
+    cache = getRequestCache(request)
+    query = cache.getQuery()
+    valueCount = cache.getQuerySize()
+    # Each pattern consumes exactly one value
+    if len(self._patterns) > valueCount or (not self.matchSubset and len(self._patterns) < valueCount):
       return None
-    elif not self.matchSubset and len(self.parameters) < len(params):
-      return None
-    extract = Extract([], {})
-    for patternKey, patternValue in self.parameters:
-      keyResult = None
-      valueResult = None
-      matchingRequestKey = None
-      for requestKey, requestValue in params:
-        keyResult = Pa_parse(patternKey, requestKey, case_sensitive=True)
-        if not isinstance(keyResult, Pa_Result):
-          continue
-        valueResult = Pa_parse(patternValue, requestValue, case_sensitive=True)
-        if not isinstance(valueResult, Pa_Result):
-          continue
-        matchingRequestKey = requestKey
-        break
-      if not isinstance(matchingRequestKey, str) or params.pop(requestKey, self._didNotPop) == self._didNotPop:
+    # The values each pattern may consume, found once per distinct pattern,
+    # rejecting the query as soon as a pattern has none
+    candidates = []
+    found = {}
+    for index, pattern in enumerate(self._patterns):
+      parameter = self._parameterKeys[index]
+      if not parameter in found:
+        found[parameter] = list(self._candidates(query, pattern))
+      if len(found[parameter]) == 0:
         return None
-      extract.fixed.extend(list(keyResult.fixed))
-      extract.fixed.extend(list(valueResult.fixed))
-      extract.named.update(keyResult.named)
-      extract.named.update(valueResult.named)
+      candidates.append(found[parameter])
+    # Patterns are then matched to values of their own along augmenting paths,
+    # which is linear in the candidates for each pattern rather than trying
+    # every assignment. The most constrained patterns choose first, so values
+    # rarely need to be taken from another pattern.
+    owners = {}
+    results = [None] * len(self._patterns)
+    for index in sorted(self._order, key=lambda index: len(candidates[index])):
+      if not self._augment(index, candidates, owners, results, set()):
+        return None
+    # Fields are extracted in the order the parameters were given
+    extract = Extract([], {})
+    for keyResult, valueResult in results:
+      for result in (keyResult, valueResult):
+        if result != None:
+          extract.fixed.extend(result.fixed)
+          extract.named.update(result.named)
     return extract
-      
 
+  @classmethod
+  def _augment(cls, \
+               index : int, \
+               candidates : List[List[Tuple[Tuple[str, int], Any]]], \
+               owners : Dict[Tuple[str, int], int], \
+               results : List[Any], \
+               visited : Set[Tuple[str, int]]) -> bool:
+    # Gives the pattern the first free value, and otherwise takes a value from
+    # the pattern owning it when that pattern can be given another one instead
+    for slot, result in candidates[index]:
+      if not slot in owners:
+        owners[slot] = index
+        results[index] = result
+        return True
+    for slot, result in candidates[index]:
+      if slot in visited:
+        continue
+      visited.add(slot)
+      owner = owners.get(slot)
+      if owner == None or cls._augment(owner, candidates, owners, results, visited):
+        owners[slot] = index
+        results[index] = result
+        return True
+    return False
 
+  @staticmethod
+  def _candidates(query : Dict[str, List[str]], \
+                  pattern : Tuple[Optional[str], Any, Optional[str], Any]) -> Iterator[Tuple[Tuple[str, int], Tuple[Optional[Pa_Result], Optional[Pa_Result]]]]:
+    key, keyParser, value, valueParser = pattern
+    if keyParser == None:
+      keys = ((key, None),) if key in query else ()
+    else:
+      keys = ((requestKey, keyParser.parse(requestKey)) for requestKey in query)
+    for requestKey, keyResult in keys:
+      if keyParser != None and not isinstance(keyResult, Pa_Result):
+        continue
+      for position, requestValue in enumerate(query[requestKey]):
+        valueResult = None
+        if valueParser == None:
+          if requestValue != value:
+            continue
+        else:
+          valueResult = valueParser.parse(requestValue)
+          if not isinstance(valueResult, Pa_Result):
+            continue
+        yield (requestKey, position), (keyResult, valueResult)
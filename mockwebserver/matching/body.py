@@ -1,7 +1,145 @@
-# Will contain:
-#   base body matcher
-#   body matchers with different behaviour
-#     regex
-#     contain
-#     exclude
-#   this will most likely be implemented by the user for specifics
\ No newline at end of file
+# Contains the body matchers:
+#   regex, contains and excludes matchers, searching the raw body
+#   JSON path matcher, over the body parsed as JSON
+# The body of a request is read once into its cache, and the JSON parsed from
+# it at most once, however many stubs look at it. Patterns are encoded when the
+# matcher is created, so the body is searched as it is rather than decoded.
+
+import json
+import re
+from typing import Any, List, Tuple, Union
+
+from twisted.web.server import Request as Tw_Request
+
+from mockwebserver.extraction.cache import RequestCache, getRequestCache
+from mockwebserver.matching.matcher import Matcher
+
+class BodyRegexMatcher (Matcher):
+  # Matches when the pattern is found anywhere in the body, or matches all of
+  # it with fullMatch
+  cost = 40.0
+
+  def __init__(self, pattern : str, flags : int = 0, fullMatch : bool = False, encoding : str = "utf-8"):
+    super().__init__(None)
+    if pattern == None:
+      raise ValueError()
+    self.pattern = pattern
+    self.fullMatch = fullMatch
+    self._id = "BODY {} {}".format("FULLMATCH" if fullMatch else "SEARCH", pattern)
+    regex = re.compile(pattern.encode(encoding), flags)
+    self._match = regex.fullmatch if fullMatch else regex.search
+
+  def getId(self) -> str:
+    return self._id
+
+  def matchesRequest(self, request : Tw_Request) -> bool:
+    return self._match(getRequestCache(request).getBody()) != None
+
+class BodyContainsMatcher (Matcher):
+  cost = 20.0
+
+  def __init__(self, text : str, encoding : str = "utf-8"):
+    super().__init__(None)
+    if text == None:
+      raise ValueError()
+    self.text = text
+    self._id = "BODY CONTAINS {}".format(text)
+    self._needle = text.encode(encoding)
+
+  def getId(self) -> str:
+    return self._id
+
+  def matchesRequest(self, request : Tw_Request) -> bool:
+    return getRequestCache(request).getBody().find(self._needle) >= 0
+
+class BodyExcludesMatcher (BodyContainsMatcher):
+  def __init__(self, text : str, encoding : str = "utf-8"):
+    super().__init__(text, encoding)
+    self._id = "BODY EXCLUDES {}".format(text)
+
+  def matchesRequest(self, request : Tw_Request) -> bool:
+    return not super().matchesRequest(request)
+
+_invalid = object()
+
+def _parseJson(cache : RequestCache) -> Any:
+  body = cache.getBody()
+  try:
+    return json.loads(body if isinstance(body, bytes) else body[:])
+  except ValueError:
+    return _invalid
+
+JsonPathStep = Tuple[str, Union[str, int, None]]
+_stepPattern = re.compile(r"\.([A-Za-z_$][\w$-]*)|\.\*|\[(-?\d+|\*|'[^']*'|\"[^\"]*\")\]")
+
+def parseJsonPath(path : str) -> Tuple[JsonPathStep, ...]:
+  # Supports $, .name, ['name'], [index] and the wildcards .* and [*]
+  if path == None or not path.startswith("$"):
+    raise ValueError("JSON paths must start with $")
+  steps = []
+  position = 1
+  while position < len(path):
+    match = _stepPattern.match(path, position)
+    if match == None:
+      raise ValueError("Invalid JSON path {!r} at {}".format(path, position))
+    name, selector = match.groups()
+    if name != None:
+      steps.append(("key", name))
+    elif selector == None or selector == "*":
+      steps.append(("all", None))
+    elif selector[0] in "'\"":
+      steps.append(("key", selector[1:-1]))
+    else:
+      steps.append(("index", int(selector)))
+    position = match.end()
+  return tuple(steps)
+
+def findJsonValues(document : Any, steps : Tuple[JsonPathStep, ...]) -> List[Any]:
+  values = [document]
+  for kind, argument in steps:
+    found = []
+    for value in values:
+      if kind == "key":
+        if isinstance(value, dict) and argument in value:
+          found.append(value[argument])
+      elif kind == "index":
+        if isinstance(value, list) and -len(value) <= argument < len(value):
+          found.append(value[argument])
+      elif isinstance(value, dict):
+        found.extend(value.values())
+      elif isinstance(value, list):
+        found.extend(value)
+    values = found
+  return values
+
+def jsonEqual(first : Any, second : Any) -> bool:
+  # Unlike in Python, true is not 1 in JSON
+  if isinstance(first, bool) or isinstance(second, bool):
+    return first is second
+  return first == second
+
+class JsonPathMatcher (Matcher):
+  # Matches when the path selects a value in the body, which must equal the
+  # expected value if one is given. With wildcards, any selected value will do.
+  cost = 50.0
+  _anyValue = object()
+
+  def __init__(self, path : str, value : Any = _anyValue):
+    super().__init__(None)
+    self.path = path
+    self.hasValue = not value is self._anyValue
+    self.value = value if self.hasValue else None
+    self._steps = parseJsonPath(path)
+    self._id = "BODY JSON {} == {!r}".format(path, value) if self.hasValue else "BODY JSON {}".format(path)
+
+  def getId(self) -> str:
+    return self._id
+
+  def matchesRequest(self, request : Tw_Request) -> bool:
+    document = getRequestCache(request).getDerived(_parseJson, _parseJson)
+    if document is _invalid:
+      return False
+    values = findJsonValues(document, self._steps)
+    if not self.hasValue:
+      return len(values) > 0
+    return any(jsonEqual(value, self.value) for value in values)
@@ -1,8 +1,224 @@
-# Will contain:
-#   base header matcher
-#   matchers for specific headers such as
-#     Accept
-#     Content-Type
+# Contains the header matchers:
+#   exact and pattern matchers for any header
+#   matchers for specific headers
+#     Accept, with media ranges and their quality
+#     Content-Type, with wildcards and parameters
 #     Cookie
-#     Expect
-#     Date
\ No newline at end of file
+# Names and values are normalized to bytes once, when the matcher is created,
+# and the headers of a request are decoded and parsed once, in its cache.
+
+import re
+from typing import Optional, Tuple, Dict, List, Any, Callable, Hashable
+
+from twisted.web.server import Request as Tw_Request
+
+from mockwebserver.extraction.cache import RequestCache, getRequestCache
+from mockwebserver.matching.matcher import Matcher
+
+MediaType = Tuple[bytes, bytes, Dict[bytes, bytes]]
+# A guard names values a request must have for a matcher to match it, which
+# the routing index looks up instead of evaluating the matcher. It holds a
+# function giving the values of a request, its argument, and the value needed.
+RoutingGuard = Tuple[Callable[[RequestCache, Any], List[Hashable]], Any, Hashable]
+
+def parseMediaType(value : bytes) -> Optional[MediaType]:
+  # Types and parameter names are case-insensitive, and so is the charset
+  essence, _, parameterText = value.partition(b";")
+  mainType, slash, subtype = essence.strip().lower().partition(b"/")
+  if len(slash) == 0 or len(mainType) == 0 or len(subtype) == 0:
+    return None
+  parameters = {}
+  for parameter in parameterText.split(b";"):
+    name, equals, parameterValue = parameter.partition(b"=")
+    name = name.strip().lower()
+    if len(equals) == 0 or len(name) == 0:
+      continue
+    parameterValue = parameterValue.strip()
+    if len(parameterValue) >= 2 and parameterValue.startswith(b"\"") and parameterValue.endswith(b"\""):
+      parameterValue = parameterValue[1:-1]
+    parameters[name] = parameterValue.lower() if name == b"charset" else parameterValue
+  return mainType, subtype.strip(), parameters
+
+def parseMediaTypeText(value : str) -> MediaType:
+  mediaType = parseMediaType(value.encode("latin-1")) if value != None else None
+  if mediaType == None:
+    raise ValueError("Invalid media type {!r}".format(value))
+  return mediaType
+
+def _parseAccept(cache : RequestCache) -> Optional[List[Tuple[bytes, bytes, Dict[bytes, bytes], float]]]:
+  # None when the request has no Accept header, which accepts everything
+  values = cache.getHeaders().get(b"accept")
+  if values == None:
+    return None
+  ranges = []
+  for item in b",".join(values).split(b","):
+    mediaRange = parseMediaType(item)
+    if mediaRange == None:
+      continue
+    mainType, subtype, parameters = mediaRange
+    try:
+      quality = float(parameters.pop(b"q", b"1"))
+    except ValueError:
+      continue
+    ranges.append((mainType, subtype, parameters, quality))
+  return ranges
+
+def _parseCookies(cache : RequestCache) -> Dict[bytes, bytes]:
+  cookies = {}
+  for value in cache.getHeaders().get(b"cookie", ()):
+    for item in value.split(b";"):
+      name, equals, cookieValue = item.partition(b"=")
+      name = name.strip()
+      # The first cookie of a name is the most specific one
+      if len(equals) > 0 and len(name) > 0 and not name in cookies:
+        cookies[name] = cookieValue.strip()
+  return cookies
+
+def _parseContentType(cache : RequestCache) -> Optional[MediaType]:
+  values = cache.getHeaders().get(b"content-type")
+  return parseMediaType(values[0]) if values else None
+
+def headerValues(cache : RequestCache, name : bytes) -> List[bytes]:
+  return cache.getHeaders().get(name, [])
+
+def contentTypeEssence(cache : RequestCache, name : bytes) -> List[bytes]:
+  mediaType = cache.getDerived(_parseContentType, _parseContentType)
+  return [mediaType[0] + b"/" + mediaType[1]] if mediaType != None else []
+
+class HeaderMatcher (Matcher):
+  # Matches when any value given for the header is the expected one
+  cost = 2.0
+
+  def __init__(self, name : str, value : str):
+    super().__init__(None)
+    if name == None or value == None:
+      raise ValueError()
+    self.name = name
+    self.value = value
+    self._id = "HEADER {}: {}".format(name, value)
+    self._nameBytes = name.lower().encode("latin-1")
+    self._valueBytes = value.encode("latin-1")
+    self.routingGuard = (headerValues, self._nameBytes, self._valueBytes)
+
+  def getId(self) -> str:
+    return self._id
+
+  def matchesRequest(self, request : Tw_Request) -> bool:
+    return self._valueBytes in getRequestCache(request).getHeaders().get(self._nameBytes, ())
+
+class HeaderPatternMatcher (Matcher):
+  # Matches when the regular expression matches the whole of any value given
+  # for the header
+  cost = 6.0
+
+  def __init__(self, name : str, pattern : str):
+    super().__init__(None)
+    if name == None or pattern == None:
+      raise ValueError()
+    self.name = name
+    self.pattern = pattern
+    self._id = "HEADER {} ~ {}".format(name, pattern)
+    self._nameBytes = name.lower().encode("latin-1")
+    self._regex = re.compile(pattern.encode("latin-1"))
+
+  def getId(self) -> str:
+    return self._id
+
+  def matchesRequest(self, request : Tw_Request) -> bool:
+    for value in getRequestCache(request).getHeaders().get(self._nameBytes, ()):
+      if self._regex.fullmatch(value) != None:
+        return True
+    return False
+
+class ContentTypeMatcher (Matcher):
+  # Matches a media type such as application/json, application/* or
+  # text/plain; charset=utf-8, where every parameter given must be sent too
+  cost = 3.0
+
+  def __init__(self, mediaType : str):
+    super().__init__(None)
+    self.mediaType = mediaType
+    self._mainType, self._subtype, self._parameters = parseMediaTypeText(mediaType)
+    self._id = "CONTENT-TYPE {}".format(mediaType)
+    self.routingGuard = None
+    if self._mainType != b"*" and self._subtype != b"*":
+      self.routingGuard = (contentTypeEssence, b"content-type", self._mainType + b"/" + self._subtype)
+
+  def getId(self) -> str:
+    return self._id
+
+  def matchesRequest(self, request : Tw_Request) -> bool:
+    requestType = getRequestCache(request).getDerived(_parseContentType, _parseContentType)
+    if requestType == None:
+      return False
+    mainType, subtype, parameters = requestType
+    if (self._mainType != b"*" and self._mainType != mainType) or (self._subtype != b"*" and self._subtype != subtype):
+      return False
+    for name, value in self._parameters.items():
+      if parameters.get(name) != value:
+        return False
+    return True
+
+class AcceptMatcher (Matcher):
+  # Matches requests accepting the media type the stub responds with. The most
+  # specific media range including the type decides its quality, and requests
+  # without an Accept header accept every type.
+  cost = 5.0
+
+  def __init__(self, mediaType : str, minimumQuality : float = 0.001):
+    super().__init__(None)
+    self.mediaType = mediaType
+    self._mainType, self._subtype, self._parameters = parseMediaTypeText(mediaType)
+    if self._mainType == b"*" or self._subtype == b"*":
+      raise ValueError("The media type of an AcceptMatcher cannot be a range")
+    if not 0 < minimumQuality <= 1:
+      raise ValueError()
+    self.minimumQuality = minimumQuality
+    self._id = "ACCEPT {} q>={}".format(mediaType, minimumQuality)
+
+  def getId(self) -> str:
+    return self._id
+
+  def getQuality(self, request : Tw_Request) -> float:
+    ranges = getRequestCache(request).getDerived(_parseAccept, _parseAccept)
+    if ranges == None:
+      return 1.0
+    bestSpecificity = -1
+    quality = 0.0
+    for mainType, subtype, parameters, rangeQuality in ranges:
+      if mainType != b"*" and mainType != self._mainType:
+        continue
+      if subtype != b"*" and subtype != self._subtype:
+        continue
+      if any(self._parameters.get(name) != value for name, value in parameters.items()):
+        continue
+      specificity = (mainType != b"*") + (subtype != b"*") + len(parameters)
+      if specificity > bestSpecificity:
+        bestSpecificity = specificity
+        quality = rangeQuality
+    return quality
+
+  def matchesRequest(self, request : Tw_Request) -> bool:
+    return self.getQuality(request) >= self.minimumQuality
+
+class CookieMatcher (Matcher):
+  # Matches when the cookie is sent, with the given value if there is one
+  cost = 4.0
+
+  def __init__(self, name : str, value : Optional[str] = None):
+    super().__init__(None)
+    if name == None:
+      raise ValueError()
+    self.name = name
+    self.value = value
+    self._id = "COOKIE {}".format(name) if value == None else "COOKIE {}={}".format(name, value)
+    self._nameBytes = name.encode("latin-1")
+    self._valueBytes = value.encode("latin-1") if value != None else None
+
+  def getId(self) -> str:
+    return self._id
+
+  def matchesRequest(self, request : Tw_Request) -> bool:
+    cookies = getRequestCache(request).getDerived(_parseCookies, _parseCookies)
+    value = cookies.get(self._nameBytes)
+    return value != None and (self._valueBytes == None or value == self._valueBytes)
@@ -1,5 +1,116 @@
-# Will contain:
-#   logic matchers such as
-#     and
-#     or
-#     not
\ No newline at end of file
+# Contains the logic matchers:
+#   and, or and not
+# and the ordering shared with stubs, which evaluates the matchers of a
+# conjunction or disjunction cheapest and most decisive first. Matchers start
+# ordered by their static cost, then by how often each was seen deciding the
+# outcome, re-estimated at intervals from counts halved each time so the
+# order keeps following the traffic.
+
+from typing import Iterable, List
+
+from twisted.web.server import Request as Tw_Request
+
+from mockwebserver.matching.matcher import Matcher
+
+class MatcherOrder:
+  refreshInterval = 1024
+
+  def __init__(self, matchers : Iterable[Matcher], conjunction : bool = True, adaptive : bool = True):
+    self.matchers = list(matchers)
+    for matcher in self.matchers:
+      if not isinstance(matcher, Matcher):
+        raise ValueError()
+    # Conjunctions stop at the first miss, disjunctions at the first match
+    self.conjunction = conjunction
+    self.adaptive = adaptive
+    self._costs = [matcher.cost if isinstance(matcher.cost, (int, float)) else Matcher.cost for matcher in self.matchers]
+    # What evaluating every matcher costs, such as for a matcher combining them
+    self.totalCost = sum(self._costs)
+    # Evaluations and matches of each matcher, by position in matchers
+    self._evaluations = [0] * len(self.matchers)
+    self._matches = [0] * len(self.matchers)
+    self._countdown = self.refreshInterval
+    self._order = ()
+    self._reorder()
+
+  def getOrder(self) -> List[Matcher]:
+    return [self.matchers[index] for index in self._order]
+
+  def evaluate(self, request : Tw_Request) -> bool:
+    if not self.adaptive:
+      for index in self._order:
+        if bool(self.matchers[index].matchesRequest(request)) != self.conjunction:
+          return not self.conjunction
+      return self.conjunction
+    self._countdown -= 1
+    if self._countdown <= 0:
+      self._reorder()
+    # Counts may be lost to races between threads, which only skews the
+    # estimates slightly
+    for index in self._order:
+      result = bool(self.matchers[index].matchesRequest(request))
+      self._evaluations[index] += 1
+      if result:
+        self._matches[index] += 1
+      if result != self.conjunction:
+        return result
+    return self.conjunction
+
+  def _reorder(self):
+    # Orders by the cost of each evaluation deciding the outcome, with the pass
+    # rate smoothed towards one half while there are few observations
+    ranks = []
+    for index, cost in enumerate(self._costs):
+      passRate = (self._matches[index] + 1) / (self._evaluations[index] + 2)
+      decisive = (1 - passRate) if self.conjunction else passRate
+      ranks.append((cost / max(decisive, 0.01), index))
+      self._evaluations[index] //= 2
+      self._matches[index] //= 2
+    self._order = tuple(index for _, index in sorted(ranks))
+    self._countdown = self.refreshInterval
+
+class _LogicMatcher (Matcher):
+  def __init__(self, name : str, matchers : Iterable[Matcher], conjunction : bool):
+    super().__init__(None)
+    matchers = list(matchers)
+    if len(matchers) == 0:
+      raise ValueError()
+    self._matcherOrder = MatcherOrder(matchers, conjunction)
+    self.matchers = self._matcherOrder.matchers
+    self.cost = self._matcherOrder.totalCost
+    self._id = "{}({})".format(name, ", ".join(matcher.getId() for matcher in self.matchers))
+
+  def getId(self) -> str:
+    return self._id
+
+  def matchesRequest(self, request : Tw_Request) -> bool:
+    return self._matcherOrder.evaluate(request)
+
+class AndMatcher (_LogicMatcher):
+  def __init__(self, *matchers : Matcher):
+    super().__init__("AND", matchers, True)
+    # Every matcher must match, so the guard of any of them applies
+    self.routingGuard = None
+    for matcher in self.matchers:
+      self.routingGuard = getattr(matcher, "routingGuard", None)
+      if self.routingGuard != None:
+        break
+
+class OrMatcher (_LogicMatcher):
+  def __init__(self, *matchers : Matcher):
+    super().__init__("OR", matchers, False)
+
+class NotMatcher (Matcher):
+  def __init__(self, matcher : Matcher):
+    super().__init__(None)
+    if not isinstance(matcher, Matcher):
+      raise ValueError()
+    self.matcher = matcher
+    self.cost = matcher.cost
+    self._id = "NOT({})".format(matcher.getId())
+
+  def getId(self) -> str:
+    return self._id
+
+  def matchesRequest(self, request : Tw_Request) -> bool:
+    return not self.matcher.matchesRequest(request)
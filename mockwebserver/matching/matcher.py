@@ -9,9 +9,14 @@ from typing import Tuple, Union, Any
 
 from twisted.web.server import Request as Tw_Request
 
+from mockwebserver.extraction.cache import getRequestCache
 from mockwebserver.extraction.extractor import Extract, Extractor, PathExtractor, QueryExtractor
 
 class Matcher:
+  # The relative cost of evaluating the matcher, which orders the matchers of
+  # a stub until statistics of their outcomes are gathered
+  cost = 10.0
+
   def __init__(self, extractor : Extractor):
     self._extractor = extractor
 
@@ -19,26 +24,38 @@ class Matcher:
     return self._extractor.getId()
 
   def matchesRequest(self, request : Tw_Request) -> bool:
-    result = self._extractor.extractData(request)
+    result = getRequestCache(request).getExtract(self._extractor)
     return isinstance(result, Extract)
 
 class PathMatcher (Matcher):
+  cost = 10.0
+
   def __init__(self, pattern : str):
     super().__init__(PathExtractor(pattern))
     self.pattern = pattern
 
+  @classmethod
+  def fromExtractor(cls, extractor : PathExtractor) -> "PathMatcher":
+    # Shares the compiled pattern of an extractor rather than compiling it again
+    matcher = cls.__new__(cls)
+    Matcher.__init__(matcher, extractor)
+    matcher.pattern = extractor.pattern
+    return matcher
+
 class Method (Enum):
-  GET = "GET",
-  HEAD = "HEAD",
-  POST = "POST",
-  PUT = "PUT",
-  DELETE = "DELETE",
-  CONNECT = "CONNECT",
-  OPTIONS = "OPTIONS",
-  TRACE = "TRACE",
+  GET = "GET"
+  HEAD = "HEAD"
+  POST = "POST"
+  PUT = "PUT"
+  DELETE = "DELETE"
+  CONNECT = "CONNECT"
+  OPTIONS = "OPTIONS"
+  TRACE = "TRACE"
   PATCH = "PATCH"
 
 class MethodMatcher (Matcher):
+  cost = 1.0
+
   def __init__(self, method : Union[Method, str]):
     super().__init__(None)
     if isinstance(method, str):
@@ -46,14 +63,26 @@ class MethodMatcher (Matcher):
     elif method == None:
       raise ValueError()
     self.method = method
+    self.methodName = method.value
+    self._methodBytes = self.methodName.encode("ascii")
 
   def getId(self) -> str:
     return "METHOD {}".format(self.method.value)
 
   def matchesRequest(self, request: Tw_Request) -> bool:
-    return request.method == bytes(self.method.value)
+    return request.method == self._methodBytes
 
 class QueryMatcher (Matcher):
+  cost = 15.0
+
   def __init__(self, matchSubset : bool = True, *parameters : Tuple[str, Any]):
     super().__init__(QueryExtractor(matchSubset, *parameters))
-    self.parameters = parameters
\ No newline at end of file
+    self.parameters = parameters
+
+  @classmethod
+  def fromExtractor(cls, extractor : QueryExtractor) -> "QueryMatcher":
+    # Shares the compiled patterns of an extractor rather than compiling them again
+    matcher = cls.__new__(cls)
+    Matcher.__init__(matcher, extractor)
+    matcher.parameters = extractor.parameters
+    return matcher
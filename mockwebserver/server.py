@@ -1,18 +1,129 @@
-from twisted.internet import reactor as Tw_reactor, endpoints as Tw_endpoints
+import os
+from http.client import SERVICE_UNAVAILABLE
+from typing import Optional, Dict, Callable
+
+from twisted.internet import endpoints as Tw_endpoints
+from twisted.python.threadpool import ThreadPool as Tw_ThreadPool
 from twisted.web.server import Site as Tw_Site
 
+from mockwebserver.core.admin import ReservedPathRouter, AdminResource
+from mockwebserver.core.admission import AdmissionController
+from mockwebserver.core.execution import ExecutionPolicy, Executor
+from mockwebserver.core.journal import RequestJournal
+from mockwebserver.core.metrics import ServerMetrics, MetricsResource
+from mockwebserver.core.persistence import JsonlJournalSink
+from mockwebserver.core.profiling import ProfileResource
 from mockwebserver.core.stub import StubManager
 from mockwebserver.core.request import RequestDelegator
+from mockwebserver.core.workers import WorkerSupervisor, listenReusePort
+
+# The reactor is only imported once serving starts, so worker processes can be
+# forked before it exists
 
 class MockWebServer:
-  def __init__(self, port : int, backlog : int = 50):
+  def __init__(self, \
+               port : int, \
+               backlog : int = 50, \
+               executionPolicy : ExecutionPolicy = ExecutionPolicy.THREAD_POOL, \
+               maxThreads : int = 10, \
+               processes : Optional[int] = None, \
+               maxInFlight : Optional[int] = 100, \
+               maxQueued : int = 1000, \
+               rejectionCode : int = SERVICE_UNAVAILABLE, \
+               workers : int = 1, \
+               journalCapacity : Optional[int] = 10000, \
+               journalSink : Optional[JsonlJournalSink] = None, \
+               metricsPath : Optional[str] = "/__admin/metrics", \
+               profilePath : Optional[str] = None, \
+               profileDirectory : Optional[str] = None, \
+               bestMatch : bool = False, \
+               adminPath : Optional[str] = None):
+    if workers < 1:
+      raise ValueError()
+    # Every worker process has stubs of its own, which an admin request could
+    # only change in the worker it reached
+    if adminPath != None and workers > 1:
+      raise ValueError("The admin API needs a single worker")
+    if journalSink != None and journalCapacity == None:
+      raise ValueError()
     self.port = port
     self.backlog = backlog
-    self._stubManager = StubManager()
-    self._requestDelegator = RequestDelegator(self._stubManager)
-    self._endpoint = Tw_endpoints.TCP4ServerEndpoint(Tw_reactor, port, backlog)
-
-  def run(self):
-    site = Tw_Site(self._requestDelegator)
-    self._endpoint.listen(site)
-    Tw_reactor.run()
\ No newline at end of file
+    self.executionPolicy = executionPolicy
+    self.workers = workers
+    self._stubManager = StubManager(bestMatch)
+    self._threadPool = Tw_ThreadPool(0, maxThreads, "MockWebServer")
+    self._executor = Executor(self._threadPool, processes)
+    self._admission = AdmissionController(maxInFlight, maxQueued)
+    # Each worker process keeps a journal of its own requests
+    self._journal = RequestJournal(journalCapacity, sink=journalSink) if journalCapacity != None else None
+    self._journalSink = journalSink
+    self._metrics = ServerMetrics()
+    self._metrics.addGauges("admission", self._admission.getGauges)
+    self._metrics.addCounters("admission", self._admission.getCounters)
+    self._metrics.setRenderCacheSource(self._stubManager.getRenderCacheStats)
+    if journalSink != None:
+      self._metrics.addGauges("journal_sink", journalSink.getStats)
+    self._requestDelegator = RequestDelegator(
+      self._stubManager, self._executor, executionPolicy, self._admission, rejectionCode, self._journal, self._metrics
+    )
+    # Reserved paths are answered by the server rather than by the stubs
+    self._router = ReservedPathRouter(self._requestDelegator)
+    if metricsPath != None:
+      self._router.addRoute(metricsPath, MetricsResource(self._metrics))
+    # Profiling is opt-in, as anyone reaching the server could start it
+    if profilePath != None:
+      self._router.addRoute(profilePath, ProfileResource(profileDirectory, executor=self._executor))
+    # Likewise the admin API, mounted on a prefix such as /__admin below which
+    # the routes above still take precedence
+    if adminPath != None:
+      self._router.addPrefixRoute(adminPath, AdminResource(adminPath, self._stubManager, self._journal, self._executor))
+    self._supervisor = None
+
+  def getStubManager(self) -> StubManager:
+    return self._stubManager
+
+  def getJournal(self) -> Optional[RequestJournal]:
+    return self._journal
+
+  def getMetrics(self) -> ServerMetrics:
+    return self._metrics
+
+  def run(self) -> Optional[Dict[int, int]]:
+    if self.workers > 1:
+      # Every worker is forked with a copy of the stubs added so far
+      self._supervisor = WorkerSupervisor(self.workers, self._serveWorker)
+      return self._supervisor.run()
+    self._serve(False)
+    return None
+
+  def stop(self):
+    if self._supervisor != None:
+      self._supervisor.stop()
+    else:
+      from twisted.internet import reactor as Tw_reactor
+      Tw_reactor.callFromThread(Tw_reactor.stop)
+
+  def _serveWorker(self, ready : Callable[[], None]):
+    self._serve(True, ready)
+
+  def _serve(self, reusePort : bool, ready : Optional[Callable[[], None]] = None):
+    from twisted.internet import reactor as Tw_reactor
+    site = Tw_Site(self._router)
+    if reusePort:
+      listenReusePort(Tw_reactor, self.port, self.backlog, site)
+    else:
+      Tw_endpoints.TCP4ServerEndpoint(Tw_reactor, self.port, self.backlog).listen(site)
+    if ready != None:
+      ready()
+    self._threadPool.start()
+    if self._journalSink != None:
+      # Worker processes each append to a file of their own
+      self._journalSink.start("{}.{}".format(self._journalSink.path, os.getpid()) if reusePort else None)
+    Tw_reactor.addSystemEventTrigger("during", "shutdown", self._shutdown)
+    Tw_reactor.run()
+
+  def _shutdown(self):
+    self._threadPool.stop()
+    self._executor.shutdown()
+    if self._journalSink != None:
+      self._journalSink.close()
@@ -1,20 +1,58 @@
 # Will contain:
 #   general user-facing global functions for stubs
 #   the base stub class that all stubs should be derived from
+#   the base class of the stubs matching requests with a list of matchers
 #   the default stub class that can be derived from (will still have to implement the render function)
+#   the static stub class answering with a fixed, pre-encoded response
+#   the file stub class serving a memory-mapped fixture file
 
-from typing import Callable, Dict, Any, Union
+from http.client import OK, PARTIAL_CONTENT, REQUESTED_RANGE_NOT_SATISFIABLE, responses
+from typing import Callable, Dict, Any, Union, Tuple, Optional, List, Iterable
 
 from twisted.web.server import Request as Tw_Request
 
+from mockwebserver.core.delay import Delay
+from mockwebserver.core.execution import ExecutionPolicy
+from mockwebserver.core.files import MappedFile, UnsatisfiableRange, parseByteRange
+from mockwebserver.core.memoization import RenderCache
+from mockwebserver.core.streaming import isStream
+from mockwebserver.extraction.cache import getRequestCache
 from mockwebserver.extraction.extractor import Extractor
+from mockwebserver.matching.logic import MatcherOrder
 from mockwebserver.matching.matcher import Matcher
 
+class Response:
+  # Header values may be a list of values for headers sent more than once. The
+  # body may also be an iterator or async iterator of bytes chunks, which is
+  # streamed with chunked transfer encoding.
+  def __init__(self, body : Any = b"", code : int = OK, headers : Optional[Dict[bytes, Union[bytes, List[bytes]]]] = None):
+    if not isinstance(body, bytes) and not isStream(body):
+      raise ValueError()
+    self.body = body
+    self.code = code
+    self.headers = headers if headers != None else {}
+
 class Stub:
-  def __init__(self, stubId : str):
+  def __init__(self, \
+               stubId : str, \
+               executionPolicy : Optional[ExecutionPolicy] = None, \
+               delay : Optional[Delay] = None, \
+               bandwidth : Optional[int] = None, \
+               priority : int = 0):
     if stubId == None:
       raise ValueError()
+    if bandwidth != None and bandwidth < 1:
+      raise ValueError()
     self.id = stubId
+    self.executionPolicy = executionPolicy
+    self.renderCache = None
+    # Responses wait for the delay once rendered and are then sent at no more
+    # than bandwidth bytes per second
+    self.delay = delay
+    self.bandwidth = bandwidth
+    # Stubs with a higher priority are preferred when the most specific stub
+    # matching a request is looked for
+    self.priority = priority
 
   def render(self, request : Tw_Request, data : Dict[str, Any]):
     raise NotImplementedError()
@@ -25,39 +63,173 @@ class Stub:
   def extractData(self, request : Tw_Request) -> Dict[str, Any]:
     raise NotImplementedError()
 
-class DefaultStub (Stub):
+  def matchAndExtractData(self, request : Tw_Request) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    if not self.matchesRequest(request):
+      return False, None
+    return True, self.extractData(request)
+
+class MatcherStub (Stub):
+  # Matchers are evaluated cheapest and most selective first, unless they
+  # depend on being evaluated in the order given
   def __init__(self, \
                stubId : str, \
-               renderCallable : Callable[[Tw_Request, Dict[str, Any]], Any], \
-               *objects : Union[Matcher, Extractor]):
-    super().__init__(stubId)
-    if renderCallable == None:
+               matchers : Iterable[Matcher], \
+               executionPolicy : Optional[ExecutionPolicy] = None, \
+               delay : Optional[Delay] = None, \
+               bandwidth : Optional[int] = None, \
+               orderMatchers : bool = True, \
+               priority : int = 0):
+    super().__init__(stubId, executionPolicy, delay, bandwidth, priority)
+    self.matchers = list(matchers)
+    for matcher in self.matchers:
+      if not isinstance(matcher, Matcher):
+        raise ValueError()
+    self._matcherOrder = MatcherOrder(self.matchers) if orderMatchers and len(self.matchers) > 1 else None
+
+  def matchesRequest(self, request : Tw_Request) -> bool:
+    if request == None:
       raise ValueError()
-    self.renderCallable = renderCallable
-    self.matchers = []
+    if self._matcherOrder != None:
+      return self._matcherOrder.evaluate(request)
+    for matcher in self.matchers:
+      if not matcher.matchesRequest(request):
+        return False
+    return True
+
+class DefaultStub (MatcherStub):
+  def __init__(self, \
+               stubId : str, \
+               renderCallable : Callable[[Tw_Request, Dict[str, Any]], Any], \
+               *objects : Union[Matcher, Extractor], \
+               executionPolicy : Optional[ExecutionPolicy] = None, \
+               deterministic : bool = False, \
+               renderCacheBytes : int = 1 << 20, \
+               delay : Optional[Delay] = None, \
+               bandwidth : Optional[int] = None, \
+               orderMatchers : bool = True, \
+               priority : int = 0):
+    matchers = []
     self.extractors = []
     for obj in objects:
       if isinstance(obj, Matcher):
-        self.matchers.append(obj)
+        matchers.append(obj)
       elif isinstance(obj, Extractor):
         self.extractors.append(obj)
       else:
         raise ValueError()
+    super().__init__(stubId, matchers, executionPolicy, delay, bandwidth, orderMatchers, priority)
+    if renderCallable == None:
+      raise ValueError()
+    # Deterministic stubs render the same response for the same extracted data
+    if deterministic:
+      self.renderCache = RenderCache(renderCacheBytes)
+    self.renderCallable = renderCallable
+
+  def extractData(self, request: Tw_Request) -> Dict[str, Any]:
+    return self._extractWithCache(getRequestCache(request))
 
-  def matchesRequest(self, request: Tw_Request) -> bool:
+  def matchAndExtractData(self, request : Tw_Request) -> Tuple[bool, Optional[Dict[str, Any]]]:
     if request == None:
       raise ValueError()
-    for matcher in self.matchers:
-      if not matcher.matchesRequest(request):
-        return False
-    return True
+    # Matchers and extractors sharing an ID share the extract in the cache
+    if not self.matchesRequest(request):
+      return False, None
+    return True, self._extractWithCache(getRequestCache(request))
 
-  def extractData(self, request: Tw_Request) -> Dict[str, Any]:
+  def _extractWithCache(self, cache) -> Dict[str, Any]:
     data = {}
     for extractor in self.extractors:
-      if not extractor.getId() in data:
-        data[extractor.getId()] = extractor.extractData(request)
+      extractorId = extractor.getId()
+      if not extractorId in data:
+        data[extractorId] = cache.getExtract(extractor)
     return data
 
   def render(self, request : Tw_Request, data : Dict[str, Any]):
-    return self.renderCallable(request, data)
\ No newline at end of file
+    return self.renderCallable(request, data)
+
+class StaticStub (MatcherStub):
+  # Answers with a fixed response, encoded once when the stub is created, so
+  # that it can be written straight to the connection on the reactor thread
+  def __init__(self, \
+               stubId : str, \
+               *matchers : Matcher, \
+               code : int = OK, \
+               headers : Optional[Dict[bytes, Union[bytes, List[bytes]]]] = None, \
+               body : bytes = b"", \
+               delay : Optional[Delay] = None, \
+               bandwidth : Optional[int] = None, \
+               orderMatchers : bool = True, \
+               priority : int = 0):
+    super().__init__(stubId, matchers, ExecutionPolicy.INLINE, delay, bandwidth, orderMatchers, priority)
+    headers = {name.lower(): value for name, value in (headers if headers != None else {}).items()}
+    headers[b"content-length"] = b"%d" % len(body)
+    self.response = Response(body, code, headers)
+    statusLine = b"HTTP/1.1 %d %s\r\n" % (code, responses.get(code, "Unknown Status").encode("ascii"))
+    headerLines = []
+    for name, value in headers.items():
+      for item in (value if isinstance(value, list) else [value]):
+        headerLines.append(b"%s: %s\r\n" % (name, item))
+    # Without the blank line ending the headers, so a connection header can
+    # still be appended for clients which asked for the connection to close
+    self.head = statusLine + b"".join(headerLines)
+    self.encoded = self.head + b"\r\n" + body
+
+  def extractData(self, request : Tw_Request) -> Dict[str, Any]:
+    return {}
+
+  def render(self, request : Tw_Request, data : Dict[str, Any]) -> Response:
+    return self.response
+
+class FileStub (MatcherStub):
+  # Serves a fixture file mapped into memory once and shared by every request,
+  # answering Range requests with partial content
+  def __init__(self, \
+               stubId : str, \
+               path : str, \
+               *matchers : Matcher, \
+               code : int = OK, \
+               headers : Optional[Dict[bytes, Union[bytes, List[bytes]]]] = None, \
+               chunkSize : int = 1 << 16, \
+               delay : Optional[Delay] = None, \
+               bandwidth : Optional[int] = None, \
+               orderMatchers : bool = True, \
+               priority : int = 0):
+    super().__init__(stubId, matchers, ExecutionPolicy.INLINE, delay, bandwidth, orderMatchers, priority)
+    if chunkSize < 1:
+      raise ValueError()
+    self.code = code
+    self.headers = {name.lower(): value for name, value in (headers if headers != None else {}).items()}
+    # Ranges only apply to successful responses
+    if code == OK:
+      self.headers[b"accept-ranges"] = b"bytes"
+    self.chunkSize = chunkSize
+    self.file = MappedFile(path)
+
+  def extractData(self, request : Tw_Request) -> Dict[str, Any]:
+    return {}
+
+  def render(self, request : Tw_Request, data : Dict[str, Any]) -> Response:
+    size = self.file.size
+    headers = dict(self.headers)
+    code = self.code
+    start, end = 0, size
+    if code == OK:
+      try:
+        byteRange = parseByteRange(request.getHeader(b"range"), size)
+      except UnsatisfiableRange:
+        headers[b"content-range"] = b"bytes */%d" % size
+        return Response(b"", REQUESTED_RANGE_NOT_SATISFIABLE, headers)
+      if byteRange != None:
+        start, end = byteRange
+        code = PARTIAL_CONTENT
+        headers[b"content-range"] = b"bytes %d-%d/%d" % (start, end - 1, size)
+    headers[b"content-length"] = b"%d" % (end - start)
+    if request.method == b"HEAD":
+      # An empty stream keeps the length of the body which is not sent
+      return Response(iter(()), code, headers)
+    if end - start <= self.chunkSize:
+      return Response(self.file.read(start, end), code, headers)
+    return Response(self.file.chunks(start, end, self.chunkSize), code, headers)
+
+  def close(self):
+    self.file.close()
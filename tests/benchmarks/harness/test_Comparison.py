@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.harness import Measurement, Comparison, compare, createRequest, formatReport, loadBaseline, saveBaseline, timeOperation
+
+class TestComparison (unittest.TestCase):
+  def testLowerIsBetter(self):
+    self.assertEqual(Comparison("a", Measurement(1.2, "s/op"), Measurement(1.0, "s/op"), 0.1).status, "regressed")
+    self.assertEqual(Comparison("a", Measurement(0.8, "s/op"), Measurement(1.0, "s/op"), 0.1).status, "improved")
+    self.assertEqual(Comparison("a", Measurement(1.05, "s/op"), Measurement(1.0, "s/op"), 0.1).status, "unchanged")
+
+  def testHigherIsBetter(self):
+    comparison = Comparison("a", Measurement(120.0, "req/s", True), Measurement(100.0, "req/s", True), 0.1)
+
+    self.assertAlmostEqual(comparison.change, 0.2)
+    self.assertEqual(comparison.status, "improved")
+
+  def testWithoutBaseline(self):
+    comparison = compare({"a": Measurement(1.0, "s/op")}, {})[0]
+
+    self.assertIsNone(comparison.change)
+    self.assertEqual(comparison.status, "new")
+
+  def testFormatReport(self):
+    comparisons = compare({"a": Measurement(2e-6, "s/op")}, {"a": Measurement(1e-6, "s/op")})
+
+    report = formatReport(comparisons, {"b": "TypeError: bad"})
+
+    self.assertRegex(report, r"a\s+2\.000 us\s+1\.000 us\s+-100\.0%\s+regressed")
+    self.assertIn("b          failed: TypeError: bad", report)
+
+class TestBaseline (unittest.TestCase):
+  def testSaveAndLoad(self):
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, "baseline.json")
+      saveBaseline(path, {"a": Measurement(1.0, "s/op"), "b": Measurement(5.0, "req/s", True)})
+
+      saveBaseline(path, {"a": Measurement(2.0, "s/op")})
+      baseline = loadBaseline(path)
+
+    self.assertEqual(baseline["a"].value, 2.0)
+    self.assertEqual(baseline["b"].value, 5.0)
+    self.assertTrue(baseline["b"].higherIsBetter)
+
+  def testLoadMissing(self):
+    self.assertDictEqual(loadBaseline("/nonexistent/baseline.json"), {})
+
+class TestTimeOperation (unittest.TestCase):
+  def testFreshInputs(self):
+    seen = []
+
+    measurement = timeOperation(seen.append, object, minSeconds=0.001, repeat=3)
+
+    self.assertEqual(measurement.unit, "s/op")
+    self.assertGreater(measurement.value, 0)
+    self.assertEqual(len(set(map(id, seen))), len(seen))
+
+  def testCreateRequest(self):
+    request = createRequest(b"GET", b"/users?page=1&page=2", {b"accept": b"text/plain"})
+
+    self.assertEqual(request.path, b"/users")
+    self.assertDictEqual(request.args, {b"page": [b"1", b"2"]})
+    self.assertEqual(request.getHeader(b"accept"), b"text/plain")
+
+if __name__ == "__main__":
+  unittest.main()
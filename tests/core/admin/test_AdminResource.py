@@ -0,0 +1,148 @@
+import io
+import json
+import unittest
+from unittest import mock
+
+from twisted.internet.defer import succeed as Tw_succeed, fail as Tw_fail
+
+from mockwebserver.core.admin import AdminResource
+from mockwebserver.core.execution import ExecutionPolicy, Executor
+from mockwebserver.core.journal import RequestJournal
+from mockwebserver.core.stub import StubManager, JsonStubLoader
+
+def createRequest(method, path, body=None, args={}):
+  request = mock.NonCallableMock()
+  request.method = method
+  request.path = path
+  request.uri = path
+  request.args = args
+  request.content = io.BytesIO(json.dumps(body).encode("utf-8")) if body != None else io.BytesIO()
+  request.getHeader = mock.Mock(return_value=None)
+  request.finished = False
+  request._disconnected = False
+  return request
+
+def deferInline(function, *args):
+  try:
+    return Tw_succeed(function(*args))
+  except Exception as error:
+    return Tw_fail(error)
+
+class TestAdminResource (unittest.TestCase):
+  def setUp(self):
+    self.stubManager = StubManager()
+    self.stubManager.addStubs(JsonStubLoader([]).compile([
+      {"id": "health", "request": {"path": "/health"}},
+      {"id": "users", "request": {"path": "/users"}}
+    ]))
+    self.journal = RequestJournal(10)
+    self.executor = mock.NonCallableMock(Executor)
+    self.executor.execute = mock.Mock(side_effect=lambda policy, function, *args: deferInline(function, *args))
+    self.resource = AdminResource("/__admin", self.stubManager, self.journal, self.executor)
+
+  def render(self, request):
+    body = self.resource.render(request)
+    if not isinstance(body, bytes):
+      body = request.write.call_args[0][0]
+    return request.setResponseCode.call_args[0][0], json.loads(body)
+
+  def testInitWithNoStubManager(self):
+    self.assertRaises(ValueError, AdminResource, "/__admin", None)
+
+  def testGetStubs(self):
+    code, document = self.render(createRequest(b"GET", b"/__admin/stubs"))
+
+    self.assertEqual(code, 200)
+    self.assertListEqual(document["stubs"], [{"id": "health", "priority": 0}, {"id": "users", "priority": 0}])
+
+  def testPostStubsAppliesBatch(self):
+    batch = {
+      "add": [{"id": "orders", "request": {"path": "/orders"}}, {"id": "health"}],
+      "replace": [{"id": "users", "request": {"path": "/people"}}],
+      "remove": ["health", "missing"]
+    }
+    request = createRequest(b"POST", b"/__admin/stubs", batch)
+
+    code, document = self.render(request)
+
+    self.assertEqual(code, 200)
+    self.assertListEqual(document["added"], [{"success": True, "error": ""}, {"success": True, "error": ""}])
+    self.assertListEqual(document["replaced"], [{"success": True, "error": ""}])
+    self.assertListEqual(document["removed"], ["health", None])
+    self.assertListEqual([stub.id for stub in self.stubManager.getStubs()], ["users", "orders", "health"])
+    request.finish.assert_called_once_with()
+    self.executor.execute.assert_called_once_with(
+      ExecutionPolicy.THREAD_POOL, self.resource.applyBatch, batch["add"], batch["replace"], batch["remove"]
+    )
+
+  def testPostStubsWithInvalidDefinitionChangesNothing(self):
+    snapshot = self.stubManager.getSnapshot()
+    batch = {"add": [{"id": "orders"}, {"request": {}}], "remove": ["health"]}
+
+    code, document = self.render(createRequest(b"POST", b"/__admin/stubs", batch))
+
+    self.assertEqual(code, 400)
+    self.assertIn("definition 1", document["error"])
+    self.assertIs(self.stubManager.getSnapshot(), snapshot)
+
+  def testPostStubsWithInvalidDocument(self):
+    for body in ([], {"add": {}}, {"delete": []}):
+      code, _ = self.render(createRequest(b"POST", b"/__admin/stubs", body))
+      self.assertEqual(code, 400)
+    request = createRequest(b"POST", b"/__admin/stubs")
+    request.content = io.BytesIO(b"{")
+    self.assertEqual(self.render(request)[0], 400)
+
+  def testDeleteStubs(self):
+    code, document = self.render(createRequest(b"DELETE", b"/__admin/stubs"))
+
+    self.assertEqual(code, 200)
+    self.assertEqual(document["removed"], 2)
+    self.assertTupleEqual(self.stubManager.getStubs(), ())
+
+  def testPostReset(self):
+    self.journal.record(createRequest(b"GET", b"/health"), "health")
+
+    code, document = self.render(createRequest(b"POST", b"/__admin/reset"))
+
+    self.assertEqual(code, 200)
+    self.assertEqual(document["removed"], 2)
+    self.assertEqual(len(self.journal), 0)
+
+  def testGetJournal(self):
+    self.journal.record(createRequest(b"GET", b"/health"), "health")
+    self.journal.record(createRequest(b"POST", b"/users"), "users")
+    self.journal.record(createRequest(b"GET", b"/missing"), None)
+
+    _, document = self.render(createRequest(b"GET", b"/__admin/journal", args={b"method": [b"get"]}))
+    self.assertListEqual([entry["path"] for entry in document["entries"]], ["/health", "/missing"])
+    _, document = self.render(createRequest(b"GET", b"/__admin/journal", args={b"unmatched": [b"1"]}))
+    self.assertListEqual([entry["path"] for entry in document["entries"]], ["/missing"])
+    _, document = self.render(createRequest(b"GET", b"/__admin/journal/count", args={b"stubId": [b"users"]}))
+    self.assertEqual(document["count"], 1)
+
+  def testGetJournalWithInvalidArguments(self):
+    code, _ = self.render(createRequest(b"GET", b"/__admin/journal", args={b"limit": [b"0"]}))
+    self.assertEqual(code, 400)
+    code, _ = self.render(createRequest(b"GET", b"/__admin/journal", args={b"unmatched": [b"1"], b"path": [b"/"]}))
+    self.assertEqual(code, 400)
+
+  def testGetJournalWithoutJournal(self):
+    resource = AdminResource("/__admin", self.stubManager)
+    request = createRequest(b"GET", b"/__admin/journal")
+
+    resource.render(request)
+
+    request.setResponseCode.assert_called_once_with(404)
+
+  def testRenderUnknownPath(self):
+    self.assertEqual(self.render(createRequest(b"GET", b"/__admin/unknown"))[0], 404)
+
+  def testRenderUnsupportedMethod(self):
+    request = createRequest(b"PUT", b"/__admin/journal")
+
+    self.assertEqual(self.render(request)[0], 405)
+    request.setHeader.assert_any_call(b"allow", b"GET, DELETE")
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+from unittest import mock
+
+from mockwebserver.core.admin import ReservedPathRouter
+
+class TestReservedPathRouter (unittest.TestCase):
+  def setUp(self):
+    self.fallback = mock.NonCallableMock()
+    self.fallback.render = mock.Mock(return_value=b"stub")
+    self.resource = mock.NonCallableMock()
+    self.resource.render = mock.Mock(return_value=b"reserved")
+    self.router = ReservedPathRouter(self.fallback)
+    self.router.addRoute("/__admin/metrics", self.resource)
+
+  def testRenderReservedPath(self):
+    request = mock.NonCallableMock()
+    request.path = b"/__admin/metrics"
+
+    self.assertEqual(self.router.render(request), b"reserved")
+    self.resource.render.assert_called_once_with(request)
+    self.fallback.render.assert_not_called()
+
+  def testRenderOtherPath(self):
+    request = mock.NonCallableMock()
+    request.path = b"/__admin/metrics/other"
+
+    self.assertEqual(self.router.render(request), b"stub")
+    self.fallback.render.assert_called_once_with(request)
+
+  def testAddRouteWithInvalidPath(self):
+    self.assertRaises(ValueError, self.router.addRoute, "metrics", self.resource)
+    self.assertRaises(ValueError, self.router.addRoute, "/metrics", None)
+
+  def testGetRoutes(self):
+    self.assertDictEqual(self.router.getRoutes(), {"/__admin/metrics": self.resource})
+
+  def testRenderPrefixRoute(self):
+    prefixResource = mock.NonCallableMock()
+    prefixResource.render = mock.Mock(return_value=b"admin")
+    self.router.addPrefixRoute("/__admin", prefixResource)
+
+    for path, body in ((b"/__admin", b"admin"), (b"/__admin/stubs", b"admin"), (b"/__admin/metrics", b"reserved"), (b"/__administrator", b"stub")):
+      request = mock.NonCallableMock()
+      request.path = path
+      self.assertEqual(self.router.render(request), body)
+    self.assertDictEqual(self.router.getPrefixRoutes(), {"/__admin": prefixResource})
+
+  def testAddPrefixRouteWithInvalidPrefix(self):
+    self.assertRaises(ValueError, self.router.addPrefixRoute, "__admin", self.resource)
+    self.assertRaises(ValueError, self.router.addPrefixRoute, "/__admin/", self.resource)
+    self.assertRaises(ValueError, self.router.addPrefixRoute, "/__admin", None)
+
+  def testInitWithNoFallback(self):
+    self.assertRaises(ValueError, ReservedPathRouter, None)
+
+if __name__ == "__main__":
+  unittest.main()
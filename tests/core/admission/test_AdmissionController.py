@@ -0,0 +1,70 @@
+import unittest
+from unittest import mock
+
+from mockwebserver.core.admission import Admission, AdmissionController
+
+class TestAdmit (unittest.TestCase):
+  def testInitWithInvalidLimits(self):
+    self.assertRaises(ValueError, AdmissionController, 0)
+    self.assertRaises(ValueError, AdmissionController, 1, -1)
+
+  def testAdmitWithNoLimit(self):
+    controller = AdmissionController()
+
+    for _ in range(1000):
+      self.assertEqual(controller.admit(mock.Mock()), Admission.ADMITTED)
+    self.assertEqual(controller.inFlight, 1000)
+
+  def testAdmitQueuesThenRejects(self):
+    controller = AdmissionController(2, 1)
+
+    self.assertEqual(controller.admit(mock.Mock()), Admission.ADMITTED)
+    self.assertEqual(controller.admit(mock.Mock()), Admission.ADMITTED)
+    self.assertEqual(controller.admit(mock.Mock()), Admission.QUEUED)
+    self.assertEqual(controller.admit(mock.Mock()), Admission.REJECTED)
+    self.assertDictEqual(controller.getGauges(), {"in_flight": 2, "queue_depth": 1})
+    self.assertDictEqual(controller.getCounters(), {"admitted": 2, "rejected": 1})
+
+class TestRelease (unittest.TestCase):
+  def testReleaseStartsQueuedRequest(self):
+    controller = AdmissionController(1, 2)
+    start = mock.Mock(return_value=True)
+    controller.admit(mock.Mock())
+    controller.admit(start)
+
+    controller.release()
+
+    start.assert_called_once_with()
+    self.assertEqual(controller.inFlight, 1)
+    self.assertEqual(controller.getQueueDepth(), 0)
+
+  def testReleaseSkipsRequestsThatNoLongerNeedProcessing(self):
+    controller = AdmissionController(1, 2)
+    abandoned = mock.Mock(return_value=False)
+    start = mock.Mock(return_value=True)
+    controller.admit(mock.Mock())
+    controller.admit(abandoned)
+    controller.admit(start)
+
+    controller.release()
+
+    abandoned.assert_called_once_with()
+    start.assert_called_once_with()
+    self.assertEqual(controller.inFlight, 1)
+
+  def testReleaseWithRequestsFinishingWhileStarting(self):
+    controller = AdmissionController(1, 1000)
+    starts = [mock.Mock(side_effect=lambda: controller.release() or True) for _ in range(1000)]
+    controller.admit(mock.Mock())
+    for start in starts:
+      controller.admit(start)
+
+    controller.release()
+
+    for start in starts:
+      start.assert_called_once_with()
+    self.assertEqual(controller.inFlight, 0)
+    self.assertEqual(controller.getQueueDepth(), 0)
+
+if __name__ == "__main__":
+  unittest.main()
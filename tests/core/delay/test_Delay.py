@@ -0,0 +1,58 @@
+import unittest
+
+from mockwebserver.core.delay import Delay, FixedDelay, UniformDelay, DistributionDelay
+
+class TestFixedDelay (unittest.TestCase):
+  def testSample(self):
+    self.assertEqual(FixedDelay(0.5).sample(), 0.5)
+
+  def testInitWithNegativeDelay(self):
+    self.assertRaises(ValueError, FixedDelay, -1)
+
+class TestUniformDelay (unittest.TestCase):
+  def testSample(self):
+    delay = UniformDelay(0.1, 0.2, seed=1)
+
+    for _ in range(100):
+      self.assertTrue(0.1 <= delay.sample() <= 0.2)
+
+  def testInitWithInvalidBounds(self):
+    self.assertRaises(ValueError, UniformDelay, -0.1, 0.2)
+    self.assertRaises(ValueError, UniformDelay, 0.2, 0.1)
+
+class TestDistributionDelay (unittest.TestCase):
+  def testSample(self):
+    delay = DistributionDelay("lognormvariate", -2.0, 0.5, seed=1)
+
+    samples = [delay.sample() for _ in range(100)]
+
+    self.assertTrue(all(sample > 0 for sample in samples))
+    self.assertEqual(len(set(samples)), 100)
+
+  def testSampleIsClamped(self):
+    delay = DistributionDelay("normalvariate", 0.0, 10.0, maximum=1.0, seed=1)
+
+    for _ in range(100):
+      self.assertTrue(0.0 <= delay.sample() <= 1.0)
+
+  def testInitWithUnknownDistribution(self):
+    self.assertRaises(ValueError, DistributionDelay, "seed")
+    self.assertRaises(ValueError, DistributionDelay, "unknownvariate")
+
+  def testInitWithInvalidParameters(self):
+    self.assertRaises(TypeError, DistributionDelay, "expovariate", 1.0, 2.0)
+
+class TestFromDefinition (unittest.TestCase):
+  def testFromDefinition(self):
+    self.assertEqual(Delay.fromDefinition(2).sample(), 2)
+    self.assertEqual(Delay.fromDefinition({"fixed": 0.5}).sample(), 0.5)
+    self.assertIsInstance(Delay.fromDefinition({"uniform": [0.1, 0.2]}), UniformDelay)
+    delay = Delay.fromDefinition({"distribution": "expovariate", "parameters": [10], "maximum": 1})
+    self.assertIsInstance(delay, DistributionDelay)
+    self.assertEqual(delay.maximum, 1)
+
+  def testFromDefinitionWithUnknownDelay(self):
+    self.assertRaises(ValueError, Delay.fromDefinition, {"random": 1})
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,39 @@
+import threading
+import time
+import unittest
+from concurrent.futures import Future, CancelledError
+from unittest import mock
+
+from mockwebserver.core.execution import ExecutionPolicy, Executor
+
+class TestProcessPool (unittest.TestCase):
+  def testFireDeferredWithCancelledFuture(self):
+    future = Future()
+    future.cancel()
+    deferred = mock.NonCallableMock()
+
+    Executor._fireDeferred(deferred, future)
+
+    deferred.callback.assert_not_called()
+    self.assertTrue(deferred.errback.call_args[0][0].check(CancelledError))
+
+  @mock.patch("twisted.internet.reactor.callFromThread", lambda function, *args: function(*args))
+  def testShutdownFailsPendingWork(self):
+    executor = Executor(processes=1)
+    results, failures = [], []
+    fired = threading.Semaphore(0)
+    # The worker takes the first calls, the last ones are still pending
+    deferreds = [executor.execute(ExecutionPolicy.PROCESS_POOL, time.sleep, 0.1) for _ in range(10)]
+    for deferred in deferreds:
+      deferred.addCallbacks(results.append, failures.append).addBoth(lambda _: fired.release())
+
+    executor.shutdown()
+
+    for _ in deferreds:
+      self.assertTrue(fired.acquire(timeout=10))
+    self.assertGreater(len(failures), 0)
+    self.assertTrue(all(failure.check(CancelledError) for failure in failures))
+    self.assertEqual(len(results) + len(failures), 10)
+
+if __name__ == "__main__":
+  unittest.main()
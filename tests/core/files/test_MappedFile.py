@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+
+from mockwebserver.core.files import MappedFile, UnsatisfiableRange, parseByteRange
+
+class TestParseByteRange (unittest.TestCase):
+  def testParseByteRange(self):
+    self.assertEqual(parseByteRange(b"bytes=0-9", 100), (0, 10))
+    self.assertEqual(parseByteRange(b"bytes=90-", 100), (90, 100))
+    self.assertEqual(parseByteRange(b"bytes=-10", 100), (90, 100))
+
+  def testParseByteRangeClampsToSize(self):
+    self.assertEqual(parseByteRange(b"bytes=90-200", 100), (90, 100))
+    self.assertEqual(parseByteRange(b"bytes=-200", 100), (0, 100))
+
+  def testParseByteRangeIgnoresOtherHeaders(self):
+    for header in (None, b"", b"items=0-9", b"bytes=0-9,20-29", b"bytes=a-b", b"bytes=9-0", b"bytes=-", b"bytes=10"):
+      self.assertIsNone(parseByteRange(header, 100), header)
+
+  def testParseByteRangeWithUnsatisfiableRange(self):
+    for header in (b"bytes=100-", b"bytes=100-200", b"bytes=-0"):
+      self.assertRaises(UnsatisfiableRange, parseByteRange, header, 100)
+    self.assertRaises(UnsatisfiableRange, parseByteRange, b"bytes=0-", 0)
+
+class TestMappedFile (unittest.TestCase):
+  def setUp(self):
+    self.content = bytes(range(256)) * 40
+    descriptor, self.path = tempfile.mkstemp()
+    with os.fdopen(descriptor, "wb") as file:
+      file.write(self.content)
+
+  def tearDown(self):
+    os.remove(self.path)
+
+  def testRead(self):
+    mappedFile = MappedFile(self.path)
+
+    self.assertEqual(mappedFile.size, len(self.content))
+    self.assertEqual(mappedFile.read(10, 20), self.content[10:20])
+    mappedFile.close()
+
+  def testChunks(self):
+    mappedFile = MappedFile(self.path)
+
+    chunks = list(mappedFile.chunks(100, 5000, 1024))
+
+    self.assertEqual(b"".join(chunks), self.content[100:5000])
+    self.assertListEqual([len(chunk) for chunk in chunks], [1024, 1024, 1024, 1024, 804])
+    mappedFile.close()
+
+  def testEmptyFile(self):
+    with open(self.path, "wb"):
+      pass
+
+    mappedFile = MappedFile(self.path)
+
+    self.assertEqual(mappedFile.size, 0)
+    self.assertEqual(mappedFile.read(0, 0), b"")
+    self.assertListEqual(list(mappedFile.chunks(0, 0, 1024)), [])
+    mappedFile.close()
+
+  def testInitWithNoPath(self):
+    self.assertRaises(ValueError, MappedFile, None)
+
+if __name__ == "__main__":
+  unittest.main()
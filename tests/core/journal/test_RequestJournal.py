@@ -0,0 +1,115 @@
+import hashlib
+import io
+import unittest
+from unittest import mock
+
+from mockwebserver.core.journal import RequestJournal, JournalEntry
+
+def createRequest(method=b"GET", path=b"/users/42", query=b"", headers={}, body=b""):
+  request = mock.NonCallableMock()
+  request.method = method
+  request.path = path
+  request.uri = path + (b"?" + query if query else b"")
+  request.getHeader = mock.Mock(side_effect=lambda name: headers.get(name))
+  request.content = io.BytesIO(body)
+  return request
+
+class TestRecord (unittest.TestCase):
+  def testRecord(self):
+    journal = RequestJournal(headers=("Content-Type",), bodyPrefixBytes=4, digestFullBody=True)
+    body = b"name=value"
+    request = createRequest(b"POST", b"/users", b"a=1&b=2", {b"content-type": b"text/plain", b"accept": b"*/*"}, body)
+    request.content.seek(3)
+
+    entry = journal.record(request, "createUser")
+
+    self.assertIsInstance(entry, JournalEntry)
+    self.assertEqual(entry.method, "POST")
+    self.assertEqual(entry.path, "/users")
+    self.assertEqual(entry.query, "a=1&b=2")
+    self.assertTupleEqual(entry.headers, (("content-type", "text/plain"),))
+    self.assertEqual(entry.getHeader("Content-Type"), "text/plain")
+    self.assertIsNone(entry.getHeader("accept"))
+    self.assertEqual(entry.bodyPrefix, b"name")
+    self.assertEqual(entry.bodySize, len(body))
+    self.assertEqual(entry.bodyDigest, hashlib.sha256(body).hexdigest())
+    self.assertEqual(entry.stubId, "createUser")
+    self.assertEqual(request.content.tell(), 3)
+
+  def testRecordDigestsPrefixByDefault(self):
+    journal = RequestJournal(bodyPrefixBytes=2)
+
+    entry = journal.record(createRequest(body=b"abcdef"), None)
+
+    self.assertEqual(entry.bodyDigest, hashlib.sha256(b"ab").hexdigest())
+    self.assertEqual(entry.bodySize, 6)
+
+  def testRecordWithoutDigest(self):
+    journal = RequestJournal(bodyPrefixBytes=2, digestBody=False)
+
+    entry = journal.record(createRequest(body=b"abcdef"), None)
+
+    self.assertIsNone(entry.bodyDigest)
+    self.assertEqual(entry.bodyPrefix, b"ab")
+    self.assertEqual(entry.bodySize, 6)
+    self.assertIsNone(entry.query)
+
+  def testRecordWithNone(self):
+    self.assertRaises(ValueError, RequestJournal().record, None, None)
+
+  def testEntriesHaveSlots(self):
+    entry = RequestJournal().record(createRequest(), None)
+
+    self.assertFalse(hasattr(entry, "__dict__"))
+
+  def testInitWithInvalidCapacity(self):
+    self.assertRaises(ValueError, RequestJournal, 0)
+
+class TestQueries (unittest.TestCase):
+  def setUp(self):
+    self.journal = RequestJournal(capacity=5)
+    for method, path, stubId in (
+      (b"GET", b"/users/1", "getUser"),
+      (b"GET", b"/users/2", "getUser"),
+      (b"POST", b"/users", "createUser"),
+      (b"GET", b"/missing", None),
+      (b"DELETE", b"/users/1", "deleteUser")
+    ):
+      self.journal.record(createRequest(method, path), stubId)
+
+  def testCount(self):
+    self.assertEqual(self.journal.count(), 5)
+    self.assertEqual(self.journal.count("getUser"), 2)
+    self.assertEqual(self.journal.count(path="/users/1"), 2)
+    self.assertEqual(self.journal.count("getUser", "/users/1"), 1)
+    self.assertEqual(self.journal.count("unknown"), 0)
+    self.assertEqual(self.journal.countUnmatched(), 1)
+
+  def testFind(self):
+    entries = self.journal.find(path="/users/1")
+
+    self.assertListEqual([entry.stubId for entry in entries], ["getUser", "deleteUser"])
+    self.assertListEqual([entry.method for entry in self.journal.find(path="/users/1", method="DELETE")], ["DELETE"])
+    self.assertEqual(len(self.journal.find(limit=3)), 3)
+    self.assertListEqual([entry.path for entry in self.journal.findUnmatched()], ["/missing"])
+
+  def testOldestEntriesAreOverwritten(self):
+    self.journal.record(createRequest(b"GET", b"/users/3"), "getUser")
+    self.journal.record(createRequest(b"GET", b"/users/4"), "getUser")
+
+    self.assertEqual(len(self.journal), 5)
+    self.assertEqual(self.journal.count("getUser"), 2)
+    self.assertEqual(self.journal.count(path="/users/1"), 1)
+    self.assertEqual(self.journal.count(path="/users/2"), 0)
+    self.assertListEqual([entry.sequence for entry in self.journal.getEntries()], [2, 3, 4, 5, 6])
+    self.assertListEqual([entry.path for entry in self.journal.find("getUser")], ["/users/3", "/users/4"])
+
+  def testClear(self):
+    self.journal.clear()
+
+    self.assertEqual(len(self.journal), 0)
+    self.assertListEqual(self.journal.getEntries(), [])
+    self.assertEqual(self.journal.count("getUser"), 0)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+from mockwebserver.core.memoization import RenderCache
+from mockwebserver.extraction.extractor import Extract
+from mockwebserver.stub import Response
+
+class TestKeyFor (unittest.TestCase):
+  def testKeyForWithNoData(self):
+    self.assertEqual(RenderCache.keyFor(None), ())
+
+  def testKeyForWithEqualExtracts(self):
+    data1 = {"PATH": Extract(["a"], {"id": "1", "name": "x"}), "QUERY": None}
+    data2 = {"PATH": Extract(["a"], {"name": "x", "id": "1"}), "QUERY": None}
+
+    self.assertEqual(RenderCache.keyFor(data1), RenderCache.keyFor(data2))
+
+  def testKeyForWithDifferentExtracts(self):
+    data1 = {"PATH": Extract([], {"id": "1"})}
+    data2 = {"PATH": Extract([], {"id": "2"})}
+
+    self.assertNotEqual(RenderCache.keyFor(data1), RenderCache.keyFor(data2))
+
+  def testKeyForWithUnhashableValues(self):
+    self.assertIsNone(RenderCache.keyFor({"PATH": Extract([[1]], {})}))
+
+class TestGetAndPut (unittest.TestCase):
+  def testInitWithInvalidSize(self):
+    self.assertRaises(ValueError, RenderCache, 0)
+
+  def testGetCountsHitsAndMisses(self):
+    renderCache = RenderCache()
+    response = Response(b"body")
+
+    self.assertIsNone(renderCache.get("key"))
+    renderCache.put("key", response)
+
+    self.assertIs(renderCache.get("key"), response)
+    self.assertEqual(renderCache.hits, 1)
+    self.assertEqual(renderCache.misses, 1)
+
+  def testPutEvictsLeastRecentlyUsed(self):
+    entrySize = RenderCache.sizeOf(Response(b"x" * 100))
+    renderCache = RenderCache(entrySize * 2)
+    renderCache.put("a", Response(b"a" * 100))
+    renderCache.put("b", Response(b"b" * 100))
+    renderCache.get("a")
+
+    renderCache.put("c", Response(b"c" * 100))
+
+    self.assertIsNotNone(renderCache.get("a"))
+    self.assertIsNone(renderCache.get("b"))
+    self.assertIsNotNone(renderCache.get("c"))
+    self.assertEqual(renderCache.size, entrySize * 2)
+
+  def testPutIgnoresResponsesLargerThanTheCache(self):
+    renderCache = RenderCache(100)
+
+    renderCache.put("key", Response(b"x" * 100))
+
+    self.assertIsNone(renderCache.get("key"))
+    self.assertEqual(renderCache.size, 0)
+
+  def testSizeOfCountsHeaders(self):
+    response = Response(b"body", 200, {b"a": b"12", b"b": [b"1", b"23"]})
+
+    self.assertEqual(RenderCache.sizeOf(response), RenderCache.entryOverhead + 4 + 3 + 4)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,102 @@
+import threading
+import unittest
+from unittest import mock
+
+from mockwebserver.core.metrics import KeyedCounter, Histogram, ServerMetrics, MetricsResource, escapeLabel
+
+class TestKeyedCounter (unittest.TestCase):
+  def testIncrementAcrossThreads(self):
+    counter = KeyedCounter()
+
+    def count():
+      for _ in range(1000):
+        counter.increment("a")
+      counter.increment("b", 5)
+    threads = [threading.Thread(target=count) for _ in range(4)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    self.assertDictEqual(counter.collect(), {"a": 4000, "b": 20})
+
+class TestHistogram (unittest.TestCase):
+  def testObserve(self):
+    histogram = Histogram((1.0, 0.1))
+
+    for value in (0.05, 0.1, 0.5, 2.0):
+      histogram.observe(value)
+
+    counts, total, count = histogram.collect()
+    self.assertTupleEqual(histogram.bounds, (0.1, 1.0))
+    self.assertListEqual(counts, [2, 3, 4])
+    self.assertAlmostEqual(total, 2.65)
+    self.assertEqual(count, 4)
+
+  def testObserveAcrossThreads(self):
+    histogram = Histogram((1.0,))
+
+    threads = [threading.Thread(target=lambda: [histogram.observe(0.5) for _ in range(100)]) for _ in range(3)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    self.assertEqual(histogram.collect()[2], 300)
+
+  def testInitWithoutBounds(self):
+    self.assertRaises(ValueError, Histogram, ())
+
+class TestServerMetrics (unittest.TestCase):
+  def testRender(self):
+    metrics = ServerMetrics(bounds=(0.1,))
+    metrics.countRequest("getUser")
+    metrics.countRequest("getUser")
+    metrics.countRequest(None)
+    metrics.observe("lookup", 0.05)
+    metrics.observe("total", 0.5)
+    metrics.addGauges("admission", lambda: {"in_flight": 2})
+    metrics.addCounters("admission", lambda: {"rejected": 3})
+
+    lines = metrics.render().decode("utf-8").splitlines()
+
+    self.assertIn("# TYPE mockwebserver_requests_total counter", lines)
+    self.assertIn("mockwebserver_requests_total{stub=\"getUser\"} 2", lines)
+    self.assertIn("mockwebserver_unmatched_requests_total 1", lines)
+    self.assertIn("# TYPE mockwebserver_phase_seconds histogram", lines)
+    self.assertIn("mockwebserver_phase_seconds_bucket{phase=\"lookup\",le=\"0.1\"} 1", lines)
+    self.assertIn("mockwebserver_phase_seconds_bucket{phase=\"total\",le=\"0.1\"} 0", lines)
+    self.assertIn("mockwebserver_phase_seconds_bucket{phase=\"total\",le=\"+Inf\"} 1", lines)
+    self.assertIn("mockwebserver_phase_seconds_sum{phase=\"total\"} 0.5", lines)
+    self.assertIn("mockwebserver_phase_seconds_count{phase=\"render\"} 0", lines)
+    self.assertIn("# TYPE mockwebserver_admission_in_flight gauge", lines)
+    self.assertIn("mockwebserver_admission_in_flight 2", lines)
+    self.assertIn("# TYPE mockwebserver_admission_rejected_total counter", lines)
+    self.assertIn("mockwebserver_admission_rejected_total 3", lines)
+
+  def testRenderCacheStats(self):
+    metrics = ServerMetrics(bounds=(0.1,))
+    metrics.setRenderCacheSource(lambda: {"getUser": {"hits": 3, "misses": 1, "entries": 1, "bytes": 80}})
+
+    lines = metrics.render().decode("utf-8").splitlines()
+
+    self.assertIn("# TYPE mockwebserver_render_cache_hits_total counter", lines)
+    self.assertIn("mockwebserver_render_cache_hits_total{stub=\"getUser\"} 3", lines)
+    self.assertIn("mockwebserver_render_cache_misses_total{stub=\"getUser\"} 1", lines)
+    self.assertIn("# TYPE mockwebserver_render_cache_bytes gauge", lines)
+    self.assertIn("mockwebserver_render_cache_entries{stub=\"getUser\"} 1", lines)
+
+  def testEscapeLabel(self):
+    self.assertEqual(escapeLabel("a\"b\\c\nd"), "a\\\"b\\\\c\\nd")
+
+  def testMetricsResource(self):
+    metrics = ServerMetrics()
+    request = mock.NonCallableMock()
+
+    body = MetricsResource(metrics).render_GET(request)
+
+    self.assertEqual(body, metrics.render())
+    request.setHeader.assert_called_once_with(b"content-type", b"text/plain; version=0.0.4; charset=utf-8")
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,160 @@
+import base64
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from mockwebserver.core.journal import JournalEntry, RequestJournal
+from mockwebserver.core.persistence import JsonlJournalSink, Overflow
+
+def createEntry(sequence, path="/users"):
+  return JournalEntry(sequence, "GET", path, "a=1", (("accept", "*/*"),), "digest", b"\x00body", 5, "stub", 1.5)
+
+def readLines(path):
+  opener = gzip.open if path.endswith(".gz") else open
+  with opener(path, "rb") as file:
+    return [json.loads(line) for line in file.read().splitlines()]
+
+class TestJsonlJournalSink (unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, "journal.jsonl")
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def testInitWithInvalidArguments(self):
+    self.assertRaises(ValueError, JsonlJournalSink, None)
+    self.assertRaises(ValueError, JsonlJournalSink, self.path, maxBytes=0)
+    self.assertRaises(ValueError, JsonlJournalSink, self.path, maxPending=0)
+
+  def testSubmitWritesEntries(self):
+    sink = JsonlJournalSink(self.path)
+    sink.start()
+
+    for sequence in range(3):
+      self.assertTrue(sink.submit(createEntry(sequence)))
+    sink.close()
+
+    lines = readLines(self.path)
+    self.assertListEqual([line["sequence"] for line in lines], [0, 1, 2])
+    self.assertDictEqual(lines[0], {
+      "sequence": 0, "timestamp": 1.5, "method": "GET", "path": "/users", "query": "a=1",
+      "headers": {"accept": "*/*"}, "bodyDigest": "digest", "bodyPrefix": base64.b64encode(b"\x00body").decode(),
+      "bodySize": 5, "stubId": "stub"
+    })
+    self.assertEqual(sink.getStats()["written"], 3)
+
+  def testStartTwice(self):
+    sink = JsonlJournalSink(self.path)
+    sink.start()
+
+    self.assertRaises(RuntimeError, sink.start)
+    sink.close()
+
+  def testStartWithOtherPath(self):
+    sink = JsonlJournalSink(self.path)
+    otherPath = self.path + ".1234"
+
+    sink.start(otherPath)
+    sink.submit(createEntry(0))
+    sink.close()
+
+    self.assertEqual(len(readLines(otherPath)), 1)
+    self.assertFalse(os.path.exists(self.path))
+
+  def testDropWhenBehind(self):
+    sink = JsonlJournalSink(self.path, maxPending=2, overflow=Overflow.DROP)
+
+    results = [sink.submit(createEntry(sequence)) for sequence in range(5)]
+    sink.start()
+    sink.close()
+
+    self.assertListEqual(results, [True, True, False, False, False])
+    self.assertEqual(sink.getStats()["dropped"], 3)
+    self.assertEqual(len(readLines(self.path)), 2)
+
+  def testBlockWhenBehind(self):
+    sink = JsonlJournalSink(self.path, maxPending=1, overflow=Overflow.BLOCK)
+    sink.submit(createEntry(0))
+    submitted = threading.Event()
+
+    def submit():
+      sink.submit(createEntry(1))
+      submitted.set()
+    thread = threading.Thread(target=submit)
+    thread.start()
+
+    self.assertFalse(submitted.wait(0.1))
+    sink.start()
+    self.assertTrue(submitted.wait(5))
+    thread.join()
+    sink.close()
+    self.assertEqual(len(readLines(self.path)), 2)
+    self.assertEqual(sink.getStats()["dropped"], 0)
+
+  def testRotation(self):
+    sink = JsonlJournalSink(self.path, maxBytes=1, backups=2, batchSize=1)
+    sink.start()
+
+    for sequence in range(4):
+      sink.submit(createEntry(sequence))
+    sink.close()
+
+    self.assertEqual(sink.getStats()["rotations"], 4)
+    self.assertListEqual([line["sequence"] for line in readLines(self.path + ".1")], [3])
+    self.assertListEqual([line["sequence"] for line in readLines(self.path + ".2")], [2])
+    self.assertFalse(os.path.exists(self.path + ".3"))
+    self.assertListEqual(readLines(self.path), [])
+
+  def testRotationWithCompression(self):
+    sink = JsonlJournalSink(self.path, maxBytes=1, backups=2, compress=True, batchSize=1)
+    sink.start()
+
+    for sequence in range(2):
+      sink.submit(createEntry(sequence))
+    sink.close()
+
+    self.assertListEqual([line["sequence"] for line in readLines(self.path + ".1.gz")], [1])
+    self.assertListEqual([line["sequence"] for line in readLines(self.path + ".2.gz")], [0])
+
+  def testRotationWithoutBackups(self):
+    sink = JsonlJournalSink(self.path, maxBytes=1, backups=0, batchSize=1)
+    sink.start()
+
+    sink.submit(createEntry(0))
+    sink.close()
+
+    self.assertListEqual(os.listdir(self.directory), ["journal.jsonl"])
+
+  def testWriterKeepsDrainingWhenReopeningFails(self):
+    sink = JsonlJournalSink(self.path, maxBytes=1, backups=1, maxPending=1, overflow=Overflow.BLOCK, batchSize=1)
+    sink.start()
+
+    with mock.patch("mockwebserver.core.persistence.open", create=True, side_effect=OSError("disk gone")):
+      for sequence in range(5):
+        sink.submit(createEntry(sequence))
+      sink.close()
+
+    stats = sink.getStats()
+    self.assertEqual(stats["written"], 1)
+    self.assertEqual(stats["failed"], 4)
+    self.assertEqual(stats["pending"], 0)
+    self.assertListEqual([line["sequence"] for line in readLines(self.path + ".1")], [0])
+
+  def testJournalSubmitsToSink(self):
+    sink = mock.NonCallableMock(JsonlJournalSink)
+    journal = RequestJournal(sink=sink)
+    request = mock.NonCallableMock()
+    request.content = None
+
+    entry = journal.record(request, "stub")
+
+    sink.submit.assert_called_once_with(entry)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,261 @@
+import cProfile
+import threading
+import unittest
+from unittest import mock
+
+from twisted.internet.defer import maybeDeferred as Tw_maybeDeferred
+
+from mockwebserver.core.profiling import Instrumentation, TimingHook, CProfileWindow, SamplingProfileWindow, ProfileResource, sharedProfiler
+from mockwebserver.core.stub import StubManager
+from mockwebserver.stub import DefaultStub
+from mockwebserver.matching.matcher import PathMatcher
+
+def createRequest(path : bytes = b"/user"):
+  request = mock.NonCallableMock()
+  request.method = b"GET"
+  request.path = path
+  request.uri = path
+  request.args = {}
+  return request
+
+class TestInstrumentation (unittest.TestCase):
+  def setUp(self):
+    self.instrumentation = Instrumentation()
+    self.stubManager = StubManager()
+    self.stubManager.addStub(DefaultStub("user", mock.Mock(), PathMatcher("/user")))
+
+  def tearDown(self):
+    self.instrumentation._uninstall()
+
+  def testDisabledByDefault(self):
+    original = StubManager.__dict__["findStubForRequest"]
+
+    self.assertFalse(self.instrumentation.isEnabled())
+    self.assertIs(StubManager.__dict__["findStubForRequest"], original)
+
+  def testHooksSeeInstrumentedCalls(self):
+    calls = []
+    def hook(name, call):
+      calls.append(name)
+      return call()
+
+    self.instrumentation.addHook(hook)
+    stub = self.stubManager.findStubForRequest(createRequest())
+
+    self.assertEqual(stub.id, "user")
+    self.assertListEqual(calls, ["StubManager.findStubForRequest"])
+
+  def testHooksAreNested(self):
+    calls = []
+    def hookFor(label):
+      def hook(name, call):
+        calls.append(label)
+        return call()
+      return hook
+
+    self.instrumentation.addHook(hookFor("first"))
+    self.instrumentation.addHook(hookFor("second"))
+    self.stubManager.findStubAndDataForRequest(createRequest())
+
+    # The stub matches and extracts from within the lookup
+    self.assertListEqual(calls, ["second", "first", "second", "first"])
+
+  def testRemovingLastHookRestoresMethods(self):
+    original = StubManager.__dict__["findStubForRequest"]
+    hook = lambda name, call: call()
+
+    self.instrumentation.addHook(hook)
+    self.assertIsNot(StubManager.__dict__["findStubForRequest"], original)
+    self.instrumentation.removeHook(hook)
+
+    self.assertFalse(self.instrumentation.isEnabled())
+    self.assertIs(StubManager.__dict__["findStubForRequest"], original)
+
+  def testAddNoneHook(self):
+    self.assertRaises(ValueError, self.instrumentation.addHook, None)
+
+  def testTimingHook(self):
+    hook = TimingHook()
+
+    self.instrumentation.addHook(hook)
+    self.stubManager.findStubForRequest(createRequest())
+    self.stubManager.findStubForRequest(createRequest(b"/other"))
+
+    self.assertEqual(hook.histograms["StubManager.findStubForRequest"].collect()[2], 2)
+
+class TestCProfileWindow (unittest.TestCase):
+  def setUp(self):
+    self.instrumentation = Instrumentation()
+    self.stubManager = StubManager()
+    self.stubManager.addStub(DefaultStub("user", mock.Mock(), PathMatcher("/user")))
+
+  def tearDown(self):
+    self.instrumentation._uninstall()
+
+  def testProfilesEveryThread(self):
+    window = CProfileWindow(self.instrumentation)
+
+    window.start()
+    self.stubManager.findStubAndDataForRequest(createRequest())
+    thread = threading.Thread(target=self.stubManager.findStubAndDataForRequest, args=(createRequest(),))
+    thread.start()
+    thread.join()
+    window.stop()
+    stats = window.collect()
+
+    self.assertFalse(self.instrumentation.isEnabled())
+    calls = {function[2]: values[1] for function, values in stats.stats.items()}
+    self.assertEqual(calls["findStubAndDataForRequest"], 2)
+    # Nested instrumented calls are part of the outermost profile
+    self.assertEqual(calls["matchAndExtractData"], 2)
+    self.assertIn("findStubAndDataForRequest", CProfileWindow.report(stats))
+
+  def testReportWithoutCalls(self):
+    window = CProfileWindow(self.instrumentation)
+
+    window.start()
+    window.stop()
+
+    self.assertIsNone(window.collect())
+    self.assertEqual(CProfileWindow.report(None), "No instrumented calls were profiled\n")
+
+  @unittest.skipIf(sharedProfiler, "A profiler follows every thread")
+  def testStopDoesNotWaitForCallsInProgress(self):
+    window = CProfileWindow(self.instrumentation, False)
+    entered, release = threading.Event(), threading.Event()
+    def matchAndExtractData(request):
+      entered.set()
+      release.wait()
+      return True, {}
+    stub = DefaultStub("slow", mock.Mock(), PathMatcher("/slow"))
+    stub.matchAndExtractData = matchAndExtractData
+    self.stubManager.addStub(stub)
+
+    window.start()
+    thread = threading.Thread(target=self.stubManager.findStubAndDataForRequest, args=(createRequest(b"/slow"),))
+    thread.start()
+    entered.wait()
+    window.stop()
+    release.set()
+    stats = window.collect()
+    thread.join()
+
+    calls = {function[2]: values[1] for function, values in stats.stats.items()}
+    self.assertEqual(calls["findStubAndDataForRequest"], 1)
+
+  def testSharedProfilerFollowsConcurrentCalls(self):
+    window = CProfileWindow(self.instrumentation, True)
+    threads = [threading.Thread(target=self.stubManager.findStubAndDataForRequest, args=(createRequest(),)) for _ in range(4)]
+
+    window.start()
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    window.stop()
+
+    self.assertEqual(window._profiledCalls + window.unprofiledCalls, 4)
+    self.assertFalse(window._enabled)
+    self.assertIsNotNone(window.collect())
+
+  def testCallsRunUnprofiledWhileAnotherProfilerIsActive(self):
+    # Only a real shared profiler refuses to be enabled twice
+    for shared in {False, sharedProfiler}:
+      window = CProfileWindow(self.instrumentation, shared)
+      other = cProfile.Profile()
+
+      window.start()
+      other.enable()
+      try:
+        stub, _ = self.stubManager.findStubAndDataForRequest(createRequest())
+      finally:
+        other.disable()
+      window.stop()
+
+      self.assertEqual(stub.id, "user")
+      self.assertEqual(window.unprofiledCalls, 1)
+      self.assertIsNone(window.collect())
+
+class TestSamplingProfileWindow (unittest.TestCase):
+  def testSamplesOtherThreads(self):
+    stopping = threading.Event()
+    def waitForStop():
+      stopping.wait()
+    thread = threading.Thread(target=waitForStop, name="Waiter")
+    thread.start()
+    window = SamplingProfileWindow(0.001)
+
+    window.start()
+    while window.samples < 3:
+      stopping.wait(0.005)
+    stacks = window.stop()
+    stopping.set()
+    thread.join()
+
+    waiting = [stack for stack in stacks if stack.startswith("Waiter;")]
+    self.assertGreater(len(waiting), 0)
+    self.assertIn("waitForStop (test_Instrumentation.py:", waiting[0])
+    self.assertFalse(any(stack.startswith("SamplingProfiler;") for stack in stacks))
+    self.assertRegex(SamplingProfileWindow.report(stacks), r"^Waiter;.* \d+\n")
+
+  def testInitWithInvalidInterval(self):
+    self.assertRaises(ValueError, SamplingProfileWindow, 0)
+
+class TestProfileResource (unittest.TestCase):
+  def setUp(self):
+    self.instrumentation = Instrumentation()
+    self.executor = mock.NonCallableMock()
+    self.executor.execute = mock.Mock(side_effect=lambda policy, function, *args: Tw_maybeDeferred(function, *args))
+    self.resource = ProfileResource(instrumentation=self.instrumentation, executor=self.executor)
+    self.request = createRequest(b"/__admin/profile")
+    self.request.finished = False
+    self.request._disconnected = False
+
+  def tearDown(self):
+    self.instrumentation._uninstall()
+
+  @mock.patch("twisted.internet.reactor.callLater")
+  def testProfile(self, callLater):
+    self.request.args = {b"mode": [b"cprofile"], b"seconds": [b"2"]}
+
+    self.resource.render_POST(self.request)
+
+    self.assertTrue(self.instrumentation.isEnabled())
+    self.assertEqual(callLater.call_args[0][0], 2.0)
+    callLater.call_args[0][1](*callLater.call_args[0][2:])
+    self.assertFalse(self.instrumentation.isEnabled())
+    self.request.write.assert_called_once_with(b"No instrumented calls were profiled\n")
+    self.request.finish.assert_called_once_with()
+
+  @mock.patch("twisted.internet.reactor.callLater")
+  @mock.patch.object(CProfileWindow, "isAvailable", return_value=False)
+  def testProfileSamplesWhileAnotherProfilerIsActive(self, isAvailable, callLater):
+    self.request.args = {b"mode": [b"cprofile"], b"seconds": [b"1"]}
+
+    self.resource.render_POST(self.request)
+
+    self.assertIsInstance(self.resource._window, SamplingProfileWindow)
+    self.assertFalse(self.instrumentation.isEnabled())
+    callLater.call_args[0][1](*callLater.call_args[0][2:])
+    self.request.finish.assert_called_once_with()
+
+  @mock.patch("twisted.internet.reactor.callLater")
+  def testProfileWhileRecording(self, callLater):
+    self.resource.render_POST(self.request)
+
+    body = self.resource.render_POST(createRequest(b"/__admin/profile"))
+
+    self.assertEqual(body, b"A profile is already being recorded\n")
+    callLater.call_args[0][1](*callLater.call_args[0][2:])
+
+  def testProfileWithInvalidArguments(self):
+    for args in ({b"mode": [b"other"]}, {b"seconds": [b"0"]}, {b"seconds": [b"x"]}, {b"limit": [b"0"]}):
+      self.request.args = args
+
+      self.resource.render_POST(self.request)
+
+      self.request.setResponseCode.assert_called_with(400)
+    self.assertFalse(self.instrumentation.isEnabled())
+
+if __name__ == "__main__":
+  unittest.main()
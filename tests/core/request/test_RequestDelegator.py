@@ -1,55 +1,76 @@
 import unittest
 from unittest import mock
 
-from http.client import INTERNAL_SERVER_ERROR
+from http.client import INTERNAL_SERVER_ERROR, NOT_FOUND, TOO_MANY_REQUESTS
 from twisted.web.server import NOT_DONE_YET as Tw_NOT_DONE_YET
 from twisted.internet.defer import Deferred as Tw_Deferred
+from twisted.internet.task import Clock as Tw_Clock
+from twisted.python.failure import Failure as Tw_Failure
 
+from mockwebserver.core.admission import AdmissionController
+from mockwebserver.core.delay import FixedDelay
+from mockwebserver.core.journal import RequestJournal
+from mockwebserver.core.metrics import ServerMetrics
+from mockwebserver.extraction.extractor import PathExtractor
+from mockwebserver.core.execution import ExecutionPolicy, Executor
 from mockwebserver.core.request import RequestDelegator
 from mockwebserver.core.stub import StubManager
 from mockwebserver.extraction.data import DTO
-from mockwebserver.stub import Stub
+from mockwebserver.stub import Stub, DefaultStub, StaticStub, Response
+from mockwebserver.matching.matcher import PathMatcher
 
 class TestRender (unittest.TestCase):
+  def setUp(self):
+    self.executor = mock.NonCallableMock(Executor)
+    self.executor.execute = mock.Mock()
+
   def testRenderWithNoRequest(self):
     request = None
     stubManager = mock.NonCallableMock()
-    requestDelegator = RequestDelegator(stubManager)
-    passed = False
-    with mock.patch("mockwebserver.core.request.Tw_deferToThread") as Mock_Tw_deferToThread:
-      self.assertRaises(ValueError, requestDelegator.render, request)
-      Mock_Tw_deferToThread.assert_not_called()
-      passed = True
-    self.assertTrue(passed)
+    requestDelegator = RequestDelegator(stubManager, self.executor)
+
+    self.assertRaises(ValueError, requestDelegator.render, request)
+    self.executor.execute.assert_not_called()
 
   def testRenderWithTwistedDeferingToThreadAndAddingCallbackOk(self):
     request = mock.NonCallableMock()
     stubManager = mock.NonCallableMock()
-    requestDelegator = RequestDelegator(stubManager)
-    literal = None
-    with mock.patch("mockwebserver.core.request.Tw_deferToThread") as Mock_Tw_deferToThread:
-      mockDefered = mock.NonCallableMock(Tw_Deferred)
-      mockDefered.addCallback = mock.Mock(return_value=mockDefered)
-      Mock_Tw_deferToThread.return_value = mockDefered
+    requestDelegator = RequestDelegator(stubManager, self.executor)
+    mockDefered = mock.NonCallableMock(Tw_Deferred)
+    mockDefered.addCallback = mock.Mock(return_value=mockDefered)
+    self.executor.execute.return_value = mockDefered
 
-      literal = requestDelegator.render(request)
+    literal = requestDelegator.render(request)
 
-      Mock_Tw_deferToThread.assert_called_once_with(requestDelegator._requestProcessor.processRequest, request)
-      mockDefered.addCallback.assert_called_once_with(requestDelegator._requestProcessor.stubRender)
+    self.executor.execute.assert_called_once_with(
+      ExecutionPolicy.THREAD_POOL, requestDelegator._requestProcessor.processRequest, request, ExecutionPolicy.THREAD_POOL
+    )
+    mockDefered.addCallback.assert_any_call(requestDelegator._requestProcessor.stubRender)
     self.assertEqual(literal, Tw_NOT_DONE_YET)
 
+  def testRenderWithInlinePolicy(self):
+    request = mock.NonCallableMock()
+    stubManager = mock.NonCallableMock()
+    requestDelegator = RequestDelegator(stubManager, self.executor, ExecutionPolicy.INLINE)
+    mockDefered = mock.NonCallableMock(Tw_Deferred)
+    mockDefered.addCallback = mock.Mock(return_value=mockDefered)
+    self.executor.execute.return_value = mockDefered
+
+    requestDelegator.render(request)
+
+    self.executor.execute.assert_called_once_with(
+      ExecutionPolicy.INLINE, requestDelegator._requestProcessor.processRequest, request, ExecutionPolicy.INLINE
+    )
+
   def testRenderWithTwistedDeferingToThreadFailed(self):
     request = mock.NonCallableMock()
     request.setResponseCode = mock.Mock()
     stubManager = mock.NonCallableMock()
-    requestDelegator = RequestDelegator(stubManager)
-    literal = None
-    with mock.patch("mockwebserver.core.request.Tw_deferToThread") as Mock_Tw_deferToThread:
-      Mock_Tw_deferToThread.return_value = None
+    requestDelegator = RequestDelegator(stubManager, self.executor)
+    self.executor.execute.return_value = None
 
-      literal = requestDelegator.render(request)
+    literal = requestDelegator.render(request)
 
-      Mock_Tw_deferToThread.assert_called_once_with(requestDelegator._requestProcessor.processRequest, request)
     self.assertIsInstance(literal, bytes)
     self.assertRegex(literal.decode(), "Failed to defer request to (a )?thread")
     request.setResponseCode.assert_called_once_with(INTERNAL_SERVER_ERROR)
@@ -57,17 +78,396 @@ class TestRender (unittest.TestCase):
   def testRenderWithAddingCallbackFailed(self):
     request = mock.NonCallableMock()
     stubManager = mock.NonCallableMock()
-    requestDelegator = RequestDelegator(stubManager)
-    literal = None
-    with mock.patch("mockwebserver.core.request.Tw_deferToThread") as Mock_Tw_deferToThread:
-      mockDefered = mock.NonCallableMock(Tw_Deferred)
-      mockDefered.addCallback = mock.Mock(return_value=None)
-      Mock_Tw_deferToThread.return_value = mockDefered
+    requestDelegator = RequestDelegator(stubManager, self.executor)
+    mockDefered = mock.NonCallableMock(Tw_Deferred)
+    mockDefered.addCallback = mock.Mock(return_value=None)
+    self.executor.execute.return_value = mockDefered
 
-      literal = requestDelegator.render(request)
+    literal = requestDelegator.render(request)
 
-      Mock_Tw_deferToThread.assert_called_once_with(requestDelegator._requestProcessor.processRequest, request)
-      mockDefered.addCallback.assert_called_once_with(requestDelegator._requestProcessor.stubRender)
+    mockDefered.addCallback.assert_called_once_with(requestDelegator._requestProcessor.stubRender)
     self.assertIsInstance(literal, bytes)
     self.assertRegex(literal.decode(), "Failed to add call( )?back to deferred( object)?")
-    request.setResponseCode.assert_called_once_with(INTERNAL_SERVER_ERROR)
\ No newline at end of file
+    request.setResponseCode.assert_called_once_with(INTERNAL_SERVER_ERROR)
+
+  def testRenderWithInvalidRejectionCode(self):
+    self.assertRaises(ValueError, RequestDelegator, mock.NonCallableMock(), self.executor, rejectionCode=INTERNAL_SERVER_ERROR)
+
+  def testRenderRejectsRequestsBeyondTheQueue(self):
+    request1 = mock.NonCallableMock()
+    request2 = mock.NonCallableMock()
+    request3 = mock.NonCallableMock()
+    stubManager = mock.NonCallableMock()
+    admission = AdmissionController(1, 1)
+    requestDelegator = RequestDelegator(
+      stubManager, self.executor, ExecutionPolicy.THREAD_POOL, admission, TOO_MANY_REQUESTS
+    )
+    mockDefered = mock.NonCallableMock(Tw_Deferred)
+    mockDefered.addCallback = mock.Mock(return_value=mockDefered)
+    self.executor.execute.return_value = mockDefered
+
+    self.assertEqual(requestDelegator.render(request1), Tw_NOT_DONE_YET)
+    self.assertEqual(requestDelegator.render(request2), Tw_NOT_DONE_YET)
+    literal = requestDelegator.render(request3)
+
+    self.assertIsInstance(literal, bytes)
+    request3.setResponseCode.assert_called_once_with(TOO_MANY_REQUESTS)
+    self.executor.execute.assert_called_once()
+    self.assertEqual(admission.getQueueDepth(), 1)
+    self.assertEqual(admission.rejected, 1)
+
+  def testRenderStartsQueuedRequestOnRelease(self):
+    request1 = mock.NonCallableMock()
+    request2 = mock.NonCallableMock()
+    request2.finished = False
+    request2._disconnected = False
+    stubManager = mock.NonCallableMock()
+    admission = AdmissionController(1, 1)
+    requestDelegator = RequestDelegator(stubManager, self.executor, ExecutionPolicy.THREAD_POOL, admission)
+    mockDefered = mock.NonCallableMock(Tw_Deferred)
+    mockDefered.addCallback = mock.Mock(return_value=mockDefered)
+    self.executor.execute.return_value = mockDefered
+    requestDelegator.render(request1)
+    requestDelegator.render(request2)
+
+    # request1 finishes
+    request1.notifyFinish.return_value.addBoth.call_args[0][0](None)
+
+    self.assertEqual(self.executor.execute.call_count, 2)
+    self.executor.execute.assert_called_with(
+      ExecutionPolicy.THREAD_POOL, requestDelegator._requestProcessor.processRequest, request2, ExecutionPolicy.THREAD_POOL
+    )
+    self.assertEqual(admission.inFlight, 1)
+
+class TestRenderStatic (unittest.TestCase):
+  def setUp(self):
+    self.executor = mock.NonCallableMock(Executor)
+    self.executor.execute = mock.Mock()
+    self.stub = StaticStub("id1", PathMatcher("/static"), headers={b"content-type": b"text/plain"}, body=b"hello")
+    self.stubManager = StubManager()
+    self.stubManager.addStub(self.stub)
+    self.admission = AdmissionController(1, 0)
+    self.requestDelegator = RequestDelegator(self.stubManager, self.executor, admission=self.admission)
+    self.request = mock.NonCallableMock()
+    self.request.method = b"GET"
+    self.request.path = b"/static"
+    self.request.clientproto = b"HTTP/1.1"
+    self.request.finished = False
+    self.request._disconnected = False
+    self.request.responseHeaders.hasHeader = mock.Mock(return_value=False)
+
+  def testRenderWritesEncodedResponse(self):
+    literal = self.requestDelegator.render(self.request)
+
+    self.assertEqual(literal, Tw_NOT_DONE_YET)
+    self.request.channel.write.assert_called_once_with(self.stub.encoded)
+    self.request.finish.assert_called_once_with()
+    self.assertEqual(self.request.code, 200)
+    self.assertEqual(self.request.sentLength, 5)
+    self.executor.execute.assert_not_called()
+
+  def testRenderClosingConnection(self):
+    self.request.responseHeaders.hasHeader.return_value = True
+
+    self.requestDelegator.render(self.request)
+
+    self.request.channel.write.assert_called_once_with(
+      b"HTTP/1.1 200 OK\r\ncontent-type: text/plain\r\ncontent-length: 5\r\nconnection: close\r\n\r\nhello"
+    )
+
+  def testRenderBypassesAdmission(self):
+    self.admission.inFlight = 1
+
+    self.requestDelegator.render(self.request)
+
+    self.request.channel.write.assert_called_once_with(self.stub.encoded)
+    self.assertEqual(self.admission.rejected, 0)
+
+  def testRenderWithHeadRequest(self):
+    self.request.method = b"HEAD"
+
+    self.requestDelegator.render(self.request)
+
+    self.request.channel.write.assert_not_called()
+    self.executor.execute.assert_called_once()
+
+  def testRenderWithOlderProtocol(self):
+    self.request.clientproto = b"HTTP/1.0"
+
+    self.requestDelegator.render(self.request)
+
+    self.request.channel.write.assert_not_called()
+    self.executor.execute.assert_called_once()
+
+class TestRespond (unittest.TestCase):
+  def setUp(self):
+    self.request = mock.NonCallableMock()
+    self.request.finished = False
+    self.request._disconnected = False
+    self.stub = Stub("id1")
+    self.requestDelegator = RequestDelegator(StubManager(), Executor(), ExecutionPolicy.INLINE)
+
+  def respondWith(self, stub, result):
+    dto = DTO(self.request, stub, {})
+    dto.result = result
+    dto.rendered = True
+    self.requestDelegator._respond(dto, self.request)
+
+  def testRespondWithNoStub(self):
+    self.respondWith(None, None)
+
+    self.request.setResponseCode.assert_called_once_with(NOT_FOUND)
+    self.request.finish.assert_called_once_with()
+
+  def testRespondWithBytes(self):
+    self.respondWith(self.stub, b"body")
+
+    self.request.write.assert_called_once_with(b"body")
+    self.request.finish.assert_called_once_with()
+
+  def testRespondWithResponse(self):
+    self.respondWith(self.stub, Response(b"created", 201, {b"content-type": b"text/plain"}))
+
+    self.request.setResponseCode.assert_called_once_with(201)
+    self.request.setHeader.assert_any_call(b"content-type", b"text/plain")
+    self.request.setHeader.assert_any_call(b"content-length", b"7")
+    self.request.write.assert_called_once_with(b"created")
+    self.request.finish.assert_called_once_with()
+
+  def testRespondWithNoneLeavesRequestToTheStub(self):
+    self.respondWith(self.stub, None)
+
+    self.request.write.assert_not_called()
+    self.request.finish.assert_not_called()
+
+  def testRespondWithFinishedRequest(self):
+    self.request.finished = True
+
+    self.respondWith(self.stub, b"body")
+
+    self.request.write.assert_not_called()
+
+class TestRespondWithStream (unittest.TestCase):
+  def setUp(self):
+    self.request = mock.NonCallableMock()
+    self.request.finished = False
+    self.request._disconnected = False
+    self.executor = mock.NonCallableMock(Executor)
+    self.executor.execute = mock.Mock()
+
+  def respondWith(self, policy, result):
+    requestDelegator = RequestDelegator(StubManager(), self.executor, policy)
+    dto = DTO(self.request, Stub("id1"), {})
+    dto.result = result
+    dto.rendered = True
+    return requestDelegator._respond(dto, self.request)
+
+  def testRespondWithInlineIterator(self):
+    done = self.respondWith(ExecutionPolicy.INLINE, Response(iter([b"a"]), 206, {b"content-type": b"text/plain"}))
+
+    self.assertIsInstance(done, Tw_Deferred)
+    self.request.setResponseCode.assert_called_once_with(206)
+    self.request.registerProducer.assert_called_once()
+    self.assertFalse(self.request.registerProducer.call_args[0][1])
+    for name, _ in (call[0] for call in self.request.setHeader.call_args_list):
+      self.assertNotEqual(name, b"content-length")
+
+  def testRespondWithThreadedIterator(self):
+    self.executor.execute.return_value = Tw_Deferred()
+    stream = iter([b"a"])
+
+    self.respondWith(ExecutionPolicy.THREAD_POOL, stream)
+
+    self.assertTrue(self.request.registerProducer.call_args[0][1])
+    self.executor.execute.assert_called_once_with(ExecutionPolicy.THREAD_POOL, next, stream, mock.ANY)
+
+  def testRespondWithAsyncIterator(self):
+    async def chunks():
+      yield b"a"
+
+    done = self.respondWith(ExecutionPolicy.THREAD_POOL, chunks())
+
+    self.request.write.assert_called_once_with(b"a")
+    self.request.finish.assert_called_once_with()
+    self.assertTrue(done.called)
+    self.executor.execute.assert_not_called()
+
+  def testFailAfterStreamStarted(self):
+    self.request.startedWriting = 1
+    requestDelegator = RequestDelegator(StubManager(), self.executor)
+
+    requestDelegator._fail(Tw_Failure(RuntimeError()), self.request)
+
+    self.request.finish.assert_not_called()
+
+class TestDelayAndBandwidth (unittest.TestCase):
+  def setUp(self):
+    self.clock = Tw_Clock()
+    self.request = mock.NonCallableMock()
+    self.request.finished = False
+    self.request._disconnected = False
+    self.request.method = b"GET"
+    self.request.path = b"/slow"
+    self.request.clientproto = b"HTTP/1.1"
+    self.request.responseHeaders.hasHeader = mock.Mock(return_value=False)
+    self.stubManager = StubManager()
+    self.requestDelegator = RequestDelegator(self.stubManager, Executor(), ExecutionPolicy.INLINE, clock=self.clock)
+
+  def testDelayIsScheduled(self):
+    stub = Stub("id1", delay=FixedDelay(0.5))
+    dto = DTO(self.request, stub, {})
+
+    delayed = self.requestDelegator._delay(dto)
+    results = []
+    delayed.addCallback(results.append)
+
+    self.clock.advance(0.4)
+    self.assertListEqual(results, [])
+    self.clock.advance(0.1)
+    self.assertListEqual(results, [dto])
+
+  def testNoDelay(self):
+    dto = DTO(self.request, Stub("id1"), {})
+
+    self.assertIs(self.requestDelegator._delay(dto), dto)
+
+  def testRenderWithDelayedStub(self):
+    renderCallable = mock.Mock(return_value=b"slow")
+    self.stubManager.addStub(DefaultStub("id1", renderCallable, PathMatcher("/slow"), delay=FixedDelay(1)))
+
+    self.requestDelegator.render(self.request)
+
+    renderCallable.assert_called_once()
+    self.request.write.assert_not_called()
+    self.clock.advance(1)
+    self.request.write.assert_called_once_with(b"slow")
+    self.request.finish.assert_called_once_with()
+
+  def testRenderWithDelayedStaticStub(self):
+    stub = StaticStub("id1", PathMatcher("/slow"), body=b"slow", delay=FixedDelay(1))
+    self.stubManager.addStub(stub)
+
+    self.requestDelegator.render(self.request)
+
+    self.request.channel.write.assert_not_called()
+    self.clock.advance(1)
+    self.request.channel.write.assert_called_once_with(stub.encoded)
+
+  def testRenderWithThrottledStub(self):
+    self.stubManager.addStub(DefaultStub("id1", lambda request, data: b"a" * 25, PathMatcher("/slow"), bandwidth=100))
+
+    self.requestDelegator.render(self.request)
+
+    self.request.setHeader.assert_any_call(b"content-length", b"25")
+    self.request.write.assert_called_once_with(b"a" * 10)
+    self.clock.advance(0.1)
+    self.clock.advance(0.1)
+    self.request.write.assert_called_with(b"a" * 5)
+    self.clock.advance(0.05)
+    self.request.finish.assert_called_once_with()
+
+  def testDelayedRequestsBeyondMaxInFlightFinishTogether(self):
+    admission = AdmissionController(2, 10)
+    requestDelegator = RequestDelegator(self.stubManager, Executor(), ExecutionPolicy.INLINE, admission, clock=self.clock)
+    self.stubManager.addStub(DefaultStub("id1", lambda request, data: b"slow", PathMatcher("/slow"), delay=FixedDelay(1)))
+    requests = []
+    for _ in range(6):
+      request = mock.NonCallableMock()
+      request.finished = False
+      request._disconnected = False
+      request.method = b"GET"
+      request.path = b"/slow"
+      request.clientproto = b"HTTP/1.1"
+      request.responseHeaders.hasHeader = mock.Mock(return_value=False)
+      requests.append(request)
+
+    for request in requests:
+      self.assertEqual(requestDelegator.render(request), Tw_NOT_DONE_YET)
+
+    # Every request waits out its delay without holding an admission slot
+    self.assertEqual(admission.inFlight, 0)
+    self.assertEqual(admission.getQueueDepth(), 0)
+    self.clock.advance(1)
+    for request in requests:
+      request.write.assert_called_once_with(b"slow")
+      request.finish.assert_called_once_with()
+
+class TestJournal (unittest.TestCase):
+  def setUp(self):
+    self.journal = RequestJournal()
+    self.stubManager = StubManager()
+    self.requestDelegator = RequestDelegator(self.stubManager, Executor(), ExecutionPolicy.INLINE, journal=self.journal)
+    self.request = mock.NonCallableMock()
+    self.request.finished = False
+    self.request._disconnected = False
+    self.request.method = b"GET"
+    self.request.path = b"/users"
+    self.request.uri = b"/users?page=2"
+    self.request.clientproto = b"HTTP/1.1"
+    self.request.content = None
+    self.request.getHeader = mock.Mock(return_value=None)
+    self.request.responseHeaders.hasHeader = mock.Mock(return_value=False)
+
+  def testRenderRecordsMatchedStub(self):
+    self.stubManager.addStub(DefaultStub("id1", lambda request, data: b"users", PathMatcher("/users")))
+
+    self.requestDelegator.render(self.request)
+
+    self.assertEqual(self.journal.count("id1"), 1)
+    entry = self.journal.getEntries()[0]
+    self.assertEqual(entry.path, "/users")
+    self.assertEqual(entry.query, "page=2")
+
+  def testRenderRecordsUnmatchedRequest(self):
+    self.requestDelegator.render(self.request)
+
+    self.assertEqual(self.journal.countUnmatched(), 1)
+
+  def testRenderRecordsStaticStub(self):
+    self.stubManager.addStub(StaticStub("id1", PathMatcher("/users")))
+
+    self.requestDelegator.render(self.request)
+
+    self.assertEqual(self.journal.count("id1"), 1)
+
+class TestMetrics (unittest.TestCase):
+  def setUp(self):
+    self.metrics = ServerMetrics()
+    self.stubManager = StubManager()
+    self.requestDelegator = RequestDelegator(self.stubManager, Executor(), ExecutionPolicy.INLINE, metrics=self.metrics)
+    self.request = mock.NonCallableMock()
+    self.request.finished = False
+    self.request._disconnected = False
+    self.request.method = b"GET"
+    self.request.path = b"/users/42"
+    self.request.clientproto = b"HTTP/1.1"
+    self.request.responseHeaders.hasHeader = mock.Mock(return_value=False)
+
+  def getCount(self, phase):
+    return self.metrics.histograms[phase].collect()[2]
+
+  def testRenderObservesEveryPhase(self):
+    self.stubManager.addStub(DefaultStub("id1", lambda request, data: b"user", PathMatcher("/users/{id}"), PathExtractor("/users/{id}")))
+
+    self.requestDelegator.render(self.request)
+
+    self.assertDictEqual(self.metrics.requests.collect(), {"id1": 1})
+    for phase in ServerMetrics.phases:
+      self.assertEqual(self.getCount(phase), 1, phase)
+    self.assertGreater(self.metrics.histograms["extraction"].collect()[1], 0)
+
+  def testRenderCountsUnmatchedRequests(self):
+    self.requestDelegator.render(self.request)
+
+    self.assertDictEqual(self.metrics.requests.collect(), {None: 1})
+    self.assertEqual(self.getCount("render"), 0)
+    self.assertEqual(self.getCount("total"), 1)
+
+  def testRenderObservesStaticStubs(self):
+    self.stubManager.addStub(StaticStub("id1", PathMatcher("/users/{id}")))
+
+    self.requestDelegator.render(self.request)
+
+    self.assertDictEqual(self.metrics.requests.collect(), {"id1": 1})
+    self.assertEqual(self.getCount("total"), 1)
+    self.assertEqual(self.getCount("lookup"), 0)
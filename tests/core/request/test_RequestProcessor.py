@@ -1,26 +1,29 @@
 import unittest
 from unittest import mock
 
+from mockwebserver.core.execution import ExecutionPolicy, Executor
 from mockwebserver.core.request import RequestProcessor
 from mockwebserver.core.stub import StubManager
 from mockwebserver.extraction.data import DTO
-from mockwebserver.stub import Stub
+from mockwebserver.extraction.extractor import Extract
+from mockwebserver.stub import Stub, DefaultStub, Response
 
 
 class TestProcessRequest (unittest.TestCase):
   def setUp(self):
     self.mockData = mock.NonCallableMagicMock(dict)
     self.mockStub = Stub("id1")
+    self.mockStub.matchesRequest = mock.Mock(return_value=True)
     self.mockStub.extractData = mock.Mock(return_value=self.mockData)
     self.mockStubManager = StubManager()
-    self.mockStubManager.findStubForRequest = mock.Mock(return_value=self.mockStub)
+    self.mockStubManager.addStub(self.mockStub)
 
   def testProcessRequestWithNoRequest(self):
     request = None
     requestProcessor = RequestProcessor(self.mockStubManager)
 
     self.assertRaises(ValueError, requestProcessor.processRequest, request)
-    self.mockStubManager.findStubForRequest.assert_not_called()
+    self.mockStub.matchesRequest.assert_not_called()
     self.mockStub.extractData.assert_not_called()
 
   def testProcessRequestWithRequestThatMatchesAStubWhichExtractsData(self):
@@ -33,7 +36,7 @@ class TestProcessRequest (unittest.TestCase):
     self.assertEqual(dto.request, request)
     self.assertEqual(dto.stub, self.mockStub)
     self.assertEqual(dto.data, self.mockData)
-    self.mockStubManager.findStubForRequest.assert_called_once_with(request)
+    self.mockStub.matchesRequest.assert_called_once_with(request)
     self.mockStub.extractData.assert_called_once_with(request)
 
   def testProcessRequestWithRequestThatMatchesAStubWhichFailsToExtractData(self):
@@ -47,12 +50,12 @@ class TestProcessRequest (unittest.TestCase):
     self.assertEqual(dto.request, request)
     self.assertEqual(dto.stub, self.mockStub)
     self.assertIsNone(dto.data)
-    self.mockStubManager.findStubForRequest.assert_called_once_with(request)
+    self.mockStub.matchesRequest.assert_called_once_with(request)
     self.mockStub.extractData.assert_called_once_with(request)
 
   def testProcessRequestWithRequestThatDoesNotMatchAStub(self):
     request = mock.NonCallableMock()
-    self.mockStubManager.findStubForRequest.return_value = None
+    self.mockStub.matchesRequest.return_value = False
     requestProcessor = RequestProcessor(self.mockStubManager)
     
     dto = requestProcessor.processRequest(request)
@@ -61,5 +64,118 @@ class TestProcessRequest (unittest.TestCase):
     self.assertEqual(dto.request, request)
     self.assertIsNone(dto.stub)
     self.assertIsNone(dto.data)
-    self.mockStubManager.findStubForRequest.assert_called_once_with(request)
-    self.mockStub.extractData.assert_not_called()
\ No newline at end of file
+    self.mockStub.matchesRequest.assert_called_once_with(request)
+    self.mockStub.extractData.assert_not_called()
+
+class TestStubRender (unittest.TestCase):
+  def setUp(self):
+    self.request = mock.NonCallableMock()
+    self.stub = Stub("id1")
+    self.stub.render = mock.Mock(return_value=b"body")
+    self.executor = Executor()
+
+  def testProcessRequestRendersWhenStubPolicyMatchesMatchingPolicy(self):
+    self.stub.matchesRequest = mock.Mock(return_value=True)
+    self.stub.extractData = mock.Mock(return_value={})
+    stubManager = StubManager()
+    stubManager.addStub(self.stub)
+    requestProcessor = RequestProcessor(stubManager, self.executor, ExecutionPolicy.INLINE)
+
+    dto = requestProcessor.processRequest(self.request, ExecutionPolicy.INLINE)
+
+    self.assertTrue(dto.rendered)
+    self.assertEqual(dto.result, b"body")
+
+  def testStubRenderWithStubOverridingPolicy(self):
+    self.stub.executionPolicy = ExecutionPolicy.INLINE
+    requestProcessor = RequestProcessor(StubManager(), self.executor, ExecutionPolicy.THREAD_POOL)
+    dto = DTO(self.request, self.stub, {})
+
+    results = []
+    requestProcessor.stubRender(dto).addCallback(results.append)
+
+    self.assertListEqual(results, [dto])
+    self.assertEqual(dto.result, b"body")
+    self.stub.render.assert_called_once_with(self.request, {})
+
+  def testStubRenderWithAlreadyRenderedDTO(self):
+    requestProcessor = RequestProcessor(StubManager(), self.executor)
+    dto = DTO(self.request, self.stub, {})
+    dto.rendered = True
+
+    self.assertIs(requestProcessor.stubRender(dto), dto)
+    self.stub.render.assert_not_called()
+
+  def testStubRenderWithNoStub(self):
+    requestProcessor = RequestProcessor(StubManager(), self.executor)
+    dto = DTO(self.request, None, None)
+
+    self.assertIs(requestProcessor.stubRender(dto), dto)
+
+class TestRenderStub (unittest.TestCase):
+  def setUp(self):
+    self.renderCallable = mock.Mock(return_value=Response(b"body", 200, {b"content-type": b"text/plain"}))
+    self.stub = DefaultStub("id1", self.renderCallable, deterministic=True)
+    self.requestProcessor = RequestProcessor(StubManager(), Executor())
+
+  def createDTO(self, value):
+    return DTO(mock.NonCallableMock(), self.stub, {"PATH": Extract([], {"id": value})})
+
+  def testRenderStubSkipsRenderOnHit(self):
+    response1 = self.requestProcessor.renderStub(self.createDTO("1"))
+    response2 = self.requestProcessor.renderStub(self.createDTO("1"))
+
+    self.assertIs(response1, response2)
+    self.renderCallable.assert_called_once()
+    self.assertEqual(self.stub.renderCache.hits, 1)
+    self.assertEqual(self.stub.renderCache.misses, 1)
+
+  def testRenderStubRendersDifferentData(self):
+    self.requestProcessor.renderStub(self.createDTO("1"))
+    self.requestProcessor.renderStub(self.createDTO("2"))
+
+    self.assertEqual(self.renderCallable.call_count, 2)
+
+  def testRenderStubKeepsHeadersSetOnRequest(self):
+    dto = self.createDTO("1")
+    dto.request.code = 201
+    dto.request.responseHeaders.getAllRawHeaders = mock.Mock(return_value=[(b"X-Test", [b"1"])])
+    self.renderCallable.return_value = b"body"
+
+    response = self.requestProcessor.renderStub(dto)
+
+    self.assertIsInstance(response, Response)
+    self.assertEqual(response.code, 201)
+    self.assertDictEqual(response.headers, {b"X-Test": [b"1"]})
+    self.assertIs(self.requestProcessor.renderStub(self.createDTO("1")), response)
+
+  def testRenderStubDoesNotKeepConnectionHeaders(self):
+    dto = self.createDTO("1")
+    dto.request.code = 200
+    dto.request.responseHeaders.getAllRawHeaders = mock.Mock(return_value=[
+      (b"Connection", [b"close"]), (b"Date", [b"Sun, 18 Oct 2026 13:00:00 GMT"]), (b"X-Test", [b"1"])
+    ])
+    self.renderCallable.return_value = b"body"
+
+    response = self.requestProcessor.renderStub(dto)
+
+    self.assertDictEqual(response.headers, {b"X-Test": [b"1"]})
+
+  def testRenderStubWithoutCache(self):
+    stub = DefaultStub("id2", self.renderCallable)
+    dto = DTO(mock.NonCallableMock(), stub, {})
+
+    self.requestProcessor.renderStub(dto)
+    self.requestProcessor.renderStub(dto)
+
+    self.assertIsNone(stub.renderCache)
+    self.assertEqual(self.renderCallable.call_count, 2)
+
+  def testRenderStubDoesNotRememberStreams(self):
+    self.renderCallable.side_effect = lambda request, data: Response(iter([b"a"]))
+
+    response1 = self.requestProcessor.renderStub(self.createDTO("1"))
+    response2 = self.requestProcessor.renderStub(self.createDTO("1"))
+
+    self.assertIsNot(response1, response2)
+    self.assertEqual(self.stub.renderCache.getStats()["entries"], 0)
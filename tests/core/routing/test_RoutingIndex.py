@@ -0,0 +1,189 @@
+import unittest
+from unittest import mock
+
+from twisted.web.http_headers import Headers as Tw_Headers
+
+from mockwebserver.stub import Stub, DefaultStub
+from mockwebserver.core.routing import RoutingIndex, patternSegments, stubSpecificity
+from mockwebserver.matching.header import HeaderMatcher, ContentTypeMatcher, AcceptMatcher
+from mockwebserver.matching.matcher import MethodMatcher, PathMatcher
+
+def createRequest(method, path):
+  request = mock.NonCallableMock()
+  request.method = method
+  request.path = path
+  return request
+
+class TestPatternSegments (unittest.TestCase):
+  def testPatternSegmentsWithEmptyPattern(self):
+    self.assertTupleEqual(patternSegments(""), ())
+
+  def testPatternSegmentsWithLiteralPattern(self):
+    self.assertTupleEqual(patternSegments("/this/is/a/path"), ("", "this", "is", "a", "path"))
+
+  def testPatternSegmentsWithFieldInSegment(self):
+    self.assertTupleEqual(patternSegments("/this/is/a/test{}/path"), ("", "this", "is", "a"))
+
+  def testPatternSegmentsWithStartingField(self):
+    self.assertTupleEqual(patternSegments("{}/a/test/path"), ())
+
+class TestStubSpecificity (unittest.TestCase):
+  def testStubSpecificity(self):
+    renderCallable = mock.Mock()
+    stub = DefaultStub("a", renderCallable, MethodMatcher("GET"), PathMatcher("/users/{id}/orders"), priority=2)
+
+    self.assertTupleEqual(stubSpecificity(stub), (2, 2, 2))
+
+  def testStubSpecificityWithoutMatchers(self):
+    self.assertTupleEqual(stubSpecificity(Stub("a")), (0, 0, 0))
+
+def buildIndex(stubs, positions):
+  # Built as the stub manager does, with every stub ranked by its position
+  return RoutingIndex().withChanges(stubs, (), lambda stub: positions[stub.id])
+
+def findCandidates(routingIndex, request, positions):
+  return list(routingIndex.iterCandidates(request, lambda stub: positions[stub.id]))
+
+class TestIterCandidates (unittest.TestCase):
+  def setUp(self):
+    self.renderCallable = mock.Mock()
+    self.getUsers = DefaultStub("getUsers", self.renderCallable, MethodMatcher("GET"), PathMatcher("/users"))
+    self.getUser = DefaultStub("getUser", self.renderCallable, MethodMatcher("GET"), PathMatcher("/users/{id}"))
+    self.postUser = DefaultStub("postUser", self.renderCallable, MethodMatcher("POST"), PathMatcher("/users"))
+    self.anyOrders = DefaultStub("anyOrders", self.renderCallable, PathMatcher("/orders/{}"))
+    self.fallback = Stub("fallback")
+    self.stubs = [self.getUsers, self.getUser, self.postUser, self.anyOrders, self.fallback]
+    self.positions = {stub.id: position for position, stub in enumerate(self.stubs)}
+    self.routingIndex = buildIndex(self.stubs, self.positions)
+
+  def findCandidates(self, routingIndex, method, path):
+    return findCandidates(routingIndex, createRequest(method, path), self.positions)
+
+  def testIterCandidatesWithNoRequest(self):
+    self.assertRaises(ValueError, self.routingIndex.iterCandidates, None, lambda stub: 0)
+
+  def testIterCandidatesWithMatchingMethodAndPath(self):
+    candidates = self.findCandidates(self.routingIndex, b"GET", b"/users/42")
+
+    self.assertListEqual(candidates, [self.getUsers, self.getUser, self.fallback])
+
+  def testIterCandidatesWithOtherMethod(self):
+    candidates = self.findCandidates(self.routingIndex, b"POST", b"/users")
+
+    self.assertListEqual(candidates, [self.postUser, self.fallback])
+
+  def testIterCandidatesWithUnknownPath(self):
+    candidates = self.findCandidates(self.routingIndex, b"GET", b"/products")
+
+    self.assertListEqual(candidates, [self.fallback])
+
+  def testIterCandidatesWithAnyMethodStub(self):
+    candidates = self.findCandidates(self.routingIndex, b"DELETE", b"/orders/1")
+
+    self.assertListEqual(candidates, [self.anyOrders, self.fallback])
+
+  def testIterCandidatesKeepsRankOrder(self):
+    self.positions = {"fallback": 0, "getUser": 1, "getUsers": 2, "postUser": 3, "anyOrders": 4}
+    routingIndex = buildIndex(self.stubs, self.positions)
+
+    candidates = self.findCandidates(routingIndex, b"GET", b"/users/42")
+
+    self.assertListEqual(candidates, [self.fallback, self.getUser, self.getUsers])
+
+  def testIterCandidatesMergesListsByRank(self):
+    rank = {"getUser": 0, "fallback": 1, "getUsers": 2, "postUser": 3, "anyOrders": 4}.__getitem__
+    routingIndex = RoutingIndex().withChanges(self.stubs, (), lambda stub: rank(stub.id))
+
+    candidates = routingIndex.iterCandidates(createRequest(b"GET", b"/users/42"), lambda stub: rank(stub.id))
+
+    self.assertListEqual(list(candidates), [self.getUser, self.fallback, self.getUsers])
+
+  def testAddedStubsAreSortedByRank(self):
+    routingIndex = buildIndex([self.getUser, self.fallback], self.positions).withChanges([self.getUsers], (), lambda stub: self.positions[stub.id])
+
+    candidates = self.findCandidates(routingIndex, b"GET", b"/users/42")
+
+    self.assertListEqual(candidates, [self.getUsers, self.getUser, self.fallback])
+
+class TestCopyOnWrite (unittest.TestCase):
+  def setUp(self):
+    self.renderCallable = mock.Mock()
+    self.getUser = DefaultStub("getUser", self.renderCallable, MethodMatcher("GET"), PathMatcher("/users/{id}"))
+    self.getOrder = DefaultStub("getOrder", self.renderCallable, MethodMatcher("GET"), PathMatcher("/users/{id}/orders/{order}"))
+    self.positions = {"getUser": 0, "getOrder": 1}
+    self.request = createRequest(b"GET", b"/users/1/orders/2")
+
+  def testAddingLeavesOriginalUnchanged(self):
+    original = buildIndex([self.getUser], self.positions)
+
+    updated = original.withChanges([self.getOrder], (), lambda stub: self.positions[stub.id])
+
+    self.assertListEqual(findCandidates(original, self.request, self.positions), [self.getUser])
+    self.assertListEqual(findCandidates(updated, self.request, self.positions), [self.getUser, self.getOrder])
+
+  def testRemovingLeavesOriginalUnchanged(self):
+    original = buildIndex([self.getUser, self.getOrder], self.positions)
+
+    updated = original.withChanges(removed=[self.getUser])
+
+    self.assertListEqual(findCandidates(original, self.request, self.positions), [self.getUser, self.getOrder])
+    self.assertListEqual(findCandidates(updated, self.request, self.positions), [self.getOrder])
+
+  def testRemovingPrunesEmptyRoutes(self):
+    original = buildIndex([self.getUser], self.positions)
+
+    updated = original.withChanges(removed=[self.getUser])
+
+    self.assertDictEqual(updated._roots, {})
+    self.assertDictEqual(updated.withChanges(removed=[self.getUser])._roots, {})
+
+  def testSwappingStubWithSameId(self):
+    original = buildIndex([self.getUser], self.positions)
+    replacement = DefaultStub("getUser", self.renderCallable, MethodMatcher("GET"), PathMatcher("/users/{id}/orders/{order}"))
+
+    updated = original.withChanges([replacement], [self.getUser], lambda stub: self.positions[stub.id])
+
+    self.assertListEqual(findCandidates(updated, self.request, self.positions), [replacement])
+    self.assertListEqual(findCandidates(original, self.request, self.positions), [self.getUser])
+
+class TestRoutingGuards (unittest.TestCase):
+  def setUp(self):
+    self.renderCallable = mock.Mock()
+    self.json = DefaultStub("json", self.renderCallable, PathMatcher("/users"), ContentTypeMatcher("application/json"))
+    self.xml = DefaultStub("xml", self.renderCallable, PathMatcher("/users"), ContentTypeMatcher("application/xml"))
+    self.beta = DefaultStub("beta", self.renderCallable, PathMatcher("/users"), HeaderMatcher("X-Channel", "beta"))
+    self.accept = DefaultStub("accept", self.renderCallable, PathMatcher("/users"), AcceptMatcher("text/csv"))
+    self.stubs = [self.json, self.xml, self.beta, self.accept]
+    self.positions = {stub.id: position for position, stub in enumerate(self.stubs)}
+    self.routingIndex = buildIndex(self.stubs, self.positions)
+
+  def findCandidates(self, routingIndex, headers):
+    request = createRequest(b"POST", b"/users")
+    request.requestHeaders = Tw_Headers(headers)
+    return findCandidates(routingIndex, request, self.positions)
+
+  def testGuardedStubsAreLookedUp(self):
+    candidates = self.findCandidates(self.routingIndex, {b"content-type": [b"application/json; charset=utf-8"]})
+
+    # Accept matchers offer no guard, so their stubs are always candidates
+    self.assertListEqual(candidates, [self.json, self.accept])
+
+  def testGuardWithRepeatedHeaderValue(self):
+    candidates = self.findCandidates(self.routingIndex, {b"x-channel": [b"beta", b"beta"]})
+
+    self.assertListEqual(candidates, [self.beta, self.accept])
+
+  def testWithoutGuardedStub(self):
+    updated = self.routingIndex.withChanges(removed=[self.json])
+
+    self.assertListEqual(self.findCandidates(updated, {b"content-type": [b"application/json"]}), [self.accept])
+    self.assertListEqual(self.findCandidates(self.routingIndex, {b"content-type": [b"application/json"]}), [self.json, self.accept])
+    self.assertListEqual(self.findCandidates(updated, {b"content-type": [b"application/xml"]}), [self.xml, self.accept])
+
+  def testWithoutAllGuardedStubsPrunesRoutes(self):
+    updated = buildIndex([self.json, self.beta], self.positions).withChanges(removed=[self.json, self.beta])
+
+    self.assertDictEqual(updated._roots, {})
+
+if __name__ == "__main__":
+  unittest.main()
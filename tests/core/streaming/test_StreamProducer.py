@@ -0,0 +1,240 @@
+import unittest
+from unittest import mock
+
+from twisted.internet.defer import Deferred as Tw_Deferred, succeed as Tw_succeed, ensureDeferred as Tw_ensureDeferred
+from twisted.internet.task import Clock as Tw_Clock
+
+from mockwebserver.core.streaming import isStream, nextAsyncChunk, endOfStream, IteratorProducer, DeferredChunkProducer
+
+def createRequest():
+  request = mock.NonCallableMock()
+  request.written = []
+  request.write = mock.Mock(side_effect=request.written.append)
+  return request
+
+class TestIsStream (unittest.TestCase):
+  def testIsStream(self):
+    async def chunks():
+      yield b"a"
+
+    self.assertTrue(isStream(iter([b"a"])))
+    self.assertTrue(isStream(chunk for chunk in [b"a"]))
+    self.assertTrue(isStream(chunks()))
+
+  def testIsStreamWithBytesOrLists(self):
+    self.assertFalse(isStream(b"body"))
+    self.assertFalse(isStream([b"a", b"b"]))
+
+class TestIteratorProducer (unittest.TestCase):
+  def setUp(self):
+    self.request = createRequest()
+
+  def testStartRegistersPullProducer(self):
+    producer = IteratorProducer(self.request, iter([b"a"]))
+
+    producer.start()
+
+    self.request.registerProducer.assert_called_once_with(producer, False)
+    self.request.write.assert_not_called()
+
+  def testResumeProducingWritesOneChunk(self):
+    producer = IteratorProducer(self.request, iter([b"a", b"b"]))
+    done = producer.start()
+
+    producer.resumeProducing()
+
+    self.assertListEqual(self.request.written, [b"a"])
+    self.assertFalse(done.called)
+
+  def testResumeProducingFinishesAtTheEnd(self):
+    producer = IteratorProducer(self.request, iter([b"a", b"b"]))
+    done = producer.start()
+
+    for _ in range(3):
+      producer.resumeProducing()
+
+    self.assertListEqual(self.request.written, [b"a", b"b"])
+    self.request.unregisterProducer.assert_called_once_with()
+    self.request.finish.assert_called_once_with()
+    self.assertTrue(done.called)
+    self.assertEqual(producer.chunks, 2)
+
+  def testResumeProducingWithFailingStream(self):
+    def chunks():
+      yield b"a"
+      raise RuntimeError()
+    producer = IteratorProducer(self.request, chunks())
+    done = producer.start()
+    failures = []
+    done.addErrback(failures.append)
+
+    producer.resumeProducing()
+    producer.resumeProducing()
+
+    self.request.loseConnection.assert_called_once_with()
+    self.request.finish.assert_not_called()
+    self.assertEqual(len(failures), 1)
+    self.assertIsInstance(failures[0].value, RuntimeError)
+
+  def testResumeProducingWithInvalidChunk(self):
+    producer = IteratorProducer(self.request, iter(["text"]))
+    done = producer.start()
+    failures = []
+    done.addErrback(failures.append)
+
+    producer.resumeProducing()
+
+    self.assertIsInstance(failures[0].value, TypeError)
+    self.request.write.assert_not_called()
+
+  def testStopProducingClosesGenerator(self):
+    closed = []
+    def chunks():
+      try:
+        yield b"a"
+        yield b"b"
+      finally:
+        closed.append(True)
+    producer = IteratorProducer(self.request, chunks())
+    done = producer.start()
+    producer.resumeProducing()
+
+    producer.stopProducing()
+    producer.resumeProducing()
+
+    self.assertListEqual(closed, [True])
+    self.assertListEqual(self.request.written, [b"a"])
+    self.assertTrue(done.called)
+    self.request.finish.assert_not_called()
+
+class TestDeferredChunkProducer (unittest.TestCase):
+  def setUp(self):
+    self.request = createRequest()
+
+  def testStartWritesAvailableChunks(self):
+    stream = iter([b"a", b"b", b"c"])
+    producer = DeferredChunkProducer(self.request, stream, lambda: Tw_succeed(next(stream, endOfStream)))
+
+    done = producer.start()
+
+    self.request.registerProducer.assert_called_once_with(producer, True)
+    self.assertListEqual(self.request.written, [b"a", b"b", b"c"])
+    self.request.finish.assert_called_once_with()
+    self.assertTrue(done.called)
+
+  def testPauseProducingWaitsForResume(self):
+    pending = []
+    producer = DeferredChunkProducer(self.request, iter(()), lambda: pending.append(Tw_Deferred()) or pending[-1])
+    producer.start()
+
+    producer.pauseProducing()
+    pending[0].callback(b"a")
+
+    self.assertListEqual(self.request.written, [b"a"])
+    self.assertEqual(len(pending), 1)
+    producer.resumeProducing()
+    self.assertEqual(len(pending), 2)
+
+  def testAsyncIterator(self):
+    async def chunks():
+      yield b"a"
+      yield b"b"
+    stream = chunks()
+    producer = DeferredChunkProducer(self.request, stream, lambda: Tw_ensureDeferred(nextAsyncChunk(stream)))
+
+    done = producer.start()
+
+    self.assertListEqual(self.request.written, [b"a", b"b"])
+    self.assertTrue(done.called)
+
+  def testFailingChunk(self):
+    producer = DeferredChunkProducer(self.request, iter(()), lambda: Tw_Deferred())
+    pending = Tw_Deferred()
+    producer._nextChunk = lambda: pending
+    done = producer.start()
+    failures = []
+    done.addErrback(failures.append)
+
+    pending.errback(RuntimeError())
+
+    self.request.loseConnection.assert_called_once_with()
+    self.assertIsInstance(failures[0].value, RuntimeError)
+
+  def testStopProducingWhileWaitingClosesLater(self):
+    closed = []
+    def chunks():
+      try:
+        yield b"a"
+      finally:
+        closed.append(True)
+    stream = chunks()
+    pending = Tw_Deferred()
+    producer = DeferredChunkProducer(self.request, stream, lambda: pending)
+    producer.start()
+    next(stream)
+
+    producer.stopProducing()
+    self.assertListEqual(closed, [])
+    pending.callback(b"a")
+
+    self.assertListEqual(closed, [True])
+    self.request.write.assert_not_called()
+
+if __name__ == "__main__":
+  unittest.main()
+
+class TestThrottling (unittest.TestCase):
+  def setUp(self):
+    self.request = createRequest()
+    self.clock = Tw_Clock()
+
+  def createProducer(self, chunks, bandwidth):
+    stream = iter(chunks)
+    return DeferredChunkProducer(self.request, stream, lambda: Tw_succeed(next(stream, endOfStream)), bandwidth, self.clock)
+
+  def testInitWithInvalidBandwidth(self):
+    self.assertRaises(ValueError, self.createProducer, [], 0)
+
+  def testChunksAreSplitIntoTicks(self):
+    producer = self.createProducer([b"a" * 250], 1000)
+
+    done = producer.start()
+
+    self.assertListEqual(self.request.written, [b"a" * 100])
+    self.clock.advance(0.1)
+    self.assertListEqual(self.request.written, [b"a" * 100] * 2)
+    self.clock.advance(0.1)
+    self.assertListEqual(self.request.written, [b"a" * 100] * 2 + [b"a" * 50])
+    self.assertFalse(done.called)
+    self.clock.advance(0.05)
+    self.assertTrue(done.called)
+    self.request.finish.assert_called_once_with()
+
+  def testNextChunkWaitsForThePreviousOne(self):
+    producer = self.createProducer([b"ab", b"cd"], 20)
+
+    producer.start()
+
+    self.assertListEqual(self.request.written, [b"ab"])
+    self.clock.advance(0.1)
+    self.assertListEqual(self.request.written, [b"ab", b"cd"])
+
+  def testPauseProducingHoldsThePendingSlice(self):
+    producer = self.createProducer([b"a" * 200], 1000)
+    producer.start()
+
+    producer.pauseProducing()
+    self.clock.advance(1)
+    self.assertEqual(len(self.request.written), 1)
+    producer.resumeProducing()
+
+    self.assertEqual(len(self.request.written), 2)
+
+  def testStopProducingCancelsTheNextTick(self):
+    producer = self.createProducer([b"a" * 200], 1000)
+    producer.start()
+
+    producer.stopProducing()
+
+    self.assertListEqual(self.clock.getDelayedCalls(), [])
+    self.assertEqual(len(self.request.written), 1)
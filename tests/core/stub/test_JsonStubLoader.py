@@ -0,0 +1,183 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from twisted.web.http_headers import Headers as Tw_Headers
+
+from mockwebserver.core.delay import UniformDelay
+from mockwebserver.core.stub import StubManager, JsonStubLoader
+from mockwebserver.stub import DefaultStub, Response
+from mockwebserver.matching.body import BodyRegexMatcher, BodyContainsMatcher, BodyExcludesMatcher, JsonPathMatcher
+from mockwebserver.matching.header import HeaderMatcher, HeaderPatternMatcher, ContentTypeMatcher, AcceptMatcher, CookieMatcher
+from mockwebserver.matching.logic import AndMatcher, OrMatcher, NotMatcher
+from mockwebserver.matching.matcher import MethodMatcher, PathMatcher, QueryMatcher
+
+definitions = {
+  "stubs": [
+    {
+      "id": "getUser",
+      "request": {"method": "get", "path": "/users/{id}", "headers": {"Accept": "application/json"}},
+      "response": {"status": 200, "headers": {"Content-Type": "application/json"}, "template": "{\"id\": \"${id}\"}"}
+    },
+    {
+      "id": "health",
+      "request": {"path": "/health"},
+      "response": {"body": "ok"}
+    }
+  ]
+}
+
+def createRequest(method, path, headers={}):
+  request = mock.NonCallableMock()
+  request.method = method
+  request.path = path
+  request.getHeader = mock.Mock(side_effect=lambda name: headers.get(name))
+  request.requestHeaders = Tw_Headers({name: [value] for name, value in headers.items()})
+  return request
+
+class TestCompile (unittest.TestCase):
+  def testCompileWithDefinitions(self):
+    stubs = JsonStubLoader([]).compile(definitions)
+
+    self.assertListEqual([stub.id for stub in stubs], ["getUser", "health"])
+    self.assertIsInstance(stubs[0], DefaultStub)
+    self.assertListEqual([type(matcher) for matcher in stubs[0].matchers], [MethodMatcher, PathMatcher, HeaderMatcher])
+    self.assertListEqual([type(matcher) for matcher in stubs[1].matchers], [PathMatcher])
+
+  def testCompileSharesPatternsBetweenMatchersAndExtractors(self):
+    stub = JsonStubLoader([]).compile([{"id": "a", "request": {"path": "/users/{id}", "query": {"page": "{:d}"}}}])[0]
+
+    self.assertListEqual([type(matcher) for matcher in stub.matchers], [PathMatcher, QueryMatcher])
+    self.assertIs(stub.matchers[0]._extractor, stub.extractors[0])
+    self.assertIs(stub.matchers[1]._extractor, stub.extractors[1])
+    self.assertEqual(stub.matchers[0].pattern, "/users/{id}")
+    self.assertEqual(stub.matchers[1].parameters, (("page", "{:d}"),))
+
+  def testCompileWithHeaderMatchers(self):
+    stub = JsonStubLoader([]).compile([{"id": "a", "request": {
+      "headers": {"X-Version": {"pattern": "2\\..*"}},
+      "contentType": "application/json",
+      "accept": "application/json",
+      "cookies": {"session": "abc"}
+    }}])[0]
+
+    self.assertListEqual(
+      [type(matcher) for matcher in stub.matchers], [HeaderPatternMatcher, ContentTypeMatcher, AcceptMatcher, CookieMatcher]
+    )
+    request = createRequest(b"POST", b"/", {
+      b"x-version": b"2.1", b"content-type": b"application/json", b"accept": b"*/*", b"cookie": b"session=abc"
+    })
+    self.assertTrue(stub.matchesRequest(request))
+
+  def testCompileWithBodyMatchers(self):
+    stub = JsonStubLoader([]).compile([{"id": "a", "request": {"body": {
+      "regex": "\\d+", "contains": ["order"], "excludes": "test", "json": {"$.type": "order"}, "jsonPaths": "$.id"
+    }}}])[0]
+
+    self.assertListEqual(
+      [type(matcher) for matcher in stub.matchers],
+      [BodyRegexMatcher, BodyContainsMatcher, BodyExcludesMatcher, JsonPathMatcher, JsonPathMatcher]
+    )
+    request = createRequest(b"POST", b"/")
+    request.content = io.BytesIO(b"{\"type\": \"order\", \"id\": 1}")
+    self.assertTrue(stub.matchesRequest(request))
+
+  def testCompileWithLogicSections(self):
+    stub = JsonStubLoader([]).compile([{"id": "a", "request": {
+      "path": "/orders",
+      "anyOf": [{"method": "GET"}, {"method": "POST", "contentType": "application/json"}],
+      "not": {"headers": {"X-Mode": "test"}}
+    }}])[0]
+
+    self.assertListEqual([type(matcher) for matcher in stub.matchers], [PathMatcher, OrMatcher, NotMatcher])
+    self.assertIsInstance(stub.matchers[1].matchers[1], AndMatcher)
+    self.assertTrue(stub.matchesRequest(createRequest(b"POST", b"/orders", {b"content-type": b"application/json"})))
+    self.assertFalse(stub.matchesRequest(createRequest(b"POST", b"/orders")))
+    self.assertFalse(stub.matchesRequest(createRequest(b"GET", b"/orders", {b"x-mode": b"test"})))
+
+  def testCompileWithEmptyLogicSection(self):
+    self.assertRaises(ValueError, JsonStubLoader([]).compile, [{"id": "a", "request": {"anyOf": [{}]}}])
+
+  def testCompileWithPriority(self):
+    stubs = JsonStubLoader([]).compile([{"id": "a", "priority": 5}, {"id": "b"}])
+
+    self.assertListEqual([stub.priority for stub in stubs], [5, 0])
+
+  def testCompileWithInvalidDocument(self):
+    self.assertRaises(ValueError, JsonStubLoader([]).compile, {"stubs": {}})
+
+  def testCompileWithDefinitionMissingId(self):
+    self.assertRaisesRegex(ValueError, "definition 0", JsonStubLoader([]).compile, [{"request": {"path": "/"}}])
+
+  def testCompileWithUnknownMethod(self):
+    self.assertRaises(ValueError, JsonStubLoader([]).compile, [{"id": "a", "request": {"method": "FETCH"}}])
+
+  def testRenderStaticResponseIsEncodedOnce(self):
+    stub = JsonStubLoader([]).compile(definitions)[1]
+
+    response1 = stub.render(createRequest(b"GET", b"/health"), {})
+    response2 = stub.render(createRequest(b"GET", b"/health"), {})
+
+    self.assertIs(response1, response2)
+    self.assertEqual(response1.body, b"ok")
+
+  def testRenderTemplatedResponse(self):
+    stubManager = StubManager()
+    stubManager.addStubs(JsonStubLoader([]).compile(definitions))
+    request = createRequest(b"GET", b"/users/42", {b"accept": b"application/json"})
+
+    stub, data = stubManager.findStubAndDataForRequest(request)
+    response = stub.render(request, data)
+
+    self.assertEqual(stub.id, "getUser")
+    self.assertIsInstance(response, Response)
+    self.assertEqual(response.body, b'{"id": "42"}')
+    self.assertDictEqual(response.headers, {b"Content-Type": b"application/json"})
+
+  def testCompileWithDelayAndBandwidth(self):
+    stubs = JsonStubLoader([]).compile([
+      {"id": "slow", "response": {"delay": {"uniform": [0.1, 0.2]}, "bandwidth": 1024}},
+      {"id": "fast", "response": {}}
+    ])
+
+    self.assertIsInstance(stubs[0].delay, UniformDelay)
+    self.assertEqual(stubs[0].bandwidth, 1024)
+    self.assertIsNone(stubs[1].delay)
+    self.assertIsNone(stubs[1].bandwidth)
+
+  def testCompileWithInvalidDelay(self):
+    self.assertRaises(ValueError, JsonStubLoader([]).compile, [{"id": "slow", "response": {"delay": {"random": 1}}}])
+
+class TestLoad (unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+    self.stubsDirectory = os.path.join(self.directory.name, "stubs")
+    os.makedirs(self.stubsDirectory)
+    with open(os.path.join(self.stubsDirectory, "b.json"), "w") as file:
+      json.dump(definitions, file)
+    with open(os.path.join(self.stubsDirectory, "a.json"), "w") as file:
+      json.dump([{"id": "first", "request": {"path": "/first"}}], file)
+    with open(os.path.join(self.stubsDirectory, "notes.txt"), "w") as file:
+      file.write("not a stub file")
+
+  def tearDown(self):
+    self.directory.cleanup()
+
+  def testLoadDirectory(self):
+    stubs = JsonStubLoader([self.stubsDirectory]).load()
+
+    self.assertListEqual([stub.id for stub in stubs], ["first", "getUser", "health"])
+
+  def testLoadInto(self):
+    stubManager = StubManager()
+
+    results = JsonStubLoader([self.stubsDirectory]).loadInto(stubManager)
+
+    self.assertListEqual(results, [(True, "")] * 3)
+    self.assertTrue(stubManager.hasStub("health"))
+
+if __name__ == "__main__":
+  unittest.main()
@@ -1,8 +1,10 @@
+import threading
 import unittest
 from unittest import mock
 
-from mockwebserver.stub import Stub
+from mockwebserver.stub import Stub, DefaultStub, StaticStub
 from mockwebserver.core.stub import StubManager
+from mockwebserver.matching.matcher import MethodMatcher, PathMatcher
 
 class TestAddStub (unittest.TestCase):
   def testAddStubWithNone(self):
@@ -24,8 +26,7 @@ class TestAddStub (unittest.TestCase):
     stub1 = Stub("id1")
     stub2 = Stub("id1")
     stubManager = StubManager()
-    stubManager._stubs.append(stub1)
-    stubManager._stub_ids.append(stub1.id)
+    stubManager.addStub(stub1)
 
     success, error = stubManager.addStub(stub2)
 
@@ -36,8 +37,7 @@ class TestAddStub (unittest.TestCase):
     stub1 = Stub("id1")
     stub2 = Stub("id2")
     stubManager = StubManager()
-    stubManager._stubs.append(stub1)
-    stubManager._stub_ids.append(stub1.id)
+    stubManager.addStub(stub1)
 
     success, error = stubManager.addStub(stub2)
 
@@ -57,8 +57,7 @@ class TestAddStubs (unittest.TestCase):
 
     self.assertListEqual(stubManager.addStubs(stubs), [(True, ''), (True, ''), (True, '')])
 
-    self.assertEqual(len(stubManager._stubs), 3)
-    self.assertEqual(len(stubManager._stub_ids), 3)
+    self.assertEqual(len(stubManager.getStubs()), 3)
 
   def testAddStubsWithSomeNullStubs(self):
     stubs = [Stub("id1"), Stub("id2"), None]
@@ -66,36 +65,102 @@ class TestAddStubs (unittest.TestCase):
 
     self.assertListEqual(stubManager.addStubs(stubs), [(True, ''), (True, ''), (False, "Item is not a stub")])
 
-    self.assertEqual(len(stubManager._stubs), 2)
-    self.assertEqual(len(stubManager._stub_ids), 2)
+    self.assertEqual(len(stubManager.getStubs()), 2)
 
   def testAddStubWithSomeNewStubsAndSomeOldStubs(self):
     oldStubs = [Stub("id1")]
     newStubs = [Stub("id2"), Stub("id3")]
     newStubs.extend(oldStubs)
     stubManager = StubManager()
-    stubManager._stubs.extend(oldStubs)
-    stubManager._stub_ids.extend([ oldStub.id for oldStub in oldStubs ])
+    stubManager.addStubs(oldStubs)
 
     self.assertListEqual(
       stubManager.addStubs(newStubs),
       [(True, ''), (True, ''), (False, "Stub with ID id1 has already been added")]
     )
 
-    self.assertEqual(stubManager._stubs.count(oldStubs[0]), 1)
-    self.assertEqual(stubManager._stub_ids.count(oldStubs[0].id), 1)
+    self.assertEqual(stubManager.getStubs().count(oldStubs[0]), 1)
+    self.assertEqual(stubManager.findStubIndex(oldStubs[0].id), 0)
 
   def testaddStubsWithDifferentStubs(self):
     oldStubs = [Stub("id1"), Stub("id2")]
     newStubs = [Stub("id3"), Stub("id4")]
     stubManager = StubManager()
-    stubManager._stubs.extend(oldStubs)
-    stubManager._stub_ids.extend([ oldStub.id for oldStub in oldStubs ])
+    stubManager.addStubs(oldStubs)
 
     self.assertListEqual(stubManager.addStubs(newStubs), [(True, ''), (True, '')])
 
-    self.assertEqual(len(stubManager._stubs), 4)
-    self.assertEqual(len(stubManager._stub_ids), 4)
+    self.assertEqual(len(stubManager.getStubs()), 4)
+
+class TestBulkOperations (unittest.TestCase):
+  def setUp(self):
+    self.request = mock.NonCallableMock()
+    self.request.method = b"GET"
+    self.request.path = b"/users/42"
+    self.renderCallable = mock.Mock()
+    self.stubs = [
+      DefaultStub("id{}".format(index), self.renderCallable, MethodMatcher("GET"), PathMatcher("/users/{}".format(index)))
+      for index in range(50)
+    ]
+    self.stubManager = StubManager()
+    self.stubManager.addStubs(self.stubs)
+
+  def testAddStubsWithDuplicateIdsInBatch(self):
+    stubManager = StubManager()
+
+    results = stubManager.addStubs([Stub("id1"), Stub("id1")])
+
+    self.assertListEqual(results, [(True, ""), (False, "Stub with ID id1 has already been added")])
+    self.assertEqual(len(stubManager.getStubs()), 1)
+
+  def testAddStubsPublishesOneSnapshot(self):
+    snapshot = self.stubManager.getSnapshot()
+
+    self.stubManager.addStubs([Stub("new1"), Stub("new2")])
+
+    self.assertEqual(len(snapshot.stubs), 50)
+    self.assertEqual(self.stubManager.findStubIndex("new2"), 51)
+
+  def testRemoveStubs(self):
+    removed = self.stubManager.removeStubs(["id42", "unknown", "id0", "id42"])
+
+    self.assertListEqual(removed, [self.stubs[42], None, self.stubs[0], None])
+    self.assertEqual(len(self.stubManager.getStubs()), 48)
+    self.assertEqual(self.stubManager.findStubIndex("id1"), 0)
+    self.assertFalse(self.stubManager.hasStub("id42"))
+    self.assertIsNone(self.stubManager.findStubForRequest(self.request))
+
+  def testReplaceStubs(self):
+    replacement = DefaultStub("id42", self.renderCallable, MethodMatcher("GET"), PathMatcher("/users/{id}"))
+
+    results = self.stubManager.replaceStubs([replacement, Stub("unknown")])
+
+    self.assertListEqual(results, [(True, ""), (False, "Could not find old stub with ID unknown")])
+    self.assertEqual(self.stubManager.findStubIndex("id42"), 42)
+    self.assertIs(self.stubManager.findStub("id42"), replacement)
+    self.request.path = b"/users/7"
+    self.assertIs(self.stubManager.findStubForRequest(self.request), self.stubs[7])
+    self.request = mock.NonCallableMock()
+    self.request.method = b"GET"
+    self.request.path = b"/users/other"
+    self.assertIs(self.stubManager.findStubForRequest(self.request), replacement)
+
+  def testUpdateStubsAppliesBatchTogether(self):
+    readded = Stub("id3")
+
+    added, replaced, removed = self.stubManager.updateStubs(
+      add=[readded, Stub("id4")], replace=[Stub("id5")], remove=["id3"]
+    )
+
+    self.assertListEqual(added, [(True, ""), (False, "Stub with ID id4 has already been added")])
+    self.assertListEqual(replaced, [(True, "")])
+    self.assertListEqual(removed, [self.stubs[3]])
+    self.assertEqual(self.stubManager.findStubIndex("id3"), 49)
+    self.assertEqual(self.stubManager.findStubIndex("id5"), 4)
+
+  def testBulkOperationsWithNone(self):
+    self.assertRaises(ValueError, self.stubManager.replaceStubs, None)
+    self.assertRaises(ValueError, self.stubManager.removeStubs, None)
 
 class TestFindStubForRequest (unittest.TestCase):
   def testFindStubForRequestWithNone(self):
@@ -166,5 +231,223 @@ class TestFindStubForRequest (unittest.TestCase):
     stub2.matchesRequest.assert_called_once_with(request)
     stub3.matchesRequest.assert_called_once_with(request)
 
+  def testFindStubForRequestOnlyEvaluatesRoutedStubs(self):
+    request = mock.NonCallableMock()
+    request.method = b"GET"
+    request.path = b"/users/42"
+    renderCallable = mock.Mock()
+    stub1 = DefaultStub("id1", renderCallable, MethodMatcher("POST"), PathMatcher("/users/{id}"))
+    stub2 = DefaultStub("id2", renderCallable, MethodMatcher("GET"), PathMatcher("/orders/{id}"))
+    stub3 = DefaultStub("id3", renderCallable, MethodMatcher("GET"), PathMatcher("/users/{id}"))
+    for stub in (stub1, stub2, stub3):
+      stub.matchesRequest = mock.Mock(return_value=True)
+    stubManager = StubManager()
+    stubManager.addStubs([stub1, stub2, stub3])
+
+    stub = stubManager.findStubForRequest(request)
+
+    self.assertEqual(stub, stub3)
+    stub1.matchesRequest.assert_not_called()
+    stub2.matchesRequest.assert_not_called()
+
+  def testFindStubForRequestAfterInsertAndRemove(self):
+    request = mock.NonCallableMock()
+    request.method = b"GET"
+    request.path = "/users/42"
+    renderCallable = mock.Mock()
+    stub1 = DefaultStub("id1", renderCallable, MethodMatcher("GET"), PathMatcher("/users/{id}"))
+    stub2 = DefaultStub("id2", renderCallable, MethodMatcher("GET"), PathMatcher("/users/{id}"))
+    stub3 = DefaultStub("id3", renderCallable, PathMatcher("/users/{id}"))
+    stubManager = StubManager()
+    stubManager.addStubs([stub1, stub2])
+    stubManager.insertStub(0, stub3)
+
+    self.assertEqual(stubManager.findStubForRequest(request), stub3)
+    stubManager.removeStubAt(0)
+    self.assertEqual(stubManager.findStubForRequest(request), stub1)
+    stubManager.removeAllStubs()
+    self.assertIsNone(stubManager.findStubForRequest(request))
+
+class TestFindStaticStubForRequest (unittest.TestCase):
+  def setUp(self):
+    self.request = mock.NonCallableMock()
+    self.request.method = b"GET"
+    self.request.path = b"/users/42"
+    self.stubManager = StubManager()
+
+  def testFindStaticStubForRequest(self):
+    stub1 = StaticStub("id1", PathMatcher("/orders/{id}"))
+    stub2 = StaticStub("id2", PathMatcher("/users/{id}"))
+    self.stubManager.addStubs([stub1, stub2])
+
+    self.assertEqual(self.stubManager.findStaticStubForRequest(self.request), stub2)
+
+  def testFindStaticStubForRequestWithNone(self):
+    self.assertRaises(ValueError, self.stubManager.findStaticStubForRequest, None)
+
+  def testFindStaticStubForRequestStopsAtOtherStubs(self):
+    stub1 = DefaultStub("id1", mock.Mock(), PathMatcher("/users/{id}"))
+    stub1.matchesRequest = mock.Mock(return_value=False)
+    stub2 = StaticStub("id2", PathMatcher("/users/{id}"))
+    self.stubManager.addStubs([stub1, stub2])
+
+    self.assertIsNone(self.stubManager.findStaticStubForRequest(self.request))
+    stub1.matchesRequest.assert_not_called()
+    self.assertEqual(self.stubManager.findStubForRequest(self.request), stub2)
+
+  def testFindStaticStubForRequestSkipsStaticStubsNotMatching(self):
+    stub1 = StaticStub("id1", MethodMatcher("POST"))
+    stub2 = StaticStub("id2", MethodMatcher("GET"))
+    self.stubManager.addStubs([stub1, stub2])
+
+    self.assertEqual(self.stubManager.findStaticStubForRequest(self.request), stub2)
+
+class TestReplaceStub (unittest.TestCase):
+  def setUp(self):
+    self.stubs = [Stub("id1"), Stub("id2"), Stub("id3")]
+    self.stubManager = StubManager()
+    self.stubManager.addStubs(self.stubs)
+
+  def testReplaceStubAtWithNewId(self):
+    stub = Stub("id4")
+
+    oldStub, (success, error) = self.stubManager.replaceStubAt(1, stub)
+
+    self.assertEqual(oldStub, self.stubs[1])
+    self.assertTrue(success)
+    self.assertTupleEqual(self.stubManager.getStubs(), (self.stubs[0], stub, self.stubs[2]))
+    self.assertFalse(self.stubManager.hasStub("id2"))
+    self.assertEqual(self.stubManager.findStubIndex("id4"), 1)
+
+  def testReplaceStubAtWithIdInUse(self):
+    oldStub, (success, error) = self.stubManager.replaceStubAt(1, Stub("id3"))
+
+    self.assertIsNone(oldStub)
+    self.assertFalse(success)
+    self.assertEqual(error, "New Stub ID id3 is already in use")
+
+  def testReplaceStubAtOutOfRange(self):
+    oldStub, (success, error) = self.stubManager.replaceStubAt(3, Stub("id4"))
+
+    self.assertIsNone(oldStub)
+    self.assertFalse(success)
+
+  def testReplaceStubWithSameId(self):
+    stub = Stub("id2")
+
+    oldStub, (success, error) = self.stubManager.replaceStub(self.stubs[1], stub)
+
+    self.assertEqual(oldStub, self.stubs[1])
+    self.assertTrue(success)
+    self.assertEqual(self.stubManager.findStub("id2"), stub)
+
+class TestBestMatch (unittest.TestCase):
+  def setUp(self):
+    self.renderCallable = mock.Mock()
+    self.anyUser = DefaultStub("anyUser", self.renderCallable, PathMatcher("/users/{id}"))
+    self.getUser = DefaultStub("getUser", self.renderCallable, MethodMatcher("GET"), PathMatcher("/users/{id}"))
+    self.me = DefaultStub("me", self.renderCallable, PathMatcher("/users/me"))
+    self.request = mock.NonCallableMock()
+    self.request.method = b"GET"
+    self.request.path = b"/users/me"
+
+  def testFindStubForRequestWithFirstMatch(self):
+    stubManager = StubManager()
+    stubManager.addStubs([self.anyUser, self.getUser, self.me])
+
+    self.assertIs(stubManager.findStubForRequest(self.request), self.anyUser)
+
+  def testFindStubForRequestPrefersLiteralSegments(self):
+    stubManager = StubManager(bestMatch=True)
+    stubManager.addStubs([self.anyUser, self.getUser, self.me])
+
+    self.assertIs(stubManager.findStubForRequest(self.request), self.me)
+
+  def testFindStubForRequestPrefersMoreMatchers(self):
+    stubManager = StubManager(bestMatch=True)
+    stubManager.addStubs([self.anyUser, self.getUser])
+
+    self.assertIs(stubManager.findStubForRequest(self.request), self.getUser)
+
+  def testFindStubForRequestPrefersPriority(self):
+    stubManager = StubManager(bestMatch=True)
+    prioritized = DefaultStub("prioritized", self.renderCallable, PathMatcher("/{path}"), priority=1)
+    stubManager.addStubs([self.me, prioritized])
+
+    self.assertIs(stubManager.findStubForRequest(self.request), prioritized)
+
+  def testFindStubForRequestPrefersFirstAddedAmongEquals(self):
+    stubManager = StubManager(bestMatch=True)
+    other = DefaultStub("other", self.renderCallable, PathMatcher("/users/{name}"))
+    stubManager.addStubs([self.anyUser, other])
+    stubManager.insertStub(0, DefaultStub("inserted", self.renderCallable, PathMatcher("/users/{x}")))
+
+    self.assertEqual(stubManager.findStubForRequest(self.request).id, "inserted")
+
+  def testFindStubForRequestAfterChanges(self):
+    stubManager = StubManager(bestMatch=True)
+    stubManager.addStubs([self.anyUser, self.me])
+
+    stubManager.removeStub("me")
+    self.assertIs(stubManager.findStubForRequest(self.request), self.anyUser)
+    stubManager.updateStubs(add=[self.getUser], replace=[DefaultStub("anyUser", self.renderCallable, PathMatcher("/users/me"))])
+    self.assertEqual(stubManager.findStubForRequest(self.request).id, "anyUser")
+    stubManager.removeAllStubs()
+    self.assertIsNone(stubManager.findStubForRequest(self.request))
+
+class TestGetRenderCacheStats (unittest.TestCase):
+  def testGetRenderCacheStatsOfDeterministicStubs(self):
+    stubManager = StubManager()
+    stubManager.addStubs([DefaultStub("cached", mock.Mock(), deterministic=True), DefaultStub("other", mock.Mock())])
+    stubManager.getStubs()[0].renderCache.get("key")
+
+    stats = stubManager.getRenderCacheStats()
+
+    self.assertListEqual(list(stats), ["cached"])
+    self.assertEqual(stats["cached"]["misses"], 1)
+
+class TestSnapshot (unittest.TestCase):
+  def testSnapshotIsUnchangedByLaterMutations(self):
+    stubs = [Stub("id1"), Stub("id2")]
+    stubManager = StubManager()
+    stubManager.addStubs(stubs)
+    snapshot = stubManager.getSnapshot()
+
+    stubManager.insertStub(0, Stub("id0"))
+    stubManager.removeStub("id2")
+    stubManager.removeAllStubs()
+
+    self.assertTupleEqual(snapshot.stubs, tuple(stubs))
+    self.assertDictEqual(snapshot.positions, {"id1": 0, "id2": 1})
+    self.assertListEqual(list(snapshot.iterCandidates(mock.NonCallableMock())), stubs)
+    self.assertTupleEqual(stubManager.getStubs(), ())
+
+  def testFindStubForRequestWhileStubsChange(self):
+    request = mock.NonCallableMock()
+    request.method = b"GET"
+    request.path = b"/users/1"
+    stubManager = StubManager()
+    stubManager.addStub(DefaultStub("stable", mock.Mock(), MethodMatcher("GET"), PathMatcher("/users/{id}")))
+    errors = []
+    stop = threading.Event()
+
+    def mutate():
+      try:
+        while not stop.is_set():
+          stubManager.insertStub(0, DefaultStub("moving", mock.Mock(), MethodMatcher("GET"), PathMatcher("/orders/{id}")))
+          stubManager.removeStub("moving")
+      except Exception as error:
+        errors.append(error)
+
+    writer = threading.Thread(target=mutate)
+    writer.start()
+    try:
+      for _ in range(2000):
+        self.assertEqual(stubManager.findStubForRequest(request).id, "stable")
+    finally:
+      stop.set()
+      writer.join()
+    self.assertListEqual(errors, [])
+
 if __name__ == "__main__":
   unittest.main()
\ No newline at end of file
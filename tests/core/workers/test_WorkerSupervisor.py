@@ -0,0 +1,71 @@
+import os
+import signal
+import sys
+import time
+import unittest
+from unittest import mock
+
+from mockwebserver.core.workers import WorkerSupervisor
+
+def serveUntilStopped(ready):
+  ready()
+  signal.signal(signal.SIGTERM, lambda signum, frame: os._exit(0))
+  while True:
+    time.sleep(1)
+
+def serveAndExit(ready):
+  ready()
+
+def failBeforeReady(ready):
+  raise RuntimeError("Could not listen")
+
+class TestRun (unittest.TestCase):
+  def setUp(self):
+    self.modules = mock.patch.dict(sys.modules)
+    self.modules.start()
+    sys.modules.pop("twisted.internet.reactor", None)
+
+  def tearDown(self):
+    self.modules.stop()
+
+  def testInitWithNoWorkers(self):
+    self.assertRaises(ValueError, WorkerSupervisor, 0, serveAndExit)
+
+  def testRunWithReactorAlreadyImported(self):
+    sys.modules["twisted.internet.reactor"] = mock.NonCallableMock()
+    supervisor = WorkerSupervisor(2, serveAndExit)
+
+    self.assertRaises(RuntimeError, supervisor.run)
+
+  def testRunStopsWorkersWhenOneExits(self):
+    supervisor = WorkerSupervisor(2, serveAndExit)
+
+    exitCodes = supervisor.run()
+
+    self.assertEqual(len(exitCodes), 2)
+    self.assertIn(0, exitCodes.values())
+    for exitCode in exitCodes.values():
+      self.assertIn(exitCode, (0, -signal.SIGTERM))
+
+  def testRunWithWorkerFailingToStart(self):
+    supervisor = WorkerSupervisor(2, failBeforeReady, startupTimeout=5.0)
+
+    with mock.patch("traceback.print_exc"):
+      exitCodes = supervisor.run()
+
+    self.assertListEqual(list(exitCodes.values()), [1, 1])
+
+  def testRunStopsWorkersGracefully(self):
+    supervisor = WorkerSupervisor(3, serveUntilStopped)
+    previousHandler = signal.signal(signal.SIGALRM, lambda signum, frame: supervisor.stop())
+    try:
+      signal.setitimer(signal.ITIMER_REAL, 0.5)
+      exitCodes = supervisor.run()
+    finally:
+      signal.setitimer(signal.ITIMER_REAL, 0)
+      signal.signal(signal.SIGALRM, previousHandler)
+
+    self.assertListEqual(list(exitCodes.values()), [0, 0, 0])
+
+if __name__ == "__main__":
+  unittest.main()
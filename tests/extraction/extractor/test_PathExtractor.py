@@ -231,5 +231,30 @@ class TestExtractData (unittest.TestCase):
     self.assertListEqual(extract.fixed, ["ing"])
     self.assertEqual(len(extract.named), 0)
 
+  def testExtractDataWithNamedPathVarPatternMatchingBytesPath(self):
+    testPattern = "/this/is/a/{var1}/path"
+    testRequest = mock.NonCallableMock()
+    testRequest.path = b"/this/is/a/test/path"
+
+    extractor = PathExtractor(testPattern)
+    extract = extractor.extractData(testRequest)
+
+    self.assertIsInstance(extract, Extract)
+    self.assertEqual(len(extract.fixed), 0)
+    self.assertDictEqual(extract.named, {"var1": "test"})
+
+  def testExtractDataNormalizesPathOncePerRequest(self):
+    testRequest = mock.NonCallableMock()
+    testRequest.path = b"/this/is/a/test/path"
+    extractor1 = PathExtractor("/this/is/a/{}/path")
+    extractor2 = PathExtractor("/this/is/{}")
+
+    self.assertIsInstance(extractor1.extractData(testRequest), Extract)
+    testRequest.path = b"/changed/after/first/extraction"
+    extract = extractor2.extractData(testRequest)
+
+    self.assertIsInstance(extract, Extract)
+    self.assertListEqual(extract.fixed, ["a/test/path"])
+
 if __name__ == "__main__":
   unittest.main()
\ No newline at end of file
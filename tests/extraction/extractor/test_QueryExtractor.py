@@ -0,0 +1,125 @@
+import time
+import unittest
+from unittest import mock
+
+from mockwebserver.extraction.extractor import Extract, QueryExtractor
+
+def createRequest(args):
+  request = mock.NonCallableMock()
+  request.args = args
+  return request
+
+class TestExtractData (unittest.TestCase):
+  def testExtractDataWithNullRequest(self):
+    extractor = QueryExtractor(True, ("page", "1"))
+
+    self.assertRaises(ValueError, extractor.extractData, None)
+
+  def testInitWithNoneValue(self):
+    self.assertRaises(ValueError, QueryExtractor, True, ("page", None))
+
+  def testLiteralParameters(self):
+    extractor = QueryExtractor(True, ("page", "1"), ("size", "20"))
+
+    extract = extractor.extractData(createRequest({b"size": [b"20"], b"page": [b"1"], b"sort": [b"name"]}))
+
+    self.assertIsInstance(extract, Extract)
+    self.assertListEqual(extract.fixed, [])
+    self.assertDictEqual(extract.named, {})
+
+  def testLiteralParameterWithDifferentValue(self):
+    extractor = QueryExtractor(True, ("page", "1"))
+
+    self.assertIsNone(extractor.extractData(createRequest({b"page": [b"2"]})))
+
+  def testMissingParameter(self):
+    extractor = QueryExtractor(True, ("page", "{page}"))
+
+    self.assertIsNone(extractor.extractData(createRequest({b"size": [b"20"]})))
+
+  def testFieldsInDeclaredOrder(self):
+    extractor = QueryExtractor(True, ("sort", "{}"), ("page", "{page:d}"), ("filter[{name}]", "{}"))
+
+    extract = extractor.extractData(createRequest({b"filter[owner]": [b"me"], b"page": [b"3"], b"sort": [b"name"]}))
+
+    self.assertListEqual(extract.fixed, ["name", "me"])
+    self.assertDictEqual(extract.named, {"page": 3, "name": "owner"})
+
+  def testNonStringValue(self):
+    extractor = QueryExtractor(True, ("page", 1))
+
+    self.assertIsInstance(extractor.extractData(createRequest({b"page": [b"1"]})), Extract)
+
+  def testMultipleValuesAreConsumedOnce(self):
+    extractor = QueryExtractor(True, ("id", "{first:d}"), ("id", "{second:d}"))
+
+    extract = extractor.extractData(createRequest({b"id": [b"1", b"2"]}))
+
+    self.assertDictEqual(extract.named, {"first": 1, "second": 2})
+    self.assertIsNone(extractor.extractData(createRequest({b"id": [b"1"], b"other": [b"2"]})))
+
+  def testLiteralValuesAreConsumedFirst(self):
+    # The field would take the literal value if it was matched first
+    extractor = QueryExtractor(True, ("tag", "{tag}"), ("tag", "new"))
+
+    extract = extractor.extractData(createRequest({b"tag": [b"new", b"sale"]}))
+
+    self.assertDictEqual(extract.named, {"tag": "sale"})
+
+  def testRepeatedKeyMatchesWhateverTheValueOrder(self):
+    # {} would take 1 if it was given it first, leaving {:d} nothing to match
+    extractor = QueryExtractor(True, ("a", "{}"), ("a", "{:d}"))
+
+    for values, fixed in (([b"1", b"x"], ["x", 1]), ([b"x", b"1"], ["x", 1])):
+      extract = extractor.extractData(createRequest({b"a": values}))
+
+      self.assertIsInstance(extract, Extract)
+      self.assertListEqual(extract.fixed, fixed)
+    self.assertIsNone(extractor.extractData(createRequest({b"a": [b"x", b"y"]})))
+
+  def testManyRepeatedValuesAreMatchedQuickly(self):
+    values = [b"x"] * 300
+    started = time.perf_counter()
+
+    # A pattern without any value of its own rejects the query straight away
+    extractor = QueryExtractor(True, ("a", "{}"), ("a", "{}"), ("a", "{}"), ("id{}", "{}"))
+    self.assertIsNone(extractor.extractData(createRequest({b"a": values})))
+    # Every pattern has values here, but only one of them is a number
+    extractor = QueryExtractor(True, ("a", "{}"), ("a", "{}"), ("a", "{}"), ("a", "{:d}"), ("a", "{:d}"))
+    self.assertIsNone(extractor.extractData(createRequest({b"a": values + [b"1"]})))
+    extract = extractor.extractData(createRequest({b"a": [b"1"] + values + [b"2"]}))
+
+    self.assertListEqual(extract.fixed, ["x", "x", "x", 1, 2])
+    self.assertLess(time.perf_counter() - started, 1.0)
+
+  def testExactMatching(self):
+    extractor = QueryExtractor(False, ("page", "{page}"))
+
+    self.assertIsInstance(extractor.extractData(createRequest({b"page": [b"1"]})), Extract)
+    self.assertIsNone(extractor.extractData(createRequest({b"page": [b"1"], b"size": [b"20"]})))
+    self.assertIsNone(extractor.extractData(createRequest({b"page": [b"1", b"2"]})))
+
+  def testExactMatchingWithoutParameters(self):
+    extractor = QueryExtractor(False)
+
+    self.assertIsInstance(extractor.extractData(createRequest({})), Extract)
+    self.assertIsNone(extractor.extractData(createRequest({b"page": [b"1"]})))
+
+  def testTextArguments(self):
+    extractor = QueryExtractor(True, ("q", "{query}"))
+
+    extract = extractor.extractData(createRequest({"q": ["café"]}))
+
+    self.assertDictEqual(extract.named, {"query": "café"})
+
+  def testQueryIsDecodedOncePerRequest(self):
+    request = createRequest({b"page": [b"1"]})
+
+    QueryExtractor(True, ("page", "{page}")).extractData(request)
+    request.args = {b"page": [b"2"]}
+    extract = QueryExtractor(True, ("page", "{number}")).extractData(request)
+
+    self.assertDictEqual(extract.named, {"number": "1"})
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,98 @@
+import io
+import tempfile
+import unittest
+from unittest import mock
+
+from mockwebserver.extraction.cache import getRequestCache, closeRequestCache
+from mockwebserver.matching.body import BodyRegexMatcher, BodyContainsMatcher, BodyExcludesMatcher
+
+def createRequest(content):
+  request = mock.NonCallableMock()
+  request.content = io.BytesIO(content) if isinstance(content, bytes) else content
+  return request
+
+class TestBodyRegexMatcher (unittest.TestCase):
+  def testInitWithNoPattern(self):
+    self.assertRaises(ValueError, BodyRegexMatcher, None)
+
+  def testMatchesRequest(self):
+    matcher = BodyRegexMatcher(r"\"amount\":\s*\d+")
+
+    self.assertTrue(matcher.matchesRequest(createRequest(b"{\"amount\": 12}")))
+    self.assertFalse(matcher.matchesRequest(createRequest(b"{\"amount\": \"12\"}")))
+
+  def testMatchesRequestWithFullMatch(self):
+    matcher = BodyRegexMatcher(r"ping", fullMatch=True)
+
+    self.assertTrue(matcher.matchesRequest(createRequest(b"ping")))
+    self.assertFalse(matcher.matchesRequest(createRequest(b"ping pong")))
+
+  def testMatchesRequestWithNonAsciiPattern(self):
+    matcher = BodyRegexMatcher("caf[ée]")
+
+    self.assertTrue(matcher.matchesRequest(createRequest("un café".encode("utf-8"))))
+
+  def testMatchesRequestWithoutContent(self):
+    request = mock.NonCallableMock()
+    request.content = None
+
+    self.assertTrue(BodyRegexMatcher(r"^$").matchesRequest(request))
+
+  def testMatchesRequestWithSpooledBody(self):
+    # Twisted spools large bodies to a temporary file, which is mapped
+    content = tempfile.TemporaryFile()
+    content.write(b"x" * 200000 + b"needle")
+    content.seek(10)
+    request = createRequest(content)
+
+    self.assertTrue(BodyRegexMatcher(r"need+le$").matchesRequest(request))
+    self.assertTrue(BodyContainsMatcher("needle").matchesRequest(request))
+    self.assertEqual(content.tell(), 10)
+    content.close()
+
+  def testSpooledBodyIsUnmappedOnceFinished(self):
+    content = tempfile.TemporaryFile()
+    content.write(b"x" * 200000 + b"needle")
+    request = createRequest(content)
+    BodyContainsMatcher("needle").matchesRequest(request)
+    body = getRequestCache(request).getBody()
+
+    self.assertIsNone(closeRequestCache(None, request))
+    self.assertTrue(body.closed)
+    self.assertIsNot(getRequestCache(request).getBody(), body)
+    closeRequestCache(None, request)
+    content.close()
+
+class TestBodyContainsMatcher (unittest.TestCase):
+  def testMatchesRequest(self):
+    request = createRequest(b"{\"status\": \"active\"}")
+
+    self.assertTrue(BodyContainsMatcher("active").matchesRequest(request))
+    self.assertFalse(BodyContainsMatcher("inactive").matchesRequest(request))
+
+  def testBodyIsReadOncePerRequest(self):
+    request = createRequest(b"first")
+    BodyContainsMatcher("first").matchesRequest(request)
+    request.content = io.BytesIO(b"second")
+
+    self.assertTrue(BodyContainsMatcher("first").matchesRequest(request))
+    self.assertIs(getRequestCache(request).getBody(), getRequestCache(request).getBody())
+
+  def testBodyIsReadWithoutMovingStream(self):
+    request = createRequest(b"abc")
+    request.content.seek(2)
+
+    BodyContainsMatcher("a").matchesRequest(request)
+
+    self.assertEqual(request.content.read(), b"c")
+
+class TestBodyExcludesMatcher (unittest.TestCase):
+  def testMatchesRequest(self):
+    request = createRequest(b"{\"status\": \"active\"}")
+
+    self.assertFalse(BodyExcludesMatcher("active").matchesRequest(request))
+    self.assertTrue(BodyExcludesMatcher("deleted").matchesRequest(request))
+    self.assertNotEqual(BodyExcludesMatcher("a").getId(), BodyContainsMatcher("a").getId())
+
+if __name__ == "__main__":
+  unittest.main()
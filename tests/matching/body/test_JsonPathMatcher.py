@@ -0,0 +1,65 @@
+import io
+import json
+import unittest
+from unittest import mock
+
+from mockwebserver.matching.body import JsonPathMatcher, parseJsonPath
+
+def createRequest(content):
+  request = mock.NonCallableMock()
+  request.content = io.BytesIO(content)
+  return request
+
+body = b"{\"user\": {\"id\": 42, \"active\": true, \"first name\": \"Ada\"}, \"items\": [{\"sku\": \"a\"}, {\"sku\": \"b\"}]}"
+
+class TestParseJsonPath (unittest.TestCase):
+  def testParseJsonPath(self):
+    steps = parseJsonPath("$.items[0]['first name'][*].*[-1]")
+
+    self.assertTupleEqual(steps, (("key", "items"), ("index", 0), ("key", "first name"), ("all", None), ("all", None), ("index", -1)))
+
+  def testParseInvalidJsonPath(self):
+    self.assertRaises(ValueError, parseJsonPath, "items")
+    self.assertRaises(ValueError, parseJsonPath, "$.items[")
+
+class TestJsonPathMatcher (unittest.TestCase):
+  def testMatchesRequestWithPresence(self):
+    request = createRequest(body)
+
+    self.assertTrue(JsonPathMatcher("$.user.id").matchesRequest(request))
+    self.assertFalse(JsonPathMatcher("$.user.email").matchesRequest(request))
+    self.assertFalse(JsonPathMatcher("$.items[2]").matchesRequest(request))
+
+  def testMatchesRequestWithValue(self):
+    request = createRequest(body)
+
+    self.assertTrue(JsonPathMatcher("$.user['first name']", "Ada").matchesRequest(request))
+    self.assertTrue(JsonPathMatcher("$.items[-1].sku", "b").matchesRequest(request))
+    self.assertFalse(JsonPathMatcher("$.user.id", 41).matchesRequest(request))
+
+  def testMatchesRequestWithWildcard(self):
+    request = createRequest(body)
+
+    self.assertTrue(JsonPathMatcher("$.items[*].sku", "b").matchesRequest(request))
+    self.assertFalse(JsonPathMatcher("$.items[*].sku", "c").matchesRequest(request))
+
+  def testBooleansAreNotNumbers(self):
+    request = createRequest(body)
+
+    self.assertTrue(JsonPathMatcher("$.user.active", True).matchesRequest(request))
+    self.assertFalse(JsonPathMatcher("$.user.active", 1).matchesRequest(request))
+
+  def testMatchesRequestWithInvalidJson(self):
+    self.assertFalse(JsonPathMatcher("$").matchesRequest(createRequest(b"{\"user\":")))
+
+  def testJsonIsParsedOncePerRequest(self):
+    request = createRequest(body)
+
+    with mock.patch("json.loads", wraps=json.loads) as loads:
+      for path in ("$.user.id", "$.items", "$.user.active"):
+        JsonPathMatcher(path).matchesRequest(request)
+
+    loads.assert_called_once()
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from unittest import mock
+
+from twisted.web.http_headers import Headers as Tw_Headers
+
+from mockwebserver.matching.header import AcceptMatcher
+
+def createRequest(*accept):
+  request = mock.NonCallableMock()
+  request.requestHeaders = Tw_Headers({b"accept": list(accept)} if len(accept) > 0 else {})
+  return request
+
+class TestAcceptMatcher (unittest.TestCase):
+  def testInitWithRange(self):
+    self.assertRaises(ValueError, AcceptMatcher, "application/*")
+
+  def testInitWithInvalidQuality(self):
+    self.assertRaises(ValueError, AcceptMatcher, "application/json", 0)
+
+  def testWithoutAcceptHeader(self):
+    self.assertEqual(AcceptMatcher("application/json").getQuality(createRequest()), 1.0)
+
+  def testMostSpecificRangeDecides(self):
+    request = createRequest(b"text/*;q=0.3, text/html;q=0.7, text/html;level=1, */*;q=0.5")
+
+    self.assertEqual(AcceptMatcher("text/html; level=1").getQuality(request), 1.0)
+    self.assertEqual(AcceptMatcher("text/html").getQuality(request), 0.7)
+    self.assertEqual(AcceptMatcher("text/plain").getQuality(request), 0.3)
+    self.assertEqual(AcceptMatcher("image/png").getQuality(request), 0.5)
+
+  def testMatchesRequest(self):
+    matcher = AcceptMatcher("application/json")
+
+    self.assertTrue(matcher.matchesRequest(createRequest(b"application/json")))
+    self.assertTrue(matcher.matchesRequest(createRequest(b"text/html", b"application/*;q=0.1")))
+    self.assertFalse(matcher.matchesRequest(createRequest(b"text/html")))
+    self.assertFalse(matcher.matchesRequest(createRequest(b"*/*, application/json;q=0")))
+
+  def testMatchesRequestWithMinimumQuality(self):
+    matcher = AcceptMatcher("application/xml", minimumQuality=0.5)
+
+    self.assertTrue(matcher.matchesRequest(createRequest(b"application/xml;q=0.5")))
+    self.assertFalse(matcher.matchesRequest(createRequest(b"application/xml;q=0.4")))
+
+  def testInvalidRangesAreIgnored(self):
+    matcher = AcceptMatcher("application/json")
+
+    self.assertTrue(matcher.matchesRequest(createRequest(b"garbage, application/json;q=x, */*")))
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+from unittest import mock
+
+from twisted.web.http_headers import Headers as Tw_Headers
+
+from mockwebserver.extraction.cache import getRequestCache
+from mockwebserver.matching.header import ContentTypeMatcher, contentTypeEssence, parseMediaType
+
+def createRequest(contentType):
+  request = mock.NonCallableMock()
+  request.requestHeaders = Tw_Headers({b"content-type": [contentType]} if contentType != None else {})
+  return request
+
+class TestParseMediaType (unittest.TestCase):
+  def testParseMediaType(self):
+    mediaType = parseMediaType(b"Text/HTML; Charset=\"UTF-8\"; level=1")
+
+    self.assertTupleEqual(mediaType, (b"text", b"html", {b"charset": b"utf-8", b"level": b"1"}))
+
+  def testParseInvalidMediaType(self):
+    self.assertIsNone(parseMediaType(b"json"))
+    self.assertIsNone(parseMediaType(b"/json"))
+
+class TestContentTypeMatcher (unittest.TestCase):
+  def testInitWithInvalidMediaType(self):
+    self.assertRaises(ValueError, ContentTypeMatcher, "json")
+
+  def testMatchesRequest(self):
+    matcher = ContentTypeMatcher("application/json")
+
+    self.assertTrue(matcher.matchesRequest(createRequest(b"application/json")))
+    self.assertTrue(matcher.matchesRequest(createRequest(b"Application/JSON; charset=utf-8")))
+    self.assertFalse(matcher.matchesRequest(createRequest(b"application/xml")))
+    self.assertFalse(matcher.matchesRequest(createRequest(None)))
+
+  def testMatchesRequestWithWildcard(self):
+    matcher = ContentTypeMatcher("text/*")
+
+    self.assertTrue(matcher.matchesRequest(createRequest(b"text/csv")))
+    self.assertFalse(matcher.matchesRequest(createRequest(b"application/csv")))
+
+  def testMatchesRequestWithParameters(self):
+    matcher = ContentTypeMatcher("text/plain; charset=UTF-8")
+
+    self.assertTrue(matcher.matchesRequest(createRequest(b"text/plain;charset=utf-8")))
+    self.assertFalse(matcher.matchesRequest(createRequest(b"text/plain; charset=latin-1")))
+    self.assertFalse(matcher.matchesRequest(createRequest(b"text/plain")))
+
+  def testRoutingGuard(self):
+    function, argument, value = ContentTypeMatcher("application/json; charset=utf-8").routingGuard
+    request = createRequest(b"application/JSON; charset=utf-8")
+
+    self.assertEqual(value, b"application/json")
+    self.assertIs(function, contentTypeEssence)
+    self.assertListEqual(function(getRequestCache(request), argument), [b"application/json"])
+    self.assertIsNone(ContentTypeMatcher("application/*").routingGuard)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+from unittest import mock
+
+from twisted.web.http_headers import Headers as Tw_Headers
+
+from mockwebserver.matching.header import CookieMatcher
+
+def createRequest(*cookies):
+  request = mock.NonCallableMock()
+  request.requestHeaders = Tw_Headers({b"cookie": list(cookies)} if len(cookies) > 0 else {})
+  return request
+
+class TestCookieMatcher (unittest.TestCase):
+  def testInitWithNoName(self):
+    self.assertRaises(ValueError, CookieMatcher, None)
+
+  def testMatchesRequestWithValue(self):
+    matcher = CookieMatcher("session", "abc")
+
+    self.assertTrue(matcher.matchesRequest(createRequest(b"theme=dark; session=abc")))
+    self.assertFalse(matcher.matchesRequest(createRequest(b"session=abcd")))
+    self.assertFalse(matcher.matchesRequest(createRequest()))
+
+  def testMatchesRequestWithPresence(self):
+    matcher = CookieMatcher("session")
+
+    self.assertTrue(matcher.matchesRequest(createRequest(b"theme=dark", b"session=")))
+    self.assertFalse(matcher.matchesRequest(createRequest(b"Session=abc")))
+
+  def testFirstCookieOfNameIsUsed(self):
+    matcher = CookieMatcher("session", "abc")
+
+    self.assertTrue(matcher.matchesRequest(createRequest(b"session=abc; session=other")))
+    self.assertFalse(matcher.matchesRequest(createRequest(b"session=other; session=abc")))
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from unittest import mock
+
+from twisted.web.http_headers import Headers as Tw_Headers
+
+from mockwebserver.matching.header import HeaderMatcher, HeaderPatternMatcher, headerValues
+
+def createRequest(headers):
+  request = mock.NonCallableMock()
+  request.requestHeaders = Tw_Headers(headers)
+  return request
+
+class TestHeaderMatcher (unittest.TestCase):
+  def testInitWithNoValue(self):
+    self.assertRaises(ValueError, HeaderMatcher, "X-Mode", None)
+
+  def testMatchesRequestIgnoresNameCase(self):
+    matcher = HeaderMatcher("X-Mode", "fast")
+
+    self.assertTrue(matcher.matchesRequest(createRequest({b"x-mode": [b"fast"]})))
+    self.assertTrue(matcher.matchesRequest(createRequest({b"X-MODE": [b"fast"]})))
+
+  def testMatchesRequestComparesValueExactly(self):
+    matcher = HeaderMatcher("X-Mode", "fast")
+
+    self.assertFalse(matcher.matchesRequest(createRequest({b"x-mode": [b"Fast"]})))
+    self.assertFalse(matcher.matchesRequest(createRequest({})))
+
+  def testMatchesRequestWithAnyValue(self):
+    matcher = HeaderMatcher("X-Mode", "fast")
+
+    self.assertTrue(matcher.matchesRequest(createRequest({b"x-mode": [b"slow", b"fast"]})))
+
+  def testRoutingGuard(self):
+    function, argument, value = HeaderMatcher("X-Mode", "fast").routingGuard
+
+    self.assertIs(function, headerValues)
+    self.assertEqual(argument, b"x-mode")
+    self.assertEqual(value, b"fast")
+
+class TestHeaderPatternMatcher (unittest.TestCase):
+  def testMatchesRequest(self):
+    matcher = HeaderPatternMatcher("Authorization", r"Bearer [A-Za-z0-9.]+")
+
+    self.assertTrue(matcher.matchesRequest(createRequest({b"authorization": [b"Bearer abc.def"]})))
+    self.assertFalse(matcher.matchesRequest(createRequest({b"authorization": [b"Basic abc"]})))
+    self.assertFalse(matcher.matchesRequest(createRequest({})))
+
+  def testMatchesRequestWithWholeValueOnly(self):
+    matcher = HeaderPatternMatcher("X-Version", r"\d+")
+
+    self.assertFalse(matcher.matchesRequest(createRequest({b"x-version": [b"12a"]})))
+
+  def testHeadersAreDecodedOncePerRequest(self):
+    request = createRequest({b"x-version": [b"1"]})
+    HeaderPatternMatcher("X-Version", r"\d+").matchesRequest(request)
+    request.requestHeaders = Tw_Headers({b"x-version": [b"x"]})
+
+    self.assertTrue(HeaderPatternMatcher("X-Version", r"1").matchesRequest(request))
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+from unittest import mock
+
+from twisted.web.http_headers import Headers as Tw_Headers
+
+from mockwebserver.matching.header import HeaderMatcher
+from mockwebserver.matching.logic import AndMatcher, OrMatcher, NotMatcher
+from mockwebserver.matching.matcher import MethodMatcher, PathMatcher
+
+def createRequest(method, path, headers={}):
+  request = mock.NonCallableMock()
+  request.method = method
+  request.path = path
+  request.requestHeaders = Tw_Headers({name: [value] for name, value in headers.items()})
+  return request
+
+class TestAndMatcher (unittest.TestCase):
+  def testInitWithNoMatchers(self):
+    self.assertRaises(ValueError, AndMatcher)
+
+  def testMatchesRequest(self):
+    matcher = AndMatcher(PathMatcher("/users"), MethodMatcher("GET"))
+
+    self.assertTrue(matcher.matchesRequest(createRequest(b"GET", b"/users")))
+    self.assertFalse(matcher.matchesRequest(createRequest(b"POST", b"/users")))
+
+  def testCostIsTheSumOfItsMatchers(self):
+    self.assertEqual(AndMatcher(PathMatcher("/"), MethodMatcher("GET")).cost, PathMatcher.cost + MethodMatcher.cost)
+
+  def testRoutingGuardOfAnyMatcher(self):
+    header = HeaderMatcher("X-Mode", "fast")
+
+    self.assertEqual(AndMatcher(PathMatcher("/"), header).routingGuard, header.routingGuard)
+    self.assertIsNone(AndMatcher(PathMatcher("/")).routingGuard)
+
+  def testGetId(self):
+    self.assertEqual(AndMatcher(MethodMatcher("GET"), PathMatcher("/")).getId(), "AND(METHOD GET, PATH '/')")
+
+class TestOrMatcher (unittest.TestCase):
+  def testMatchesRequest(self):
+    matcher = OrMatcher(MethodMatcher("GET"), MethodMatcher("HEAD"))
+
+    self.assertTrue(matcher.matchesRequest(createRequest(b"HEAD", b"/")))
+    self.assertFalse(matcher.matchesRequest(createRequest(b"POST", b"/")))
+
+  def testHasNoRoutingGuard(self):
+    self.assertIsNone(getattr(OrMatcher(HeaderMatcher("X-Mode", "fast")), "routingGuard", None))
+
+class TestNotMatcher (unittest.TestCase):
+  def testMatchesRequest(self):
+    matcher = NotMatcher(HeaderMatcher("X-Mode", "fast"))
+
+    self.assertFalse(matcher.matchesRequest(createRequest(b"GET", b"/", {b"x-mode": b"fast"})))
+    self.assertTrue(matcher.matchesRequest(createRequest(b"GET", b"/")))
+
+if __name__ == "__main__":
+  unittest.main()
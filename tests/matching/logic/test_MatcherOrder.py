@@ -0,0 +1,77 @@
+import unittest
+from unittest import mock
+
+from mockwebserver.matching.logic import MatcherOrder
+from mockwebserver.matching.matcher import Matcher
+
+def createMatcher(cost, result):
+  matcher = Matcher(None)
+  matcher.cost = cost
+  matcher.matchesRequest = mock.Mock(return_value=result)
+  return matcher
+
+class TestMatcherOrder (unittest.TestCase):
+  def testInitWithInvalidMatcher(self):
+    self.assertRaises(ValueError, MatcherOrder, [object()])
+
+  def testOrderByCost(self):
+    expensive = createMatcher(50.0, True)
+    cheap = createMatcher(1.0, True)
+    medium = createMatcher(10.0, True)
+
+    order = MatcherOrder([expensive, cheap, medium])
+
+    self.assertListEqual(order.getOrder(), [cheap, medium, expensive])
+    self.assertListEqual(order.matchers, [expensive, cheap, medium])
+
+  def testTotalCost(self):
+    invalid = createMatcher(None, True)
+
+    order = MatcherOrder([createMatcher(50.0, True), createMatcher(1, True), invalid])
+
+    self.assertEqual(order.totalCost, 51.0 + Matcher.cost)
+
+  def testOrderKeepsDeclaredOrderOnTies(self):
+    matchers = [createMatcher(10.0, True) for _ in range(3)]
+
+    self.assertListEqual(MatcherOrder(matchers).getOrder(), matchers)
+
+  def testEvaluateConjunctionStopsAtFirstMiss(self):
+    miss = createMatcher(1.0, False)
+    other = createMatcher(10.0, True)
+
+    self.assertFalse(MatcherOrder([other, miss]).evaluate(None))
+    other.matchesRequest.assert_not_called()
+
+  def testEvaluateDisjunctionStopsAtFirstMatch(self):
+    match = createMatcher(1.0, True)
+    other = createMatcher(10.0, False)
+
+    self.assertTrue(MatcherOrder([other, match], conjunction=False).evaluate(None))
+    other.matchesRequest.assert_not_called()
+
+  def testEvaluateReordersBySelectivity(self):
+    # The cheap matcher almost always passes, so the dearer one deciding the
+    # outcome is worth evaluating first
+    cheap = createMatcher(2.0, True)
+    selective = createMatcher(4.0, False)
+    order = MatcherOrder([cheap, selective])
+    self.assertListEqual(order.getOrder(), [cheap, selective])
+
+    for _ in range(MatcherOrder.refreshInterval + 1):
+      order.evaluate(None)
+
+    self.assertListEqual(order.getOrder(), [selective, cheap])
+
+  def testEvaluateWithoutAdaptation(self):
+    cheap = createMatcher(2.0, True)
+    selective = createMatcher(4.0, False)
+    order = MatcherOrder([cheap, selective], adaptive=False)
+
+    for _ in range(MatcherOrder.refreshInterval + 1):
+      order.evaluate(None)
+
+    self.assertListEqual(order.getOrder(), [cheap, selective])
+
+if __name__ == "__main__":
+  unittest.main()
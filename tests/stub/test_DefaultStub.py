@@ -169,4 +169,63 @@ class TestMatchesRequest (unittest.TestCase):
     matches = stub.matchesRequest(request)
 
     self.assertFalse(matches)
-    self.matcher1.matchesRequest.assert_called_once_with(request)
\ No newline at end of file
+    self.matcher1.matchesRequest.assert_called_once_with(request)
+
+  def testMatchesRequestEvaluatesCheapestMatcherFirst(self):
+    request = mock.NonCallableMock()
+    self.matcher1.cost = 50.0
+    self.matcher2.cost = 1.0
+    stub = DefaultStub(self.stubId, self.renderCallable, self.matcher1, self.matcher2)
+
+    self.assertFalse(stub.matchesRequest(request))
+    self.matcher1.matchesRequest.assert_not_called()
+    self.assertListEqual(stub.matchers, [self.matcher1, self.matcher2])
+
+  def testMatchesRequestWithoutOrdering(self):
+    request = mock.NonCallableMock()
+    self.matcher1.cost = 50.0
+    self.matcher2.cost = 1.0
+    stub = DefaultStub(self.stubId, self.renderCallable, self.matcher1, self.matcher2, orderMatchers=False)
+
+    self.assertFalse(stub.matchesRequest(request))
+    self.matcher1.matchesRequest.assert_called_once_with(request)
+    self.matcher2.matchesRequest.assert_not_called()
+
+class TestMatchAndExtractData (unittest.TestCase):
+  def setUp(self):
+    self.request = mock.NonCallableMock()
+    self.request.method = b"GET"
+    self.request.path = b"/users/42"
+
+  def testMatchAndExtractDataWithNoRequest(self):
+    stub = DefaultStub("defaultStub", mock.Mock(), PathMatcher("/users/{id}"))
+
+    self.assertRaises(ValueError, stub.matchAndExtractData, None)
+
+  def testMatchAndExtractDataWithMatchingRequest(self):
+    stub = DefaultStub("defaultStub", mock.Mock(), PathMatcher("/users/{id}"), PathExtractor("/users/{id}"))
+
+    matches, data = stub.matchAndExtractData(self.request)
+
+    self.assertTrue(matches)
+    self.assertListEqual(list(data.keys()), ["PATH '/users/{id}'"])
+    self.assertDictEqual(data["PATH '/users/{id}'"].named, {"id": "42"})
+
+  def testMatchAndExtractDataWithNonMatchingRequest(self):
+    stub = DefaultStub("defaultStub", mock.Mock(), PathMatcher("/orders/{id}"), PathExtractor("/orders/{id}"))
+
+    matches, data = stub.matchAndExtractData(self.request)
+
+    self.assertFalse(matches)
+    self.assertIsNone(data)
+
+  def testMatchAndExtractDataEvaluatesSharedPatternOnce(self):
+    extractor = PathExtractor("/users/{id}")
+    stub1 = DefaultStub("stub1", mock.Mock(), PathMatcher("/users/{id}"), extractor)
+    stub2 = DefaultStub("stub2", mock.Mock(), PathMatcher("/users/{id}"), extractor)
+
+    with mock.patch.object(PathExtractor, "extractData", autospec=True, side_effect=PathExtractor.extractData) as mockExtractData:
+      stub1.matchAndExtractData(self.request)
+      stub2.matchAndExtractData(self.request)
+
+      mockExtractData.assert_called_once()
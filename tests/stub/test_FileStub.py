@@ -0,0 +1,98 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from mockwebserver.core.streaming import isStream
+from mockwebserver.stub import FileStub
+from mockwebserver.matching.matcher import MethodMatcher, PathMatcher
+
+class TestFileStub (unittest.TestCase):
+  def setUp(self):
+    self.content = bytes(range(256)) * 4
+    descriptor, self.path = tempfile.mkstemp()
+    with os.fdopen(descriptor, "wb") as file:
+      file.write(self.content)
+    self.stub = FileStub("fileStub", self.path, PathMatcher("/file"), headers={b"Content-Type": b"text/plain"}, chunkSize=256)
+    self.request = mock.NonCallableMock()
+    self.request.method = b"GET"
+    self.request.path = b"/file"
+    self.request.getHeader = mock.Mock(return_value=None)
+
+  def tearDown(self):
+    self.stub.close()
+    os.remove(self.path)
+
+  def render(self, rangeHeader=None):
+    self.request.getHeader.return_value = rangeHeader
+    return self.stub.render(self.request, self.stub.extractData(self.request))
+
+  def testInitWithNoId(self):
+    self.assertRaises(ValueError, FileStub, None, self.path)
+
+  def testInitWithInvalidChunkSize(self):
+    self.assertRaises(ValueError, FileStub, "fileStub", self.path, chunkSize=0)
+
+  def testMatchesRequest(self):
+    otherRequest = mock.NonCallableMock()
+    otherRequest.path = b"/other"
+
+    self.assertTrue(self.stub.matchesRequest(self.request))
+    self.assertFalse(self.stub.matchesRequest(otherRequest))
+
+  def testMatchesRequestEvaluatesCheapestMatcherFirst(self):
+    expensive = mock.NonCallableMock(PathMatcher)
+    expensive.cost = 50.0
+    stub = FileStub("fileStub", self.path, expensive, MethodMatcher("POST"))
+
+    self.assertFalse(stub.matchesRequest(self.request))
+    expensive.matchesRequest.assert_not_called()
+    stub.close()
+
+  def testRenderWholeFile(self):
+    response = self.render()
+
+    self.assertEqual(response.code, 200)
+    self.assertTrue(isStream(response.body))
+    self.assertEqual(b"".join(response.body), self.content)
+    self.assertEqual(response.headers[b"content-length"], b"1024")
+    self.assertEqual(response.headers[b"accept-ranges"], b"bytes")
+    self.assertEqual(response.headers[b"content-type"], b"text/plain")
+
+  def testRenderRange(self):
+    response = self.render(b"bytes=10-19")
+
+    self.assertEqual(response.code, 206)
+    self.assertEqual(response.body, self.content[10:20])
+    self.assertEqual(response.headers[b"content-range"], b"bytes 10-19/1024")
+    self.assertEqual(response.headers[b"content-length"], b"10")
+    self.request.getHeader.assert_called_with(b"range")
+
+  def testRenderUnsatisfiableRange(self):
+    response = self.render(b"bytes=2000-")
+
+    self.assertEqual(response.code, 416)
+    self.assertEqual(response.body, b"")
+    self.assertEqual(response.headers[b"content-range"], b"bytes */1024")
+
+  def testRenderHead(self):
+    self.request.method = b"HEAD"
+
+    response = self.render()
+
+    self.assertListEqual(list(response.body), [])
+    self.assertEqual(response.headers[b"content-length"], b"1024")
+
+  def testRenderIgnoresRangeForOtherCodes(self):
+    stub = FileStub("fileStub", self.path, code=404)
+
+    self.request.getHeader.return_value = b"bytes=0-9"
+    response = stub.render(self.request, {})
+
+    self.assertEqual(response.code, 404)
+    self.assertEqual(response.body, self.content)
+    self.assertNotIn(b"accept-ranges", response.headers)
+    stub.close()
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+from unittest import mock
+
+from mockwebserver.core.execution import ExecutionPolicy
+from mockwebserver.stub import StaticStub, Response
+from mockwebserver.matching.matcher import MethodMatcher, PathMatcher
+
+class TestInit (unittest.TestCase):
+  def testInit(self):
+    matcher = PathMatcher("/my/static/stub")
+
+    stub = StaticStub("staticStub", matcher, code=201, headers={b"Content-Type": b"text/plain"}, body=b"created")
+
+    self.assertEqual(stub.id, "staticStub")
+    self.assertListEqual(stub.matchers, [matcher])
+    self.assertEqual(stub.executionPolicy, ExecutionPolicy.INLINE)
+    self.assertEqual(stub.response.code, 201)
+    self.assertDictEqual(stub.response.headers, {b"content-type": b"text/plain", b"content-length": b"7"})
+
+  def testInitWithNoId(self):
+    self.assertRaises(ValueError, StaticStub, None)
+
+  def testInitWithInvalidMatcher(self):
+    self.assertRaises(ValueError, StaticStub, "staticStub", mock.NonCallableMock())
+
+  def testInitWithInvalidBody(self):
+    self.assertRaises(ValueError, StaticStub, "staticStub", body="not bytes")
+
+class TestEncoding (unittest.TestCase):
+  def testEncoded(self):
+    stub = StaticStub("staticStub", headers={b"Content-Type": b"text/plain"}, body=b"hello")
+
+    self.assertEqual(
+      stub.encoded,
+      b"HTTP/1.1 200 OK\r\ncontent-type: text/plain\r\ncontent-length: 5\r\n\r\nhello"
+    )
+
+  def testEncodedWithRepeatedHeader(self):
+    stub = StaticStub("staticStub", code=404, headers={b"Set-Cookie": [b"a=1", b"b=2"]})
+
+    self.assertEqual(
+      stub.encoded,
+      b"HTTP/1.1 404 Not Found\r\nset-cookie: a=1\r\nset-cookie: b=2\r\ncontent-length: 0\r\n\r\n"
+    )
+
+  def testEncodedWithUnknownStatus(self):
+    stub = StaticStub("staticStub", code=599)
+
+    self.assertTrue(stub.encoded.startswith(b"HTTP/1.1 599 Unknown Status\r\n"))
+
+class TestMatchAndRender (unittest.TestCase):
+  def setUp(self):
+    self.stub = StaticStub("staticStub", MethodMatcher("GET"), PathMatcher("/static"), body=b"hello")
+    self.request = mock.NonCallableMock()
+    self.request.method = b"GET"
+    self.request.path = b"/static"
+
+  def testMatchesRequest(self):
+    self.assertTrue(self.stub.matchesRequest(self.request))
+
+  def testMatchesRequestWithOtherPath(self):
+    self.request.path = b"/other"
+
+    self.assertFalse(self.stub.matchesRequest(self.request))
+
+  def testMatchesRequestWithNone(self):
+    self.assertRaises(ValueError, self.stub.matchesRequest, None)
+
+  def testMatchesRequestEvaluatesCheapestMatcherFirst(self):
+    expensive = mock.NonCallableMock(PathMatcher)
+    expensive.cost = 50.0
+    stub = StaticStub("staticStub", expensive, MethodMatcher("POST"))
+
+    self.assertFalse(stub.matchesRequest(self.request))
+    expensive.matchesRequest.assert_not_called()
+
+  def testRender(self):
+    response = self.stub.render(self.request, self.stub.extractData(self.request))
+
+    self.assertIsInstance(response, Response)
+    self.assertIs(response, self.stub.response)
+    self.assertEqual(response.body, b"hello")
+
+if __name__ == "__main__":
+  unittest.main()